@@ -50,12 +50,14 @@ void frequencyToRGB(float freq, uint8_t &r, uint8_t &g, uint8_t &b) {
 
 void setFrequency(float freqHz) {
   if (freqHz <= 0) freqHz = 1.0;
-  shiftInterval1 = (unsigned long)(500.0 / freqHz);  // 1000 / (2*f)
+  // Half-period in microseconds; whole milliseconds drift several ms per
+  // second at higher rates, which breaks phase sync
+  shiftInterval1 = (unsigned long)(500000.0 / freqHz);  // 1000000 / (2*f)
   Serial.print("Updated frequency to: ");
   Serial.print(freqHz);
   Serial.print(" Hz (interval = ");
   Serial.print(shiftInterval1);
-  Serial.println(" ms)");
+  Serial.println(" us)");
 }
 
 void setup() {
@@ -67,7 +69,7 @@ void setup() {
   ledChip.Enable();
 
   setFrequency(freq);
-  nextToggle1 = millis() + shiftInterval1;
+  nextToggle1 = micros() + shiftInterval1;
 
   Serial.println("-- Setup Complete --");
 }
@@ -79,18 +81,37 @@ void loop() {
     Serial.print("Received from GENX320: ");
     Serial.println(data);
 
-    float incomingFreq = data.toFloat();
-    if (incomingFreq > 0 && incomingFreq != prevFreq) {
-      freq = incomingFreq;
-      prevFreq = freq;
-      setFrequency(freq);
-      nextToggle1 = millis() + shiftInterval1;
+    if (data.startsWith("P")) {
+      // Phase sync: "P<ms>" puts the next rising edge <ms> from now
+      float delayMs = data.substring(1).toFloat();
+      if (delayMs >= 0) {
+        if (ledState1) {
+          ledState1 = false;
+          ledChip.SetChannelPWM(RED_CH, 0);
+          ledChip.SetChannelPWM(GREEN_CH, 0);
+          ledChip.SetChannelPWM(BLUE_CH, 0);
+        }
+        nextToggle1 = micros() + (unsigned long)(delayMs * 1000.0);
+      }
+    } else {
+      float incomingFreq = data.toFloat();
+      if (incomingFreq > 0 && incomingFreq != prevFreq) {
+        // Keep the phase: scale the time left in this half-period to the new interval
+        unsigned long now = micros();
+        unsigned long oldInterval = shiftInterval1;
+        long remaining = (long)(nextToggle1 - now);
+        freq = incomingFreq;
+        prevFreq = freq;
+        setFrequency(freq);
+        if (remaining < 0) remaining = 0;
+        nextToggle1 = now + (unsigned long)((float)remaining * shiftInterval1 / oldInterval);
+      }
     }
   }
 
   // Toggle LED with color encoding
-  unsigned long currentMillis = millis();
-  if (currentMillis >= nextToggle1) {
+  unsigned long currentMicros = micros();
+  if ((long)(currentMicros - nextToggle1) >= 0) {
     ledState1 = !ledState1;
 
     uint8_t r, g, b;
@@ -0,0 +1,9 @@
+# ledfreq
+#
+# Shared helpers for the GenX320 LED frequency scripts. Copy this folder to
+# the root of the OpenMV Cam flash (or freeze it into the firmware) and import
+# only the submodules a script needs, e.g.
+#
+#   from ledfreq import profiler
+#
+# Nothing is imported here on purpose so a script only pays for what it uses.
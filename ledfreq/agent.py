@@ -0,0 +1,208 @@
+# agent.py
+#
+# Frequency-consensus agent. Each agent watches its neighbours' LEDs and
+# moves its own frequency towards theirs:
+#
+#   freq += stepsize * sum(neighbour_freq - freq)
+#
+# With fusion other than "sum" the neighbour errors are combined with a
+# confidence-weighted robust estimate (see robust.py) and scaled back up by
+# the neighbour count, so one missed LED (0 Hz) or harmonic double can't
+# throw the agent off. Readings below min_confidence are dropped outright.
+#
+# With phase_coupling > 0 the agent also pulls its blink phase towards its
+# neighbours' (Kuramoto coupling):
+#
+#   phase += phase_coupling * mean(sin(neighbour_phase - phase))
+#
+# The agent owns its LED's phase: rise_us is the tick of one of its rising
+# edges, and sync_delay_ms() gives the delay to the next one, which the
+# script sends to the driver (report.send_phase) so the LED follows the model.
+#
+# With a discovery (neighbors.Neighborhood) the neighbour pixels are not
+# fixed: they are re-detected and re-queried before every measurement.
+
+import math
+
+from .compat import ticks_us, ticks_diff, ticks_add
+from .robust import FUSERS
+
+
+class Agent:
+    def __init__(self, id, freq, timeperiod, stepsize, flag, neighbors, cam=None, duration_ms=1000, measure=None,
+                 fusion="sum", min_confidence=0.1, adaptive=False, min_step=0.01, max_step=None,
+                 phase_coupling=0.0, discovery=None):
+        self.freq = freq
+        self.timeperiod = timeperiod
+        self.stepsize = stepsize
+        self.flag = flag
+        self.neighbors = neighbors
+        self.id = id
+        self.cam = cam
+        self.duration_ms = duration_ms
+        # measure(cam, centers, duration_ms) -> list of Measurement
+        if measure is None:
+            from .pipeline import measure_led_frequencies as measure
+        self.measure = measure
+        self.fusion = fusion
+        self.min_confidence = min_confidence
+        self.adaptive = adaptive
+        self.min_step = min_step
+        self.max_step = max_step
+        self.phase_coupling = phase_coupling
+        # neighbors.Neighborhood: re-derive self.neighbors from live detections every round
+        self.discovery = discovery
+        self.rise_us = None
+        self.last = []
+        self.rounds = 0
+        self.metrics = {}
+        self._prev_rate = 0.0
+
+    def state(self):
+        """What a restart should keep (see checkpoint.py); rise_us is a tick and is re-anchored instead"""
+        return {"id": self.id, "freq": self.freq, "flag": self.flag, "stepsize": self.stepsize,
+                "rounds": self.rounds, "prev_rate": self._prev_rate}
+
+    def restore(self, state):
+        """Continue from state() saved before a restart; False if it belongs to another agent"""
+        if not state or state.get("id") != self.id:
+            return False
+        self.freq = state["freq"]
+        self.flag = state["flag"]
+        self.stepsize = state["stepsize"]
+        self.rounds = state["rounds"]
+        self._prev_rate = state["prev_rate"]
+        return True
+
+    def measure_neighbors(self):
+        """Measure all neighbour LEDs from one shared capture window"""
+        if self.discovery is not None:
+            self.neighbors = self.discovery.refresh(self.cam)
+        if not self.neighbors:
+            self.last = []
+            return self.last
+        self.last = self.measure(self.cam, self.neighbors, self.duration_ms)
+        return self.last
+
+    def _rate(self, measurements):
+        if self.fusion == "sum":
+            return sum(m.freq - self.freq for m in measurements), len(measurements)
+        errors = []
+        weights = []
+        for m in measurements:
+            if m.confidence >= self.min_confidence and m.freq > 0:
+                errors.append(m.freq - self.freq)
+                weights.append(m.confidence)
+        if not errors:
+            return 0.0, 0
+        center = FUSERS[self.fusion](errors, weights)
+        # Scale back to the sum-of-errors form so stepsize keeps its meaning,
+        # over the readings actually fused: dropped ones add no error to the sum
+        used = len(errors)
+        return center * used, used
+
+    def phase_at(self, t_us):
+        """Own blink phase (0..1 cycles after a rising edge) at tick t_us, or None before the first sync"""
+        if self.rise_us is None or self.freq <= 0:
+            return None
+        period = 1000000.0 / self.freq
+        return (ticks_diff(t_us, self.rise_us) % period) / period
+
+    def _phase_step(self, measurements):
+        # Weighted Kuramoto term in cycles, plus the order parameter r (1 = all in phase)
+        used = 0
+        sin_sum = 0.0
+        weight = 0.0
+        cs = 0.0
+        sn = 0.0
+        for m in measurements:
+            if m.phase_us is None or m.freq <= 0 or m.confidence < self.min_confidence:
+                continue
+            # Compare at the end of the window, where the extrapolation is shortest
+            t_ref = ticks_add(m.start_us, int(m.span_us))
+            mine = self.phase_at(t_ref)
+            if mine is None:
+                return 0.0, None
+            theirs = ((m.span_us - m.phase_us) * m.freq / 1000000.0) % 1.0
+            d = 2 * math.pi * (theirs - mine)
+            sin_sum += m.confidence * math.sin(d)
+            weight += m.confidence
+            cs += math.cos(d)
+            sn += math.sin(d)
+            used += 1
+        if not used:
+            return 0.0, None
+        # Own oscillator is at angle 0 in this frame
+        r = math.sqrt((cs + 1) ** 2 + sn ** 2) / (used + 1)
+        return self.phase_coupling * sin_sum / weight / (2 * math.pi), r
+
+    def sync_delay_ms(self, now_us=None):
+        """Milliseconds from now until the model's next rising edge.
+
+        The first call anchors the model one period from now. Send the result
+        right away with report.send_phase so the driver's LED matches it.
+        """
+        if now_us is None:
+            now_us = ticks_us()
+        period = 1000000.0 / self.freq if self.freq > 0 else 1000000.0
+        if self.rise_us is None:
+            self.rise_us = ticks_add(now_us, int(period))
+        delay = (ticks_diff(self.rise_us, now_us) % period)
+        self.rise_us = ticks_add(now_us, int(delay))
+        return delay / 1000.0
+
+    def _adapt(self, rate):
+        if self._prev_rate * rate < 0:
+            # Overshot: the error changed sign
+            self.stepsize *= 0.5
+        elif abs(rate) > 0.5 * abs(self._prev_rate) and self._prev_rate != 0:
+            # Creeping: errors barely shrink
+            self.stepsize *= 1.25
+        max_step = self.max_step
+        if max_step is None:
+            max_step = 1.0 / max(1, len(self.neighbors))
+        self.stepsize = min(max_step, max(self.min_step, self.stepsize))
+
+    def update(self):
+        measurements = self.measure_neighbors()
+        rate, used = self._rate(measurements)
+        step = self.stepsize
+        shift, coherence = 0.0, None
+        if self.phase_coupling > 0:
+            shift, coherence = self._phase_step(measurements)
+            if shift and self.freq > 0:
+                # Advancing the phase by `shift` cycles moves the rising edges earlier
+                self.rise_us = ticks_add(self.rise_us, -int(shift * 1000000.0 / self.freq))
+        if self.rise_us is not None and self.freq > 0:
+            # Re-anchor on the latest rising edge so the new period only applies from here on
+            now = ticks_us()
+            self.rise_us = ticks_add(now, -int(self.phase_at(now) * 1000000.0 / self.freq))
+        self.freq += step * rate
+        if self.adaptive:
+            self._adapt(rate)
+        self._prev_rate = rate
+        self.rounds += 1
+        spread = [abs(m.freq - self.freq) for m in measurements if m.freq > 0]
+        self.metrics = {
+            "round": self.rounds,
+            "freq": self.freq,
+            "rate": rate,
+            "step": step,
+            "used": used,
+            "rejected": len(measurements) - used,
+            "disagreement": max(spread) if spread else 0.0,
+            "phase_shift": shift,
+            "coherence": coherence,
+        }
+        return self.freq
+
+    def metrics_line(self):
+        """One-line summary of the last round, for logging over USB or UART"""
+        m = self.metrics
+        if not m:
+            return "agent {} no rounds yet".format(self.id)
+        line = "agent {} round {} freq {:.2f} rate {:.2f} step {:.3f} used {} rejected {} disagreement {:.2f}".format(
+            self.id, m["round"], m["freq"], m["rate"], m["step"], m["used"], m["rejected"], m["disagreement"])
+        if m["coherence"] is not None:
+            line += " phase_shift {:+.3f} coherence {:.2f}".format(m["phase_shift"], m["coherence"])
+        return line
@@ -0,0 +1,172 @@
+# alias.py
+#
+# Frequencies near and above the frame-rate Nyquist limit.
+#
+# At 60 fps a 40 Hz LED looks exactly like a 20 Hz one: any frequency f is
+# seen folded to |f - k * fs| in 0..fs/2. One frame rate cannot tell the
+# candidates apart, but they fold differently at another rate: 40 Hz reads
+# 20 Hz at 60 fps and 5 Hz at 45 fps, while a real 20 Hz reads 20 Hz at
+# both. MultiRateMeasure splits each window over a few frame rates and
+# keeps the frequencies consistent with every reading. 60 and 45 fps tell
+# every frequency apart up to 52.5 Hz (max_unambiguous), 60, 50 and 45 fps
+# up to 115 Hz at the cost of shorter windows per rate.
+#
+#   measure = MultiRateMeasure(rates=(60, 45))
+#   agent = Agent(..., measure=measure)          # drop-in for measure_led_frequencies
+#   m = measure(sensor, centers, 1000)[0]
+#   m.freq, m.candidates                         # freq is 0 when m.candidates has several entries
+#
+# Frames at jittered times break the folding the same way; resolve_jittered
+# picks among the candidates with a DFT at the real frame times.
+
+from .estimate import Measurement
+
+
+def fold(freq, fs):
+    """The frequency freq appears at when sampled at fs, in 0..fs/2"""
+    f = freq % fs
+    return fs - f if f > fs / 2.0 else f
+
+
+def unfold(apparent, fs, f_max):
+    """Every frequency up to f_max that folds to apparent at fs, lowest first"""
+    found = []
+    k = 0
+    while k * fs - apparent <= f_max:
+        for f in (k * fs - apparent, k * fs + apparent):
+            if 0 < f <= f_max and (not found or abs(f - found[-1]) > 1e-9):
+                found.append(f)
+        k += 1
+    return found
+
+
+def _lcm(rates):
+    m = 1
+    for r in rates:
+        a, b = m, r
+        while b:
+            a, b = b, a % b
+        m = m * r // a
+    return m
+
+
+def max_unambiguous(rates):
+    """Highest frequency below which the rates (integers, fps) tell every pair of frequencies apart.
+
+    f and f2 look alike at rate r when f2 - f or f2 + f is a multiple of
+    r. If that is the difference for the rates in P and the sum for the
+    rest M, f2 is at least (lcm(P) + lcm(M)) / 2; with every rate in M it
+    is over lcm / 2. The smallest of these over all splits is the limit.
+    """
+    rates = list(rates)
+    limit = _lcm(rates) / 2.0
+    n = len(rates)
+    for mask in range(1, (1 << n) - 1):
+        plus = [rates[i] for i in range(n) if mask >> i & 1]
+        minus = [rates[i] for i in range(n) if not mask >> i & 1]
+        limit = min(limit, (_lcm(plus) + _lcm(minus)) / 2.0)
+    return limit
+
+
+def resolve(observations, f_max=None, tolerance=0.5):
+    """(freq, candidates) from [(apparent freq, fs), ...].
+
+    A candidate folds to within tolerance of every apparent frequency; its
+    value is the mean of what each observation unfolds to near it. freq is
+    the candidate when there is exactly one and 0.0 otherwise, with every
+    surviving candidate listed so the caller can see the ambiguity.
+    """
+    if not observations:
+        return 0.0, []
+    if f_max is None:
+        f_max = max_unambiguous([int(round(fs)) for _, fs in observations]) - tolerance
+    base_apparent, base_fs = observations[0]
+    candidates = []
+    for c in unfold(base_apparent, base_fs, f_max + tolerance):
+        estimates = []
+        for apparent, fs in observations:
+            if abs(fold(c, fs) - apparent) > tolerance:
+                break
+            # The unfolding of this observation closest to c
+            k = int(c / fs + 0.5)
+            estimates.append(min((k * fs - apparent, k * fs + apparent), key=lambda f: abs(f - c)))
+        else:
+            f = sum(estimates) / len(estimates)
+            if f <= f_max and not any(abs(f - g) <= 2 * tolerance for g in candidates):
+                candidates.append(f)
+    if len(candidates) == 1:
+        return candidates[0], candidates
+    return 0.0, candidates
+
+
+def resolve_jittered(samples, times, candidates, margin=1.5):
+    """(freq, power ratio) of the candidate with the strongest DFT bin at the real frame times.
+
+    Uniform frames give every candidate of one folding the same power; with
+    jittered times only the true frequency stays coherent. freq is 0.0 when
+    the best bin is less than margin times the runner-up.
+    """
+    from .spectral import _tables, pixel_spectrum
+
+    if not candidates or len(samples) < 4:
+        return 0.0, 0.0
+    cos_t, sin_t = _tables(times, candidates)
+    power = pixel_spectrum(samples, cos_t, sin_t)
+    order = sorted(range(len(candidates)), key=lambda k: power[k], reverse=True)
+    best = power[order[0]]
+    second = power[order[1]] if len(order) > 1 else 0.0
+    ratio = best / second if second > 0 else float("inf")
+    if ratio < margin:
+        return 0.0, ratio
+    return candidates[order[0]], ratio
+
+
+class MultiRateMeasure:
+    """Callable measure(cam, centers, duration_ms) -> list of Measurement spanning several frame rates.
+
+    The window is split evenly over rates; cam.set_framerate() switches
+    between them and the first rate is restored at the end. Each reading
+    comes from measure (pipeline.measure_led_frequencies by default, or any
+    measure taking fps=) and the readings are combined with resolve().
+    The result keeps the edges and phase of the first rate's reading when
+    the LED is below its Nyquist limit and drops the phase otherwise;
+    m.candidates lists the frequencies that fit every reading and an
+    ambiguous or inconsistent LED gets freq 0 and confidence 0 so fusion
+    leaves it out.
+    """
+
+    def __init__(self, rates=(60, 45), f_max=None, tolerance=0.5, measure=None, settle_ms=0):
+        if measure is None:
+            from .pipeline import measure_led_frequencies as measure
+        self.rates = rates
+        self.f_max = f_max if f_max is not None else max_unambiguous(rates) - tolerance
+        self.tolerance = tolerance
+        self.measure = measure
+        self.settle_ms = settle_ms
+
+    def __call__(self, cam, centers, duration_ms=1000):
+        per = duration_ms // len(self.rates)
+        readings = []
+        for fs in self.rates:
+            cam.set_framerate(fs)
+            if self.settle_ms:
+                cam.skip_frames(time=self.settle_ms)
+            readings.append(self.measure(cam, centers, per, fps=fs))
+        if len(self.rates) > 1:
+            cam.set_framerate(self.rates[0])
+        results = []
+        for i in range(len(centers)):
+            ms = [r[i] for r in readings]
+            freq, candidates = resolve([(ms[j].freq, self.rates[j]) for j in range(len(ms))],
+                                       self.f_max, self.tolerance)
+            first = ms[0]
+            confidence = min(m.confidence for m in ms) if freq > 0 else 0.0
+            m = Measurement(first.center, freq, min(m.quality for m in ms), first.edges, first.span_us,
+                            confidence=confidence)
+            m.start_us = first.start_us
+            if freq > 0 and freq < self.rates[0] / 2.0:
+                m.duty = first.duty
+                m.phase_us = first.phase_us
+            m.candidates = candidates
+            results.append(m)
+        return results
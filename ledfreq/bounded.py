@@ -0,0 +1,228 @@
+# bounded.py
+#
+# Memory-bounded measurement and FSK decoding.
+#
+# The per-frame loops here only touch buffers allocated up front: edge times
+# go into fixed arrays, thresholds and frequencies are integers (centi-Hz),
+# nothing is formatted or appended while a window is open. The heap stays
+# flat for any run length and the GC never has a reason to run mid-window;
+# BoundedMeasure also collects between windows so it doesn't pick a bad
+# moment on its own. memcheck.py checks the zero-allocation claim.
+#
+#   measure = BoundedMeasure(len(centers))
+#   agent = Agent(..., measure=measure)          # drop-in for measure_led_frequencies
+#
+# Grayscale frames only: get_pixel on an RGB frame returns a new tuple.
+
+import gc
+from array import array
+
+from .compat import ticks_us, ticks_diff
+from .estimate import Measurement
+
+
+class EdgeBuffer:
+    """Preallocated edge times (us since the window start) for n LEDs"""
+
+    def __init__(self, n, max_edges=128):
+        self.n = n
+        self.max_edges = max_edges
+        self.times = [array("i", bytes(4 * max_edges)) for _ in range(n)]
+        self.count = array("H", bytes(2 * n))
+        self.level = bytearray(n)
+        self.overflow = array("H", bytes(2 * n))
+        self.span_us = 0
+        self.frames = 0
+
+    def reset(self):
+        for i in range(self.n):
+            self.count[i] = 0
+            self.overflow[i] = 0
+        self.span_us = 0
+        self.frames = 0
+
+
+def sample_edges_bounded(cam, xs, ys, thresholds, duration_ms, buf, debounce_us=5000):
+    """sample_edges into buf without allocating per frame.
+
+    xs, ys and thresholds are integer arrays (e.g. array('H')) of the same
+    length as buf. Edge times are midpoints between the two bracketing
+    frames, as in sample_edges; edges past buf.max_edges are only counted.
+    """
+    n = buf.n
+    times = buf.times
+    count = buf.count
+    level = buf.level
+    limit = buf.max_edges
+    end = duration_ms * 1000
+    buf.reset()
+
+    img = cam.snapshot()
+    start = ticks_us()
+    for i in range(n):
+        level[i] = 1 if img.get_pixel(xs[i], ys[i]) > thresholds[i] else 0
+    prev = 0
+    frames = 0
+    while prev < end:
+        img = cam.snapshot()
+        now = ticks_diff(ticks_us(), start)
+        for i in range(n):
+            p = 1 if img.get_pixel(xs[i], ys[i]) > thresholds[i] else 0
+            if p != level[i]:
+                level[i] = p
+                t = (prev + now) >> 1
+                c = count[i]
+                if c == 0 or t - times[i][c - 1] > debounce_us:
+                    if c < limit:
+                        times[i][c] = t
+                        count[i] = c + 1
+                    else:
+                        buf.overflow[i] += 1
+        prev = now
+        frames += 1
+    buf.span_us = prev
+    buf.frames = frames
+    return buf
+
+
+def frequency_chz(times, n, span_us):
+    """Frequency in centi-Hz from n edge times, integer math only.
+
+    Mean half-period between the first and last edge with 3 or more edges,
+    edge pairs per span otherwise (estimate.frequency_from_edges). Every
+    intermediate stays below 2**30, so MicroPython never promotes to a
+    heap-allocated big int.
+    """
+    if n >= 3:
+        half = (times[n - 1] - times[0]) // (n - 1)
+        if half > 0:
+            return 50000000 // half
+    if span_us <= 0:
+        return 0
+    return (n >> 1) * 100000000 // span_us
+
+
+def threshold_levels(cam, xs, ys, out, frames=10):
+    """Integer mid-level thresholds into out (calibrate_thresholds without floats or lists)"""
+    n = len(out)
+    lo = array("H", [255] * n)
+    hi = array("H", bytes(2 * n))
+    for _ in range(frames):
+        img = cam.snapshot()
+        for i in range(n):
+            v = img.get_pixel(xs[i], ys[i])
+            if v < lo[i]:
+                lo[i] = v
+            if v > hi[i]:
+                hi[i] = v
+    for i in range(n):
+        out[i] = (lo[i] + hi[i]) >> 1
+    return out
+
+
+class BoundedMeasure:
+    """Callable measure(cam, centers, duration_ms) -> list of Measurement with preallocated buffers.
+
+    Thresholds are calibrated once per set of centers and reused; pass
+    recalibrate_every to refresh them every that many windows. Allocation
+    happens only between windows, when the Measurement list is built.
+    """
+
+    def __init__(self, n, max_edges=128, debounce_us=5000, calib_frames=10, recalibrate_every=0, collect=True):
+        self.buf = EdgeBuffer(n, max_edges)
+        self.xs = array("H", bytes(2 * n))
+        self.ys = array("H", bytes(2 * n))
+        self.thresholds = array("H", bytes(2 * n))
+        self.freqs = array("i", bytes(4 * n))
+        self.debounce_us = debounce_us
+        self.calib_frames = calib_frames
+        self.recalibrate_every = recalibrate_every
+        self.collect = collect
+        self.centers = None
+        self.windows = 0
+
+    def _set_centers(self, cam, centers):
+        for i in range(len(centers)):
+            self.xs[i] = centers[i][0]
+            self.ys[i] = centers[i][1]
+        threshold_levels(cam, self.xs, self.ys, self.thresholds, self.calib_frames)
+        self.centers = list(centers)
+
+    def window(self, cam, duration_ms):
+        """Run one window into self.buf and self.freqs; no allocation"""
+        buf = sample_edges_bounded(cam, self.xs, self.ys, self.thresholds, duration_ms, self.buf, self.debounce_us)
+        for i in range(buf.n):
+            self.freqs[i] = frequency_chz(buf.times[i], buf.count[i], buf.span_us)
+        self.windows += 1
+        return self.freqs
+
+    def __call__(self, cam, centers, duration_ms=1000):
+        if len(centers) != self.buf.n:
+            raise ValueError("BoundedMeasure was built for {} centers".format(self.buf.n))
+        if self.centers != list(centers) or (self.recalibrate_every and self.windows % self.recalibrate_every == 0):
+            self._set_centers(cam, centers)
+        if self.collect:
+            # Collect now so the GC has nothing to do during the window
+            gc.collect()
+        self.window(cam, duration_ms)
+        buf = self.buf
+        quality = 1.0 if buf.frames else 0.0
+        return [Measurement(self.centers[i], self.freqs[i] / 100.0, quality, buf.times[i][:buf.count[i]], buf.span_us)
+                for i in range(buf.n)]
+
+
+# --- FSK ---
+
+def count_transitions(cam, x, y, threshold, duration_ms, debounce_us=5000):
+    """Debounced transitions of one pixel in duration_ms; the fsk bit window without storing edges"""
+    end = duration_ms * 1000
+    img = cam.snapshot()
+    start = ticks_us()
+    level = 1 if img.get_pixel(x, y) > threshold else 0
+    last = -debounce_us - 1
+    prev = 0
+    count = 0
+    while prev < end:
+        img = cam.snapshot()
+        now = ticks_diff(ticks_us(), start)
+        p = 1 if img.get_pixel(x, y) > threshold else 0
+        if p != level:
+            level = p
+            t = (prev + now) >> 1
+            if t - last > debounce_us:
+                count += 1
+                last = t
+        prev = now
+    return count
+
+
+def decode_bits_bounded(cam, center, threshold, bits, n_bits, window_ms=100, max_transitions=2, times_ms=None):
+    """Fill bits[0:n_bits] (a bytearray) with 10/20 Hz FSK bits, one window each.
+
+    A bit is 1 when its window holds more than max_transitions transitions
+    (fsk.classify_transitions). If times_ms is an array, the start of every
+    window (ms since the first) is stored there. Returns n_bits.
+    """
+    x = center[0]
+    y = center[1]
+    start = ticks_us()
+    for k in range(n_bits):
+        if times_ms is not None:
+            times_ms[k] = ticks_diff(ticks_us(), start) // 1000
+        bits[k] = 1 if count_transitions(cam, x, y, threshold, window_ms) > max_transitions else 0
+    return n_bits
+
+
+def uart_byte(bits, offset=0):
+    """Byte of the 11-bit UART frame at bits[offset:] (start, 8 data LSB first, even parity, stop) or -1"""
+    if offset + 11 > len(bits) or bits[offset] != 0 or bits[offset + 10] != 1:
+        return -1
+    byte = 0
+    parity = 0
+    for i in range(8):
+        b = bits[offset + 1 + i]
+        byte |= b << i
+        parity ^= b
+    if bits[offset + 9] != parity:
+        return -1
+    return byte
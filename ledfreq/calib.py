@@ -0,0 +1,135 @@
+# calib.py
+#
+# Persisted calibration so a restart doesn't repeat the full LED search.
+#
+# The cache is a small JSON file (on the cam's flash, or on the host) holding
+# LED centers, per-LED thresholds and the blob parameters that produced them.
+# A warm start loads it, checks for up to one period of the slowest
+# expected LED that every cached LED still lights up where expected and
+# only falls back to full detection if not.
+#
+#   cache = calib.load("calib.json", params)
+#   sensor = camera.setup(skip_ms=200 if cache else 2000)
+#   cache = calib.warm_start(sensor, "calib.json", params, detect, cache)
+#   measure_led_frequencies(sensor, cache["centers"], thresholds=cache["thresholds"])
+
+import json
+
+from .compat import ticks_ms, ticks_diff
+from .sample import read_pixel, calibrate_thresholds
+
+CACHE_VERSION = 1
+DEFAULT_PATH = "calib.json"
+
+
+def _norm(params):
+    # Tuples come back from JSON as lists, compare in the stored form
+    return json.loads(json.dumps(params))
+
+
+def _valid(cache, params, width, height):
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return False
+    if cache.get("framesize") != [width, height]:
+        return False
+    if cache.get("params") != _norm(params):
+        return False
+    centers = cache.get("centers")
+    thresholds = cache.get("thresholds")
+    if not centers or not isinstance(thresholds, list) or len(thresholds) != len(centers):
+        return False
+    for c in centers:
+        if len(c) != 2 or not (0 <= c[0] < width and 0 <= c[1] < height):
+            return False
+    return True
+
+
+def load(path=DEFAULT_PATH, params=None, width=320, height=320):
+    """Return the cached calibration if the file exists and matches params, else None"""
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not _valid(cache, params, width, height):
+        return None
+    cache["centers"] = [tuple(c) for c in cache["centers"]]
+    return cache
+
+
+def save(path, centers, thresholds, params=None, width=320, height=320):
+    """Write centers/thresholds/params to path and return the cache dict"""
+    cache = {
+        "version": CACHE_VERSION,
+        "framesize": [width, height],
+        "params": _norm(params),
+        "centers": [list(c) for c in centers],
+        "thresholds": list(thresholds),
+    }
+    try:
+        with open(path, "w") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass  # read-only filesystem, keep running uncached
+    cache["centers"] = [tuple(c) for c in centers]
+    return cache
+
+
+def verify(cam, cache, min_freq=1.0, timeout_ms=None, radius=1, margin=10):
+    """True if every cached LED shows a pixel above its threshold before the time is up.
+
+    The time is one period of the slowest expected LED (min_freq Hz) plus
+    100 ms, or timeout_ms, so an LED that happens to be in its off phase
+    still gets a chance to light up. A 3x3 (radius 1) neighbourhood,
+    clipped to the frame, is checked so a small drift still passes. Stops
+    as soon as every LED has been seen.
+    """
+    if timeout_ms is None:
+        timeout_ms = int(1000 / min_freq) + 100
+    width, height = cache.get("framesize", (320, 320))
+    centers = cache["centers"]
+    thresholds = cache["thresholds"]
+    pending = list(range(len(centers)))
+    start = ticks_ms()
+    while True:
+        img = cam.snapshot()
+        still = []
+        for i in pending:
+            cx, cy = centers[i]
+            level = thresholds[i] + margin
+            seen = False
+            for y in range(max(0, cy - radius), min(height, cy + radius + 1)):
+                for x in range(max(0, cx - radius), min(width, cx + radius + 1)):
+                    if read_pixel(img, x, y) > level:
+                        seen = True
+                        break
+                if seen:
+                    break
+            if not seen:
+                still.append(i)
+        pending = still
+        if not pending:
+            return True
+        if ticks_diff(ticks_ms(), start) >= timeout_ms:
+            return False
+
+
+def warm_start(cam, path, params, detect, cache=None, min_freq=1.0, timeout_ms=None):
+    """Return a verified calibration, re-running detect(cam) -> centers only when needed.
+
+    min_freq / timeout_ms bound the check, see verify().
+    """
+    if cache is None:
+        cache = load(path, params)
+    if cache is not None and verify(cam, cache, min_freq, timeout_ms):
+        cache["warm"] = True
+        return cache
+    centers = detect(cam)
+    if not centers:
+        return None
+    if isinstance(centers, tuple):
+        centers = [centers]
+    thresholds = calibrate_thresholds(cam, centers)
+    cache = save(path, centers, thresholds, params)
+    cache["warm"] = False
+    return cache
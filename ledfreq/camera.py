@@ -0,0 +1,25 @@
+# camera.py
+#
+# GenX320 bring-up shared by every script.
+
+
+def setup(framerate=60, palette=None, skip_ms=2000, biases=None):
+    """Reset the sensor for 320x320 grayscale capture and return the sensor module.
+
+    biases is an optional list of (bias id, value) pairs passed to the GENX320
+    SET_BIAS ioctl after the sensor has settled.
+    """
+    import sensor
+
+    sensor.reset()
+    sensor.set_pixformat(sensor.GRAYSCALE)  # Must always be grayscale.
+    sensor.set_framesize(sensor.B320X320)  # Must always be 320x320.
+    if palette is not None:
+        sensor.set_color_palette(palette)
+    if framerate is not None:
+        sensor.set_framerate(framerate)
+    sensor.skip_frames(time=skip_ms)
+    if biases:
+        for bias, value in biases:
+            sensor.ioctl(sensor.IOCTL_GENX320_SET_BIAS, bias, value)
+    return sensor
@@ -0,0 +1,291 @@
+# capture.py
+#
+# Double-buffered capture: frame acquisition never waits on analysis.
+#
+# In sample_edges the snapshot, the pixel reads, the thresholding and any
+# drawing or printing run one after the other, so every bit of analysis
+# time is taken out of the sample rate. Here a capture stage does nothing
+# but snapshot() and copy the tracked pixels into a small pool of reusable
+# slots; the analysis stage drains the pool at its own pace. When analysis
+# falls behind the pool fills up and capture drops the frame instead of
+# waiting, so the sensor keeps its rate and the drop shows up in the pool
+# counters.
+#
+#   pool = FramePool(4, len(centers))
+#   ms = measure_led_frequencies(sensor, centers, 1000, pool=pool)
+#   print(pool.report())
+#
+# Capture runs on its own thread with _thread (MicroPython builds that have
+# it, and CPython, which drives the host simulator). Without _thread, or
+# with threaded=False, the two stages alternate in one loop: same results,
+# but analysis time counts against the frame rate again.
+
+from array import array
+
+from .compat import ticks_us
+from .jitter import FrameMonitor
+from .sample import calibrate_thresholds
+from .kernels import EdgeKernel, PixelReader
+from .estimate import Measurement, fit_estimator
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+
+class FramePool:
+    """Ring of `slots` preallocated pixel buffers between one capture and one analysis stage.
+
+    Each slot holds the grey level of every tracked pixel of one frame and
+    the frame's time in us since the first frame. Only the fill count is
+    shared, under a lock; the ready lock wakes the analysis stage when a
+    frame is published so it never has to poll.
+    """
+
+    def __init__(self, slots=4, n=1):
+        self.size = slots
+        self.n = n
+        self.slots = [bytearray(n) for _ in range(slots)]
+        self.times = array("i", bytes(4 * slots))
+        # Occupancy seen by every captured frame, 0..slots
+        self.hist = array("H", bytes(2 * (slots + 1)))
+        self.lock = _thread.allocate_lock() if _thread is not None else None
+        self.ready = _thread.allocate_lock() if _thread is not None else None
+        self.pixels = None
+        self.pixels_of = None
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.hist)):
+            self.hist[i] = 0
+        self.head = 0
+        self.tail = 0
+        self.count = 0
+        self.captured = 0
+        self.analyzed = 0
+        self.dropped = 0
+        self.max_occupancy = 0
+        self.closed = False
+        self.stop = False
+        self.error = None
+        if self.ready is not None and not self.ready.locked():
+            self.ready.acquire()
+
+    def _add(self, delta):
+        if self.lock is None:
+            self.count += delta
+            return self.count
+        self.lock.acquire()
+        self.count += delta
+        count = self.count
+        self.lock.release()
+        return count
+
+    def _wake(self):
+        # Only the capture stage releases and only the analysis stage acquires
+        if self.ready is not None and self.ready.locked():
+            self.ready.release()
+
+    # --- Capture side ---
+
+    def put(self, img, t, xs, ys):
+        """Copy the tracked pixels of img into the next free slot; False (and a drop) if the pool is full"""
+        count = self.count
+        self.captured += 1
+        if count < len(self.hist) and self.hist[count] < 65535:
+            self.hist[count] += 1
+        if count >= self.size:
+            self.dropped += 1
+            return False
+        if self.pixels is None or self.pixels_of[0] is not xs or self.pixels_of[1] is not ys:
+            # Framebuffer offsets for these pixels, kept while the same xs and ys come in
+            self.pixels = PixelReader(xs, ys)
+            self.pixels_of = (xs, ys)
+        self.pixels.read(img, self.slots[self.head])
+        self.times[self.head] = t
+        self.head = (self.head + 1) % self.size
+        count = self._add(1)
+        if count > self.max_occupancy:
+            self.max_occupancy = count
+        self._wake()
+        return True
+
+    def close(self, error=None):
+        self.error = error
+        self.closed = True
+        self._wake()
+
+    # --- Analysis side ---
+
+    def get(self):
+        """Index of the oldest filled slot, waiting for one; -1 once capture has closed and the pool is empty"""
+        while self.count == 0:
+            if self.closed or self.ready is None:
+                return -1
+            self.ready.acquire()
+        return self.tail
+
+    def release(self):
+        """Hand the slot from get() back to capture"""
+        self.tail = (self.tail + 1) % self.size
+        self.analyzed += 1
+        self._add(-1)
+
+    # --- Stats ---
+
+    def occupancy(self):
+        """Mean number of filled slots seen by a captured frame"""
+        total = 0
+        frames = 0
+        for k in range(len(self.hist)):
+            total += k * self.hist[k]
+            frames += self.hist[k]
+        return total / frames if frames else 0.0
+
+    def report(self):
+        return "slots={} captured={} analyzed={} dropped={} occ={:.2f} max={}".format(
+            self.size, self.captured, self.analyzed, self.dropped, self.occupancy(), self.max_occupancy)
+
+
+def capture_frames(cam, pool, xs, ys, duration_us, monitor):
+    """Capture stage: snapshot into pool until duration_us has passed or pool.stop is set.
+
+    Always closes the pool, passing on any exception to the analysis stage.
+    """
+    try:
+        img = cam.snapshot()
+        pool.put(img, monitor.frame(ticks_us()), xs, ys)
+        now = 0
+        while now < duration_us and not pool.stop:
+            img = cam.snapshot()
+            now = monitor.frame(ticks_us())
+            pool.put(img, now, xs, ys)
+        pool.close()
+    except Exception as e:
+        pool.close(e)
+
+
+def start_capture(cam, pool, xs, ys, duration_us, monitor):
+    """Run capture_frames on its own thread; returns False when _thread is not available"""
+    if _thread is None:
+        return False
+    _thread.start_new_thread(capture_frames, (cam, pool, xs, ys, duration_us, monitor))
+    return True
+
+
+class EdgeAnalyzer:
+    """Analysis stage of sample_edges: thresholds each slot and collects debounced edge times"""
+
+    def __init__(self, thresholds, debounce_us=5000, stop=None, on_frame=None, hysteresis=0):
+        self.thresholds = thresholds
+        self.debounce_us = debounce_us
+        self.stop = stop
+        self.on_frame = on_frame
+        self.kernel = EdgeKernel(thresholds, None, debounce_us, hysteresis)
+        n = len(thresholds)
+        self.edges = [[] for _ in range(n)]
+        self.levels = None
+        self.done = [False] * n
+        self.pending = n
+        self.prev = 0
+
+    def frame(self, t, values):
+        """Process one frame; returns True when the stop rule is met for every center"""
+        if self.on_frame is not None:
+            self.on_frame(t, values)
+        kernel = self.kernel
+        if self.levels is None:
+            kernel.start(values)
+            self.levels = [kernel.level(i) for i in range(kernel.n)]
+            self.prev = t
+            return False
+        edge_time = (self.prev + t) // 2
+        changed = kernel.changed
+        for j in range(kernel.step(values, edge_time)):
+            i = changed[j]
+            e = self.edges[i]
+            e.append(edge_time)
+            if self.stop is not None and not self.done[i] and self.stop(e):
+                self.done[i] = True
+                self.pending -= 1
+        self.prev = t
+        return self.stop is not None and self.pending == 0
+
+
+def run_pool(cam, pool, xs, ys, duration_us, monitor, analyze, threaded=True):
+    """Capture into pool and feed every slot to analyze(t, values) until the window ends.
+
+    analyze returning True stops capture early. With threaded=False (or no
+    _thread) capture and analysis alternate frame by frame.
+    """
+    pool.reset()
+    monitor.reset()
+    if not (threaded and start_capture(cam, pool, xs, ys, duration_us, monitor)):
+        # One frame at a time: capture, then analyse it
+        img = cam.snapshot()
+        now = monitor.frame(ticks_us())
+        while True:
+            pool.put(img, now, xs, ys)
+            i = pool.tail
+            if analyze(pool.times[i], pool.slots[i]):
+                pool.stop = True
+            pool.release()
+            if now >= duration_us or pool.stop:
+                break
+            img = cam.snapshot()
+            now = monitor.frame(ticks_us())
+        pool.close()
+        return pool
+    while True:
+        i = pool.get()
+        if i < 0:
+            break
+        if analyze(pool.times[i], pool.slots[i]):
+            pool.stop = True
+        pool.release()
+    if pool.error is not None:
+        raise pool.error
+    return pool
+
+
+def measure_led_frequencies(cam, centers, duration_ms=1000, fps=60, thresholds=None,
+                            estimator=None, debounce_us=5000, monitor=None, pool=None,
+                            stop=None, on_frame=None, threaded=True):
+    """pipeline.measure_led_frequencies with capture and analysis on separate stages.
+
+    pool is a FramePool (4 slots by default) whose counters tell how far
+    analysis fell behind; on_frame(t, values) runs in the analysis stage
+    for every analysed frame, so per-frame drawing or printing there costs
+    slots rather than samples. Frames dropped by a full pool are simply
+    missing from the edge times, which stay at the real frame times.
+    """
+    n = len(centers)
+    if thresholds is None:
+        thresholds = calibrate_thresholds(cam, centers)
+    if monitor is None:
+        monitor = FrameMonitor(fps=fps)
+    if estimator is None:
+        estimator = fit_estimator(monitor.nominal_us)
+    if pool is None:
+        pool = FramePool(4, n)
+    elif pool.n != n:
+        raise ValueError("FramePool was built for {} centers".format(pool.n))
+    if stop is not None and hasattr(stop, "set_frame_us"):
+        # Stop rules judge edge timing against the frame period of this window
+        stop.set_frame_us(monitor.nominal_us)
+    xs = [c[0] for c in centers]
+    ys = [c[1] for c in centers]
+    analyzer = EdgeAnalyzer(thresholds, debounce_us, stop, on_frame)
+    run_pool(cam, pool, xs, ys, duration_ms * 1000, monitor, analyzer.frame, threaded)
+    span = monitor.span_us()
+    quality = monitor.quality()
+    levels = analyzer.levels or [False] * n
+    results = []
+    for i in range(n):
+        edges = analyzer.edges[i]
+        m = Measurement(centers[i], estimator(edges, span), quality, edges, span)
+        m.fit(not levels[i], monitor.nominal_us)
+        m.start_us = monitor.first_us
+        results.append(m)
+    return results
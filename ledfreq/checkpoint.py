@@ -0,0 +1,93 @@
+# checkpoint.py
+#
+# Warm resume after the camera drops off USB or is reset.
+#
+# A restart used to mean sensor settling, blob detection and every agent
+# back at its initial frequency, i.e. tens of seconds of re-convergence. A
+# checkpoint is a small JSON file (on the cam's flash, or on the host)
+# holding whatever the script wants back, each piece from its own
+# state() method (Agent, Neighborhood, fsk.PartialFrame), plus the wall
+# time it was written:
+#
+#   state = checkpoint.load("state.json")
+#   sensor = camera.setup(skip_ms=200 if state else 2000)
+#   if state:
+#       agent.restore(state["agent"])
+#   ckpt = checkpoint.Checkpoint("state.json", every_s=30)
+#   ...
+#   ckpt.save(agent=agent.state())      # after every round; writes at most every 30 s
+#
+# Files are written to a temporary name and renamed over the old one, so a
+# reset in the middle of a write leaves the previous checkpoint intact.
+# Ticks restart with the script, so nothing in a checkpoint is a tick;
+# times are wall-clock milliseconds (the RTC on the cam, which survives a
+# soft reset), kept as integers since the cam's single-precision floats
+# can't hold them.
+
+import json
+import os
+import time
+
+CHECKPOINT_VERSION = 1
+DEFAULT_PATH = "state.json"
+
+
+def wall_ms():
+    """Wall-clock milliseconds (an int), comparable across a restart"""
+    if hasattr(time, "time_ns"):
+        return time.time_ns() // 1000000
+    return int(time.time()) * 1000
+
+
+def load(path=DEFAULT_PATH, max_age_s=None):
+    """The saved sections as a dict, with "age_ms" added, or None.
+
+    None if the file is missing, unreadable, from another version or older
+    than max_age_s. age_ms is None when the clock has gone backwards since
+    (e.g. an RTC lost with the power), so the age is unknown.
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+        return None
+    age = wall_ms() - state.get("saved_ms", 0)
+    state["age_ms"] = age if age >= 0 else None
+    if max_age_s is not None and (age < 0 or age > max_age_s * 1000):
+        return None
+    return state
+
+
+class Checkpoint:
+    """Writes named sections to path, at most once every every_s seconds unless forced"""
+
+    def __init__(self, path=DEFAULT_PATH, every_s=30):
+        self.path = path
+        self.every_s = every_s
+        self.last_ms = None
+        self.writes = 0
+        self.failed = False
+
+    def due(self):
+        return self.last_ms is None or wall_ms() - self.last_ms >= self.every_s * 1000
+
+    def save(self, force=False, **sections):
+        """Write the sections (plain JSON-able values); returns True if the file was written"""
+        if not (force or self.due()):
+            return False
+        now = wall_ms()
+        state = {"version": CHECKPOINT_VERSION, "saved_ms": now}
+        state.update(sections)
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.rename(tmp, self.path)
+        except OSError:
+            self.failed = True  # read-only filesystem, keep running without checkpoints
+            return False
+        self.last_ms = now
+        self.writes += 1
+        return True
@@ -0,0 +1,44 @@
+# compat.py
+#
+# Timing shims so the ledfreq modules run unchanged on the OpenMV Cam
+# (MicroPython) and on a desktop Python for offline work.
+#
+# On the desktop the ticks can be driven by a virtual clock (anything with
+# now_us() and sleep_us(us)) via set_clock(), which lets a simulated camera
+# run the real measurement code faster than real time.
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms
+except ImportError:
+    import time as _time
+
+    _clock = None
+
+    def set_clock(clock):
+        """Drive the ticks from clock.now_us(); None goes back to time.monotonic()"""
+        global _clock
+        _clock = clock
+
+    def get_clock():
+        """The clock set with set_clock, or None"""
+        return _clock
+
+    def ticks_us():
+        if _clock is not None:
+            return int(_clock.now_us())
+        return int(_time.monotonic() * 1000000)
+
+    def ticks_ms():
+        return ticks_us() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def ticks_add(a, delta):
+        return a + delta
+
+    def sleep_ms(ms):
+        if _clock is not None:
+            _clock.sleep_us(ms * 1000)
+        else:
+            _time.sleep(ms / 1000.0)
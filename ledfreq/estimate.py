@@ -0,0 +1,216 @@
+# estimate.py
+#
+# Frequency estimators that work from the recorded edge timestamps.
+# Every estimator takes (edge_times_us, span_us) and returns Hz.
+
+
+class Measurement:
+    """Result of measuring one LED over one capture window"""
+
+    def __init__(self, center, freq, quality, edges, span_us, confidence=None):
+        self.center = center
+        self.freq = freq
+        self.quality = quality
+        self.edges = edges
+        self.span_us = span_us
+        # Filled in by fit() when the edge directions are known
+        self.period_us = 1000000.0 / freq if freq > 0 else 0.0
+        self.duty = None
+        self.phase_us = None
+        # Tick of the window's first frame; phase_us is relative to it
+        self.start_us = 0
+        # 0..1 trust in freq, used to weight this reading when fusing
+        self.confidence = edge_confidence(edges, quality) if confidence is None else confidence
+        # Frequencies consistent with the readings when aliasing was resolved (alias.py)
+        self.candidates = None
+
+    def fit(self, first_rising, frame_us=16667):
+        """Fill period_us, duty and phase_us from the edge regression; freq is left alone"""
+        result = fit_edges(self.edges, first_rising, frame_us)
+        if result is not None:
+            self.period_us, self.duty, self.phase_us = result
+        return self
+
+    def __repr__(self):
+        return "Measurement({}, {:.2f} Hz, q={:.2f}, c={:.2f}, edges={})".format(
+            self.center, self.freq, self.quality, self.confidence, len(self.edges))
+
+
+def edge_confidence(edge_times_us, quality):
+    """Confidence from sampling quality, edge count and how regular the edge spacing is"""
+    n = len(edge_times_us)
+    if n < 2:
+        return 0.0
+    if n < 3:
+        return 0.3 * quality
+    intervals = [edge_times_us[i + 1] - edge_times_us[i] for i in range(n - 1)]
+    mean = sum(intervals) / len(intervals)
+    if mean <= 0:
+        return 0.0
+    var = sum((d - mean) * (d - mean) for d in intervals) / len(intervals)
+    cv = var ** 0.5 / mean
+    return quality * max(0.0, 1.0 - cv) * min(1.0, (n - 1) / 4.0)
+
+
+def frequency_from_edges(edge_times_us, span_us):
+    """Estimate blink frequency (Hz) from edge times using the real sampled span"""
+    n = len(edge_times_us)
+    if n >= 3:
+        # Mean half-period between the first and last edge, independent of frame rate
+        half_period = (edge_times_us[-1] - edge_times_us[0]) / (n - 1)
+        if half_period > 0:
+            return 500000.0 / half_period
+    return frequency_from_count(edge_times_us, span_us)
+
+
+def frequency_from_count(edge_times_us, span_us):
+    """Full cycles (edge pairs) per second over the sampled span"""
+    if span_us <= 0:
+        return 0.0
+    return (len(edge_times_us) // 2) / (span_us / 1000000.0)
+
+
+def _half_indices(edge_times_us, frame_us=16667):
+    # Index of every edge in half-periods from the first one. A gap of about
+    # three half-periods means a frame drop hid a pair of edges, so the index
+    # skips ahead instead of assuming the edges are consecutive. Edge times
+    # are only good to a frame, so a gap has to exceed two half-periods by
+    # more than that: near Nyquist the intervals alternate between one and
+    # two frames and the median is the short one.
+    n = len(edge_times_us)
+    intervals = sorted(edge_times_us[i + 1] - edge_times_us[i] for i in range(n - 1))
+    h0 = intervals[len(intervals) // 2]
+    if h0 <= 0:
+        return None
+    idx = [0]
+    for i in range(n - 1):
+        gap = edge_times_us[i + 1] - edge_times_us[i]
+        if gap <= 2 * h0 + frame_us:
+            steps = 1
+        else:
+            steps = int(gap / h0 + 0.5)
+            if steps % 2 == 0:
+                steps += 1  # edges alternate, so a gap spans an odd number of half-periods
+        idx.append(idx[-1] + steps)
+    return idx
+
+
+def _solve3(rows, ts):
+    # Least squares t = a*r0 + b*r1 + c*r2 via the 3x3 normal equations (Cramer's rule)
+    m = [[0.0] * 3 for _ in range(3)]
+    v = [0.0] * 3
+    for r, t in zip(rows, ts):
+        for i in range(3):
+            v[i] += r[i] * t
+            for j in range(3):
+                m[i][j] += r[i] * r[j]
+
+    def det(a):
+        return (a[0][0] * (a[1][1] * a[2][2] - a[1][2] * a[2][1])
+                - a[0][1] * (a[1][0] * a[2][2] - a[1][2] * a[2][0])
+                + a[0][2] * (a[1][0] * a[2][1] - a[1][1] * a[2][0]))
+
+    d = det(m)
+    if abs(d) < 1e-9:
+        return None
+    out = []
+    for k in range(3):
+        mk = [[v[i] if j == k else m[i][j] for j in range(3)] for i in range(3)]
+        out.append(det(mk) / d)
+    return out
+
+
+def fit_edges(edge_times_us, first_rising=True, frame_us=16667):
+    """Fit period, duty cycle and phase to all edges by linear regression.
+
+    Edge k is modelled as t = t_rise + T * cycle + D * is_falling, so rising
+    and falling edges share the period T but may have any duty D / T. Points
+    more than max(3 * MAD, one frame) off the first fit are dropped and the
+    fit is redone. Returns (period_us, duty, phase_us) where phase_us is the
+    time of a rising edge modulo T, in the same time base as the edges, or
+    None with fewer than 3 edges.
+    """
+    n = len(edge_times_us)
+    if n < 3:
+        return None
+    idx = _half_indices(edge_times_us, frame_us)
+    if idx is None:
+        return None
+    offset = 0 if first_rising else 1
+    rows = []
+    for k in idx:
+        h = k + offset
+        rows.append((1.0, float(h // 2), float(h % 2)))
+    ts = [float(t) for t in edge_times_us]
+
+    for attempt in range(2):
+        has_fall = any(r[2] for r in rows)
+        has_rise = any(not r[2] for r in rows)
+        if has_fall and has_rise and len(rows) >= 3:
+            sol = _solve3(rows, ts)
+        else:
+            sol = None
+        if sol is None:
+            # Only one edge direction (or degenerate): fit half-periods, assume 50 % duty
+            k_mean = sum(r[1] * 2 + r[2] for r in rows) / len(rows)
+            t_mean = sum(ts) / len(ts)
+            num = sum((r[1] * 2 + r[2] - k_mean) * (t - t_mean) for r, t in zip(rows, ts))
+            den = sum((r[1] * 2 + r[2] - k_mean) ** 2 for r in rows)
+            if den == 0:
+                return None
+            half = num / den
+            a = t_mean - half * k_mean
+            sol = [a, 2 * half, half]
+        a, period, d = sol
+        if attempt == 1:
+            break
+        resid = [abs(t - (a + period * r[1] + d * r[2])) for r, t in zip(rows, ts)]
+        med = sorted(resid)[len(resid) // 2]
+        limit = max(3 * 1.4826 * med, frame_us)
+        keep = [i for i in range(len(rows)) if resid[i] <= limit]
+        if len(keep) == len(rows) or len(keep) < 3:
+            break
+        rows = [rows[i] for i in keep]
+        ts = [ts[i] for i in keep]
+
+    if period <= 0:
+        return None
+    duty = (d % period) / period
+    phase = a % period
+    return period, duty, phase
+
+
+def frequency_from_fit(edge_times_us, span_us, frame_us=16667):
+    """Frequency from the regression period of fit_edges; falls back to counting"""
+    fit = fit_edges(edge_times_us, True, frame_us)
+    if fit is None:
+        return frequency_from_count(edge_times_us, span_us)
+    return 1000000.0 / fit[0]
+
+
+def fit_estimator(frame_us):
+    """frequency_from_fit for frames frame_us apart, as an (edge_times_us, span_us) estimator"""
+    def estimator(edge_times_us, span_us):
+        return frequency_from_fit(edge_times_us, span_us, frame_us)
+    return estimator
+
+
+def classify_transitions(count):
+    """Two-tone classifier for a 100 ms window: <=2 transitions is 10 Hz, more is 20 Hz"""
+    if count <= 2:
+        return 10.0
+    return 20.0
+
+
+def frequencies_to_binary(freq_list):
+    """Convert frequency list to binary (20Hz = 1, 10Hz = 0)"""
+    binary_list = []
+    for freq in freq_list:
+        # Very low frequencies are read errors, treat them as 10 Hz
+        if freq < 5:
+            binary_list.append(0)
+        elif abs(freq - 20) < abs(freq - 10):
+            binary_list.append(1)  # Closer to 20Hz = 1
+        else:
+            binary_list.append(0)  # Closer to 10Hz = 0
+    return binary_list
@@ -0,0 +1,178 @@
+# fec.py
+#
+# Forward error correction for the 10/20 Hz FSK link.
+#
+# A UART frame with even parity can only tell that a bit is wrong, and the
+# only cure is to send the whole ~10 s frame again. Here each byte goes out
+# as a Hamming codeword between the start and stop bits:
+#
+#   bits = encode_frame(ord("A"))                    # 14 bits with HAMMING_12_8
+#   byte, flips = decode_frame(bits)                  # any single bit error fixed
+#   byte, flips = decode_frame(bits, reliabilities)   # soft: up to 3 with luck
+#
+# Encoding, syndromes and data extraction are all table lookups, two per
+# codeword. With per-bit reliabilities (fsk.measure_led_bit_soft) the
+# decoder also tries flipping the least reliable bits (Chase decoding) and
+# keeps the codeword that disagrees least with what was confidently seen.
+
+from array import array
+
+
+class Hamming:
+    """Hamming(n, k) code, n <= 15, with lookup tables for every step.
+
+    Bit p-1 of a codeword is position p (1..n); positions that are powers
+    of two hold parity, the others the k data bits LSB first. The syndrome
+    of a received word is the XOR of its set positions, i.e. the position
+    of a single flipped bit.
+    """
+
+    def __init__(self, n, k):
+        self.n = n
+        self.k = k
+        self.data_pos = [p for p in range(1, n + 1) if p & (p - 1)]
+        if len(self.data_pos) != k:
+            raise ValueError("no Hamming({}, {}) code".format(n, k))
+        self.encode_table = array("H", [self._encode(d) for d in range(1 << k)])
+        # Syndrome and data bits contributed by the low and the high byte of a word
+        self.syn_lo = bytearray(self._syndrome(w) for w in range(256))
+        self.syn_hi = bytearray(self._syndrome(w << 8) for w in range(256))
+        self.data_lo = array("H", [self._data(w) for w in range(256)])
+        self.data_hi = array("H", [self._data(w << 8) for w in range(256)])
+        # Syndrome -> bit to flip; 0 for a clean word, 0xFFFF if no single flip explains it
+        self.fix = array("H", [0] + [1 << (s - 1) if s <= n else 0xFFFF for s in range(1, 16)])
+
+    def _syndrome(self, word):
+        s = 0
+        for p in range(1, 16):
+            if word >> (p - 1) & 1:
+                s ^= p
+        return s
+
+    def _data(self, word):
+        d = 0
+        for i, p in enumerate(self.data_pos):
+            d |= (word >> (p - 1) & 1) << i
+        return d
+
+    def _encode(self, data):
+        word = 0
+        for i, p in enumerate(self.data_pos):
+            if data >> i & 1:
+                word |= 1 << (p - 1)
+        s = self._syndrome(word)
+        for b in range(4):
+            if s >> b & 1:
+                word |= 1 << ((1 << b) - 1)
+        return word
+
+    def encode(self, data):
+        return self.encode_table[data]
+
+    def syndrome(self, word):
+        return self.syn_lo[word & 255] ^ self.syn_hi[word >> 8]
+
+    def data(self, word):
+        return self.data_lo[word & 255] | self.data_hi[word >> 8]
+
+    def correct(self, word):
+        """The nearest codeword within one flip, or -1"""
+        fix = self.fix[self.syndrome(word)]
+        if fix == 0xFFFF:
+            return -1
+        return word ^ fix
+
+    def decode(self, word):
+        """(data, corrected codeword) for a hard word, or None if uncorrectable"""
+        cw = self.correct(word)
+        if cw < 0:
+            return None
+        return self.data(cw), cw
+
+    def decode_soft(self, word, reliabilities, chase=2):
+        """Chase decoding: (data, codeword, cost) or None.
+
+        reliabilities[i] (0..1) is how sure the receiver is of bit i of
+        word. Every combination of flips of the chase least reliable bits is
+        hard-decoded; the result that contradicts the least total
+        reliability wins.
+        """
+        order = sorted(range(self.n), key=lambda i: reliabilities[i])[:chase]
+        best = None
+        for pattern in range(1 << len(order)):
+            test = word
+            for j in range(len(order)):
+                if pattern >> j & 1:
+                    test ^= 1 << order[j]
+            cw = self.correct(test)
+            if cw < 0:
+                continue
+            diff = cw ^ word
+            cost = 0.0
+            for i in range(self.n):
+                if diff >> i & 1:
+                    cost += reliabilities[i]
+            if best is None or cost < best[2]:
+                best = (self.data(cw), cw, cost)
+        return best
+
+
+HAMMING_7_4 = Hamming(7, 4)
+HAMMING_12_8 = Hamming(12, 8)
+
+
+def word_bits(word, n):
+    """Codeword as a bit list in transmit order (position 1 first)"""
+    return [word >> i & 1 for i in range(n)]
+
+
+def bits_word(bits):
+    word = 0
+    for i, b in enumerate(bits):
+        word |= (b & 1) << i
+    return word
+
+
+def encode_frame(byte, code=HAMMING_12_8):
+    """Start bit, the byte's codeword(s), stop bit; a 4-bit code sends two nibbles, low first"""
+    bits = [0]
+    if code.k >= 8:
+        bits += word_bits(code.encode(byte), code.n)
+    else:
+        bits += word_bits(code.encode(byte & 15), code.n)
+        bits += word_bits(code.encode(byte >> 4), code.n)
+    bits.append(1)
+    return bits
+
+
+def frame_length(code=HAMMING_12_8):
+    return 2 + (code.n if code.k >= 8 else 2 * code.n)
+
+
+def decode_frame(bits, reliabilities=None, code=HAMMING_12_8, chase=2):
+    """(byte, flipped bits) from a frame of encode_frame, or None if a codeword is uncorrectable.
+
+    The start and stop bits only frame the byte; they are not checked here
+    so a wrong one does not throw away a good codeword.
+    """
+    if len(bits) < frame_length(code):
+        return None
+    words = 1 if code.k >= 8 else 2
+    byte = 0
+    flips = 0
+    for w in range(words):
+        lo = 1 + w * code.n
+        word = bits_word(bits[lo:lo + code.n])
+        if reliabilities is None:
+            res = code.decode(word)
+        else:
+            res = code.decode_soft(word, reliabilities[lo:lo + code.n], chase)
+        if res is None:
+            return None
+        data, cw = res[0], res[1]
+        byte |= data << (w * code.k)
+        diff = cw ^ word
+        while diff:
+            flips += diff & 1
+            diff >>= 1
+    return byte, flips
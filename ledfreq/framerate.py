@@ -0,0 +1,207 @@
+# framerate.py
+#
+# Choosing the sensor frame rate from the frequencies being measured.
+#
+# Every script used to run at 60 fps whatever it was looking at: 10x more
+# frames than a 1-5 Hz LED needs, and too few for anything above 25 Hz.
+# FrameRateController wraps a measure and picks the lowest supported rate
+# that still samples the fastest LED oversample times per cycle and times
+# its edges finely enough for the tolerance over one window (the same
+# quantisation error sequential.frequency_interval uses: f * frame / span).
+# After every window it re-tunes from what was measured plus the expected
+# frequencies (e.g. the agent's own), and it hands the chosen rate to the
+# inner measure as fps= so FrameMonitor, the edge fit and any stop rule
+# (sequential.py) use the same frame period as the sensor.
+#
+# An LED that speeds up past fs/2 reads as a slow one (alias.py), so the
+# readings at one rate can only ever keep or lower it. Before lowering
+# the rate, when a reading's confidence drops, and every probe_every
+# windows, one window runs a step faster and each LED's two readings are
+# resolved with alias.resolve; the rate is chosen from what that gives.
+#
+#   measure = FrameRateController(tolerance_hz=0.25, window_ms=1000)
+#   agent = Agent(..., measure=measure)
+#   ...
+#   measure.expected = [agent.freq]              # before every update
+
+from .alias import resolve
+
+RATES = (10, 15, 20, 30, 45, 60, 90, 120)
+
+
+def required_fps(freq, tolerance_hz, window_ms, oversample=2.5):
+    """Frame rate needed to measure freq to tolerance_hz in one window_ms window"""
+    if freq <= 0:
+        return 0.0
+    sampling = oversample * freq
+    timing = freq * 1000.0 / (tolerance_hz * window_ms) if tolerance_hz > 0 and window_ms > 0 else 0.0
+    return max(sampling, timing)
+
+
+class FrameRateController:
+    """Callable measure(cam, centers, duration_ms) that keeps the sensor at the cheapest adequate frame rate.
+
+    rates are the frame rates the sensor may be set to. A faster rate is
+    taken as soon as it is needed; a slower one only once the need has
+    dropped below it by the hysteresis fraction, so a frequency near a
+    boundary doesn't flip the rate every window. Readings below
+    min_confidence don't count, and with no usable frequency at all the
+    controller goes to default_fps to search. exposure_fraction, if given,
+    sets a fixed exposure of that fraction of the frame period on sensors
+    that support set_auto_exposure; shorter exposures keep fast edges
+    from smearing across two frames. stop, if given, is passed to the inner
+    measure with the current frame period. probing says whether the last
+    window was a probe one rate step up.
+    """
+
+    def __init__(self, measure=None, tolerance_hz=0.25, window_ms=1000, oversample=2.5, rates=RATES,
+                 default_fps=60, hysteresis=0.2, min_confidence=0.3, settle_ms=100, exposure_fraction=None,
+                 probe_every=10, stop=None):
+        if measure is None:
+            from .pipeline import measure_led_frequencies as measure
+        self.inner = measure
+        self.tolerance_hz = tolerance_hz
+        self.window_ms = window_ms
+        self.oversample = oversample
+        self.rates = sorted(rates)
+        self.default_fps = default_fps
+        self.hysteresis = hysteresis
+        self.min_confidence = min_confidence
+        self.settle_ms = settle_ms
+        self.exposure_fraction = exposure_fraction
+        self.probe_every = probe_every
+        self.stop = stop
+        self.expected = []
+        self.fps = None
+        self.frame_us = None
+        self.changes = 0
+        self.undersampled = False
+        self.windows = 0
+        self.probe = False
+        self.probing = False
+        self.probes = 0
+        # (fps, measurements) of the last window at the working rate
+        self.previous = None
+
+    def choose(self, freqs, current=None):
+        """Rate for a set of frequencies, with hysteresis against current (the sensor's rate by default)"""
+        need = 0.0
+        for f in freqs:
+            need = max(need, required_fps(f, self.tolerance_hz, self.window_ms, self.oversample))
+        if need <= 0:
+            return self.default_fps
+        self.undersampled = need > self.rates[-1]
+        pick = self.rates[-1]
+        for r in self.rates:
+            if r >= need:
+                pick = r
+                break
+        if current is None:
+            current = self.fps
+        if current is not None and pick < current and need * (1.0 + self.hysteresis) > pick:
+            # Not far enough below the slower rate yet; keep the lowest rate that has the margin
+            for r in self.rates:
+                if r >= need * (1.0 + self.hysteresis):
+                    return min(r, current)
+            return current
+        return pick
+
+    def apply(self, cam, fps):
+        """Set the sensor to fps (and the exposure); returns True if it changed"""
+        if fps == self.fps:
+            return False
+        cam.set_framerate(fps)
+        if self.exposure_fraction and hasattr(cam, "set_auto_exposure"):
+            cam.set_auto_exposure(False, exposure_us=int(1000000 * self.exposure_fraction / fps))
+        if self.settle_ms and self.fps is not None:
+            cam.skip_frames(time=self.settle_ms)
+        self.fps = fps
+        self.frame_us = 1000000 // fps
+        self.changes += 1
+        return True
+
+    def _usable(self, m):
+        return m.freq > 0 and m.confidence >= self.min_confidence
+
+    def step_up(self, fps):
+        """The next faster rate, or None at the top"""
+        for r in self.rates:
+            if r > fps:
+                return r
+        return None
+
+    def resolve_probe(self, base_fps, base, probe_fps, probe):
+        """Frequencies consistent with a working-rate window and a probe window.
+
+        Each LED's two readings are unfolded with alias.resolve; when that
+        leaves several candidates the lowest is taken, and an LED with no
+        consistent candidate (or no reading at the working rate) keeps its
+        probe reading.
+        """
+        before = {}
+        for m in base:
+            if self._usable(m):
+                before[tuple(m.center)] = m.freq
+        tolerance = max(0.5, 2 * self.tolerance_hz)
+        freqs = []
+        for m in probe:
+            if not self._usable(m):
+                continue
+            f0 = before.get(tuple(m.center))
+            if f0 is None:
+                freqs.append(m.freq)
+                continue
+            f, candidates = resolve([(f0, base_fps), (m.freq, probe_fps)], tolerance=tolerance)
+            if f > 0:
+                freqs.append(f)
+            elif candidates:
+                freqs.append(min(candidates))
+            else:
+                freqs.append(m.freq)
+        return freqs
+
+    def retune(self, cam, measurements):
+        """Pick the rate for what was just measured plus self.expected; returns True if it changed.
+
+        Faster rates are taken at once. A slower one, or a reading below
+        min_confidence, or the probe_every-th window, sets up a probe for
+        the next window instead.
+        """
+        expected = [f for f in self.expected if f > 0]
+        if self.probing:
+            base_fps, base = self.previous
+            freqs = self.resolve_probe(base_fps, base, self.fps, measurements) + expected
+            self.previous = None
+            return self.apply(cam, self.choose(freqs, base_fps))
+        freqs = [m.freq for m in measurements if self._usable(m)] + expected
+        pick = self.choose(freqs)
+        self.previous = (self.fps, measurements)
+        weak = any(m.freq > 0 and m.confidence < self.min_confidence for m in measurements)
+        due = self.probe_every and self.windows % self.probe_every == 0
+        if pick >= self.fps:
+            self.probe = (weak or due) and self.step_up(self.fps) is not None
+            return self.apply(cam, pick)
+        # Lowering the rate: only once a probe has ruled out an alias
+        self.probe = self.step_up(self.fps) is not None
+        if not self.probe:
+            return self.apply(cam, pick)
+        return False
+
+    def __call__(self, cam, centers, duration_ms=1000):
+        if self.fps is None:
+            self.apply(cam, self.choose(self.expected))
+        self.probing = False
+        if self.probe and self.previous is not None:
+            # One window a step faster; retune() compares it with the last working-rate window
+            self.apply(cam, self.step_up(self.fps))
+            self.probing = True
+            self.probes += 1
+        self.probe = False
+        self.windows += 1
+        if self.stop is not None:
+            self.stop.set_frame_us(self.frame_us)
+            results = self.inner(cam, centers, duration_ms, fps=self.fps, stop=self.stop)
+        else:
+            results = self.inner(cam, centers, duration_ms, fps=self.fps)
+        self.retune(cam, results)
+        return results
@@ -0,0 +1,191 @@
+# fsk.py
+#
+# 10 Hz / 20 Hz frequency-shift-keyed link: bit sampling and UART-style
+# frame decoding (start bit, 8 data bits LSB first, even parity, stop bit).
+
+from .compat import ticks_ms, ticks_diff, ticks_add, sleep_ms
+from .sample import calibrate_thresholds, sample_edges
+from .estimate import classify_transitions
+from .report import send_frequency
+
+
+def measure_led_frequency_robust(cam, led_center, duration_ms=100, threshold=None):
+    """Classify one short window as 10 Hz or 20 Hz from its transition count.
+
+    Returns (frequency, transition count). Pass a threshold to skip the
+    10-frame calibration that otherwise precedes every window.
+    """
+    if threshold is None:
+        threshold = calibrate_thresholds(cam, [led_center])[0]
+    edges, _ = sample_edges(cam, [led_center], duration_ms, [threshold])
+    count = len(edges[0])
+    return classify_transitions(count), count
+
+
+def soft_bit(edges, max_transitions=2, boundary=15.0, spread=5.0):
+    """(bit, reliability 0..1) for one window's edge times.
+
+    The bit is the transition-count decision of classify_transitions. The
+    reliability works like a scaled log-likelihood ratio: 0.5 for a count
+    next to the boundary, rising with every further transition, and lowered
+    when the edge spacing points at the other tone (a dropped frame or a
+    bit boundary inside the window changes the count by one but not the
+    spacing of the remaining edges). A miss next to the boundary is only a
+    little more likely than one further out, so the range is kept narrow;
+    the FEC decoder then trades one confident bit against two doubtful
+    ones, not three.
+    """
+    count = len(edges)
+    bit = 1 if count > max_transitions else 0
+    away = count - max_transitions - 1 if bit else max_transitions - count
+    r = 0.5 + 0.5 * min(1.0, away / 3.0)
+    if count >= 2 and edges[-1] > edges[0]:
+        freq = 500000.0 * (count - 1) / (edges[-1] - edges[0])
+        agree = min(1.0, abs(freq - boundary) / spread)
+        if (freq > boundary) != bool(bit):
+            agree = -agree
+        r *= 0.8 + 0.2 * agree
+    return bit, r
+
+
+def measure_led_bit_soft(cam, led_center, duration_ms=100, threshold=None, max_transitions=2):
+    """One FSK bit with its reliability, for fec.decode_frame; returns (bit, reliability)"""
+    if threshold is None:
+        threshold = calibrate_thresholds(cam, [led_center])[0]
+    edges, _ = sample_edges(cam, [led_center], duration_ms, [threshold])
+    return soft_bit(edges[0], max_transitions)
+
+
+def send_fsk_bits(uart, bits, bit_ms=1000, freqs=(10.0, 20.0), verbose=False):
+    """Transmit bits through the driver, one tone per bit_ms (the encoder side of the link)"""
+    due = ticks_ms()
+    for bit in bits:
+        send_frequency(uart, freqs[bit], verbose)
+        due = ticks_add(due, bit_ms)
+        wait = ticks_diff(due, ticks_ms())
+        if wait > 0:
+            sleep_ms(wait)
+
+
+def wait_for_frequency_sync(cam, led_center, timeout_ms=5000, threshold=None):
+    """Wait for a frequency transition to synchronize timing; True if one was seen"""
+    initial_freq, _ = measure_led_frequency_robust(cam, led_center, 100, threshold)
+    start_time = ticks_ms()
+    while ticks_diff(ticks_ms(), start_time) < timeout_ms:
+        current_freq, _ = measure_led_frequency_robust(cam, led_center, 100, threshold)
+        if current_freq != initial_freq:
+            return True
+    return False
+
+
+def binary_to_ascii(binary_list):
+    """Convert binary list (MSB first, 8 bits per char) to ASCII characters"""
+    ascii_chars = []
+    for i in range(0, len(binary_list), 8):
+        byte_bits = binary_list[i:i + 8]
+        # If we don't have 8 bits, pad with zeros
+        while len(byte_bits) < 8:
+            byte_bits.append(0)
+        decimal_value = 0
+        for bit in byte_bits:
+            decimal_value = (decimal_value << 1) | bit
+        if 32 <= decimal_value <= 126:  # Printable ASCII range
+            ascii_chars.append(chr(decimal_value))
+        else:
+            ascii_chars.append("[{}]".format(decimal_value))  # Non-printable characters
+    return ascii_chars
+
+
+def validate_uart_frame(bits, verbose=True):
+    """Validate UART frame with start, parity, and stop bits; returns the byte or None"""
+    if len(bits) < 11:  # Need at least 11 bits for a complete frame
+        return None
+    if bits[0] != 0:
+        if verbose:
+            print("Invalid start bit")
+        return None
+    if bits[10] != 1:
+        if verbose:
+            print("Invalid stop bit")
+        return None
+    # Even parity over the data bits
+    data_bits = bits[1:9]
+    expected_parity = sum(data_bits) & 1
+    if bits[9] != expected_parity:
+        if verbose:
+            print("Parity check failed")
+        return None
+    byte = 0
+    for i, bit in enumerate(data_bits):
+        byte |= (bit << i)
+    return byte
+
+
+def uart_frame(byte):
+    """The 11 bits validate_uart_frame expects for byte"""
+    data = [byte >> i & 1 for i in range(8)]
+    return [0] + data + [sum(data) & 1, 1]
+
+
+def byte_to_char(byte):
+    """Printable character for byte, or "[n]" for anything else"""
+    return chr(byte) if 32 <= byte <= 126 else "[{}]".format(byte)
+
+
+class PartialFrame:
+    """The bits of one frame received so far, kept in a form a checkpoint can carry over a restart.
+
+    start_ms is the wall time (checkpoint.wall_ms) at which slot 0 started,
+    i.e. when the frequency sync before the frame returned, and bit k is
+    measured sample_ms into slot k: wait until next_ms() before each bit,
+    so a slow measurement can't push the later bits into the wrong slots.
+    After a restart, catch_up() fills the slots whose sampling time went by
+    unobserved with erasures, bit 0 at reliability 0, so decoding resumes
+    at the right bit and fec.decode_frame can often fill them in from the
+    rest.
+    """
+
+    def __init__(self, length, bit_ms=1000, start_ms=None, sample_ms=0):
+        self.length = length
+        self.bit_ms = bit_ms
+        self.start_ms = start_ms
+        self.sample_ms = sample_ms
+        self.bits = []
+        self.reliabilities = []
+
+    def add(self, bit, reliability=1.0):
+        self.bits.append(bit)
+        self.reliabilities.append(reliability)
+
+    def complete(self):
+        return len(self.bits) >= self.length
+
+    def next_ms(self):
+        """Wall time at which the next bit is due to be measured"""
+        return self.start_ms + len(self.bits) * self.bit_ms + self.sample_ms
+
+    def catch_up(self, now_ms):
+        """Erase the slots without a bit whose sampling time is before now_ms; returns how many"""
+        if self.start_ms is None:
+            return 0
+        late = now_ms - self.start_ms - self.sample_ms
+        due = min(self.length, late // self.bit_ms + 1) if late >= 0 else 0
+        missed = 0
+        while len(self.bits) < due:
+            self.add(0, 0.0)
+            missed += 1
+        return missed
+
+    def state(self):
+        return {"length": self.length, "bit_ms": self.bit_ms, "start_ms": self.start_ms, "bits": self.bits,
+                "reliabilities": self.reliabilities}
+
+    def restore(self, state):
+        """Continue the frame from state(); False if it is a frame of another length"""
+        if not state or state.get("length") != self.length:
+            return False
+        self.bit_ms = state["bit_ms"]
+        self.start_ms = state["start_ms"]
+        self.bits = list(state["bits"])
+        self.reliabilities = list(state["reliabilities"])
+        return True
@@ -0,0 +1,104 @@
+# jitter.py
+#
+# Frame-interval monitor for the measurement loops.
+#
+# sensor.snapshot() does not return at a perfectly steady rate (prints in the
+# loop, GC, USB traffic), so counting transitions over a nominal duration is
+# biased. FrameMonitor records the real time of every frame, keeps a small
+# histogram of frame intervals, counts dropped and duplicated frames and turns
+# that into a 0..1 sampling-quality score.
+#
+#   mon = FrameMonitor(fps=60)
+#   while ...:
+#       img = sensor.snapshot()
+#       t = mon.frame(ticks_us())   # us since the first frame
+#   mon.quality()
+#
+# frame() returns times relative to the first frame of the window so callers
+# can do plain integer arithmetic on them without worrying about tick wrap.
+
+from array import array
+
+from .compat import ticks_diff
+
+
+class FrameMonitor:
+    def __init__(self, fps=60, bins=16):
+        self.nominal_us = 1000000 // fps
+        # Each bin is a quarter of the nominal interval, the last bin is overflow
+        self.bin_us = max(1, self.nominal_us // 4)
+        self.hist = array("H", [0] * bins)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.hist)):
+            self.hist[i] = 0
+        self.frames = 0
+        self.intervals = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.first_us = 0
+        self.last_us = 0
+        self.min_us = 0
+        self.max_us = 0
+        self._sum_dev = 0
+
+    def frame(self, t_us):
+        """Record a frame captured at tick t_us and return its time (us) since the first frame"""
+        if self.frames == 0:
+            self.first_us = t_us
+            self.last_us = t_us
+            self.frames = 1
+            return 0
+        dt = ticks_diff(t_us, self.last_us)
+        b = dt // self.bin_us
+        if b >= len(self.hist):
+            b = len(self.hist) - 1
+        if self.hist[b] < 65535:
+            self.hist[b] += 1
+        if self.intervals == 0 or dt < self.min_us:
+            self.min_us = dt
+        if dt > self.max_us:
+            self.max_us = dt
+        self.intervals += 1
+        nominal = self.nominal_us
+        if dt > nominal + nominal // 2:
+            # Round to the number of whole frame periods that were skipped
+            self.dropped += (dt + nominal // 2) // nominal - 1
+        elif dt < nominal // 2:
+            self.duplicates += 1
+        self._sum_dev += abs(dt - nominal)
+        self.frames += 1
+        self.last_us = t_us
+        return ticks_diff(t_us, self.first_us)
+
+    def span_us(self):
+        """Time between the first and last recorded frame"""
+        return ticks_diff(self.last_us, self.first_us)
+
+    def mean_interval_us(self):
+        if self.intervals == 0:
+            return self.nominal_us
+        return self.span_us() / self.intervals
+
+    def quality(self):
+        """Sampling-quality score in 0..1 (1 = every frame on time)"""
+        if self.intervals == 0:
+            return 0.0
+        expected = self.intervals + self.dropped
+        good = self.intervals - self.duplicates
+        score = good / expected
+        # Penalise average deviation from the nominal interval
+        jitter = self._sum_dev / self.intervals / self.nominal_us
+        if jitter > 1.0:
+            jitter = 1.0
+        score *= 1.0 - 0.5 * jitter
+        return max(0.0, score)
+
+    def histogram(self):
+        """Return [(bin start us, count), ...] for the non-empty bins"""
+        return [(i * self.bin_us, n) for i, n in enumerate(self.hist) if n]
+
+    def report(self):
+        return "frames={} dropped={} dup={} dt_us={}..{} q={:.2f}".format(
+            self.frames, self.dropped, self.duplicates, self.min_us, self.max_us, self.quality())
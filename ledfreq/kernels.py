@@ -0,0 +1,235 @@
+# kernels.py
+#
+# Per-pixel inner loops of the edge sampler, on raw frame buffers.
+#
+# sample_edges used to cost one get_pixel call, a tuple check, a float
+# comparison and a list lookup per tracked pixel per frame, all in
+# bytecode, which is what capped how many pixels fit in a frame. Here the
+# pixels are gathered straight out of img.bytearray() through a table of
+# framebuffer offsets, and thresholding and edge timing run over integer
+# arrays:
+#
+#   k = EdgeKernel(thresholds, centers, debounce_us=5000)
+#   k.start(k.read(img))
+#   count = k.step(k.read(img), edge_time)   # k.changed[:count]: centers with a new edge at edge_time
+#
+# On MicroPython gather() and edge_step() come from kernels_viper.py,
+# compiled to machine code by the viper emitter; on CPython, or a firmware
+# without it, the Python versions below run instead. They give the same
+# results (COMPILED says which are in use), and bench() times both:
+#
+#   micropython -c "from ledfreq import kernels; kernels.bench()"     # MicroPython unix port
+#
+# Thresholds become integer levels: a pixel turns on at v >= on_level and
+# off at v < off_level, which for a threshold t and hysteresis h is
+# v > t + h and v <= t - h. With h = 0 that is exactly the v > t test of
+# sample_edges. Frames without bytearray(), or that aren't one byte per
+# pixel, are read with get_pixel as before.
+#
+# same() and copy() compare and copy byte runs between buffers at given
+# offsets, for stream.py's row coding: slicing a bytearray allocates a new
+# one on MicroPython, every row of every frame.
+
+import math
+import sys
+from array import array
+
+from .compat import ticks_us, ticks_diff
+
+# state bits
+LEVEL = 1
+HAS_EDGE = 2
+
+
+def py_gather(buf, index, out, n):
+    """out[i] = buf[index[i]] for i < n"""
+    for i in range(n):
+        out[i] = buf[index[i]]
+
+
+def py_gather_pixels(img, xs, ys, out, n):
+    """out[i] = the grey level at (xs[i], ys[i]), through get_pixel"""
+    for i in range(n):
+        v = img.get_pixel(xs[i], ys[i])
+        if isinstance(v, tuple):
+            v = v[0]
+        out[i] = v
+
+
+def py_edge_step(values, n, on_level, off_level, state, last, t_edge, debounce, out):
+    """Threshold values[:n] against the levels and time the flips; returns how many were recorded.
+
+    A flip is recorded at t_edge when it is the first edge of its pixel or
+    more than debounce after the last recorded one; the level follows the
+    pixel either way. The recorded indices go into out[:count].
+    """
+    k = 0
+    for i in range(n):
+        v = values[i]
+        s = state[i]
+        if s & LEVEL:
+            if v >= off_level[i]:
+                continue
+        elif v < on_level[i]:
+            continue
+        s ^= LEVEL
+        if not s & HAS_EDGE or t_edge - last[i] > debounce:
+            last[i] = t_edge
+            s |= HAS_EDGE
+            out[k] = i
+            k += 1
+        state[i] = s
+    return k
+
+
+def py_same(a, a_at, b, b_at, n):
+    """True if a[a_at:a_at + n] and b[b_at:b_at + n] hold the same bytes"""
+    return a[a_at:a_at + n] == b[b_at:b_at + n]
+
+
+def py_copy(dst, dst_at, src, src_at, n):
+    """dst[dst_at:dst_at + n] = src[src_at:src_at + n]"""
+    dst[dst_at:dst_at + n] = src[src_at:src_at + n]
+
+
+gather = py_gather
+gather_pixels = py_gather_pixels
+edge_step = py_edge_step
+same = py_same
+copy = py_copy
+COMPILED = False
+
+if sys.implementation.name == "micropython":
+    try:
+        from .kernels_viper import gather, gather_pixels, edge_step, same, copy
+        COMPILED = True
+    except Exception:
+        # No native emitter in this firmware (the viper decorators fail at import)
+        pass
+
+
+def switch_levels(threshold, hysteresis=0):
+    """(on_level, off_level) of a threshold, clipped to 0..256"""
+    on = int(math.floor(threshold + hysteresis)) + 1
+    off = int(math.floor(threshold - hysteresis)) + 1
+    return min(256, max(0, on)), min(256, max(0, off))
+
+
+class PixelReader:
+    """Reads the grey level of the pixels (xs[i], ys[i]) out of frames, from the frame buffer when it can"""
+
+    def __init__(self, xs, ys):
+        self.n = len(xs)
+        self.xs = array("H", xs)
+        self.ys = array("H", ys)
+        # Framebuffer offsets, built for the first frame size seen
+        self.index = array("I", bytes(4 * self.n))
+        self.width = 0
+        self.height = 0
+        self.in_frame = False
+
+    def _buffer(self, img):
+        # The frame's bytes if it is one byte per pixel and every pixel is in it, else None
+        if not hasattr(img, "bytearray"):
+            return None
+        w = img.width()
+        h = img.height()
+        if w != self.width or h != self.height:
+            self.width = w
+            self.height = h
+            self.in_frame = True
+            for i in range(self.n):
+                if self.xs[i] >= w or self.ys[i] >= h:
+                    # Unchecked reads past the buffer are not an option; get_pixel handles these
+                    self.in_frame = False
+                    break
+                self.index[i] = self.ys[i] * w + self.xs[i]
+        if not self.in_frame:
+            return None
+        buf = img.bytearray()
+        return buf if len(buf) == w * h else None
+
+    def read(self, img, out):
+        """Fill out (a bytearray of n) from img; returns out"""
+        buf = self._buffer(img)
+        if buf is not None:
+            gather(buf, self.index, out, self.n)
+        else:
+            gather_pixels(img, self.xs, self.ys, out, self.n)
+        return out
+
+
+class EdgeKernel:
+    """Buffers and state for running the kernels over a fixed set of centers.
+
+    Everything is allocated here, so read() and step() allocate nothing
+    themselves; values, changed and the edge bookkeeping are reused every
+    frame. Without centers only step() is available, for values read
+    elsewhere (e.g. FramePool slots).
+    """
+
+    def __init__(self, thresholds, centers=None, debounce_us=5000, hysteresis=0):
+        n = len(thresholds)
+        self.n = n
+        self.pixels = PixelReader([c[0] for c in centers], [c[1] for c in centers]) if centers is not None else None
+        self.debounce_us = debounce_us
+        self.on_level = array("H", bytes(2 * n))
+        self.off_level = array("H", bytes(2 * n))
+        self.set_thresholds(thresholds, hysteresis)
+        self.values = bytearray(n)
+        self.state = bytearray(n)
+        self.last = array("i", bytes(4 * n))
+        self.changed = array("i", bytes(4 * n))
+
+    def set_thresholds(self, thresholds, hysteresis=0):
+        self.thresholds = thresholds
+        for i in range(self.n):
+            self.on_level[i], self.off_level[i] = switch_levels(thresholds[i], hysteresis)
+
+    def read(self, img):
+        """The grey level of every center in img, into self.values"""
+        return self.pixels.read(img, self.values)
+
+    def start(self, values):
+        """Take each center's level from the first frame (above its threshold = on) and forget past edges"""
+        for i in range(self.n):
+            self.state[i] = LEVEL if values[i] > self.thresholds[i] else 0
+
+    def level(self, i):
+        return bool(self.state[i] & LEVEL)
+
+    def step(self, values, t_edge):
+        """Threshold one frame; returns the count of centers in self.changed with an edge recorded at t_edge"""
+        return edge_step(values, self.n, self.on_level, self.off_level, self.state, self.last, t_edge,
+                         self.debounce_us, self.changed)
+
+
+def bench(n=256, frames=200, width=320, height=320):
+    """Time the Python and the active kernels on synthetic frames; prints and returns us per frame of each"""
+    frame_a = bytearray(width * height)
+    frame_b = bytearray(width * height)
+    step = max(1, (width * height) // n)
+    index = array("I", [i * step for i in range(n)])
+    for i in range(n):
+        frame_a[index[i]] = 20
+        frame_b[index[i]] = 230 if i & 1 else 20
+    on_level = array("H", [128] * n)
+    off_level = array("H", [128] * n)
+    values = bytearray(n)
+    changed = array("i", bytes(4 * n))
+    results = []
+    for name, g, e in (("python", py_gather, py_edge_step), ("active", gather, edge_step)):
+        state = bytearray(n)
+        last = array("i", bytes(4 * n))
+        t0 = ticks_us()
+        for f in range(frames):
+            g(frame_b if f & 1 else frame_a, index, values, n)
+            e(values, n, on_level, off_level, state, last, f * 16667, 5000, changed)
+        us = ticks_diff(ticks_us(), t0) / frames
+        results.append(us)
+        print("{:7} {:9.1f} us/frame {:7.3f} us/pixel".format(name, us, us / n))
+    if COMPILED:
+        print("speedup {:.1f}x".format(results[0] / results[1] if results[1] else 0.0))
+    else:
+        print("no compiled kernels here, both rows are the Python versions")
+    return results
@@ -0,0 +1,61 @@
+# kernels_viper.py
+#
+# Viper builds of the kernels in kernels.py, imported from there on
+# MicroPython only. Same arguments and results as the py_* versions; the
+# buffers must be exactly the types EdgeKernel allocates (bytearray or
+# frame buffer for values, array('I') offsets, array('H') levels,
+# array('i') times and indices), since viper reads them as raw memory with
+# no bounds checks; same() and copy() take bytearrays or frame buffers.
+
+import micropython
+
+
+@micropython.viper
+def gather(buf: ptr8, index: ptr32, out: ptr8, n: int):
+    for i in range(n):
+        out[i] = buf[index[i]]
+
+
+@micropython.native
+def gather_pixels(img, xs, ys, out, n):
+    for i in range(n):
+        v = img.get_pixel(xs[i], ys[i])
+        if isinstance(v, tuple):
+            v = v[0]
+        out[i] = v
+
+
+@micropython.viper
+def edge_step(values: ptr8, n: int, on_level: ptr16, off_level: ptr16, state: ptr8, last: ptr32, t_edge: int,
+              debounce: int, out: ptr32) -> int:
+    k = 0
+    for i in range(n):
+        v = values[i]
+        s = state[i]
+        if s & 1:
+            if v >= off_level[i]:
+                continue
+        elif v < on_level[i]:
+            continue
+        s ^= 1
+        if (s & 2) == 0 or t_edge - last[i] > debounce:
+            last[i] = t_edge
+            s |= 2
+            out[k] = i
+            k += 1
+        state[i] = s
+    return k
+
+
+@micropython.viper
+def same(a: ptr8, a_at: int, b: ptr8, b_at: int, n: int) -> bool:
+    for i in range(n):
+        if a[a_at + i] != b[b_at + i]:
+            return False
+    return True
+
+
+@micropython.viper
+def copy(dst: ptr8, dst_at: int, src: ptr8, src_at: int, n: int):
+    for i in range(n):
+        dst[dst_at + i] = src[src_at + i]
@@ -0,0 +1,376 @@
+# localize.py
+#
+# Finding LED positions in the frame.
+
+from array import array
+
+from .compat import ticks_ms, ticks_us, ticks_diff
+
+# Grayscale band for bright LEDs on the default palette
+BRIGHT_THRESHOLDS = [(200, 255)]
+# LAB band used (inverted) on the EVT palettes
+EVT_THRESHOLDS = [(10, 20, -10, 10, -20, 0)]
+
+
+class BlobTracker:
+    """Blob detector that remembers the last confirmed LED set.
+
+    Once the largest num_leds blobs have stayed within `tolerance` px for
+    stable_frames frames that show them, the set is converged and later
+    frames only search a small ROI around each cached center. A full-frame
+    search runs again every full_sweep_every frames, so new LEDs are picked
+    up, and on the frame after a cached LED has been missed in max_misses
+    lit frames in a row (frames where another cached LED was found), or
+    after max_misses frames where none was, so an LED that moved out of its
+    ROI is found again. A blinking LED that is simply off costs a full
+    search now and then, not its place in the set.
+    """
+
+    def __init__(self, thresholds=BRIGHT_THRESHOLDS, invert=False, pixels_threshold=10, area_threshold=10,
+                 num_leds=1, stable_frames=3, tolerance=2, roi_radius=12, full_sweep_every=30,
+                 max_misses=5, width=320, height=320):
+        self.thresholds = thresholds
+        self.invert = invert
+        self.pixels_threshold = pixels_threshold
+        self.area_threshold = area_threshold
+        self.num_leds = num_leds
+        self.stable_frames = stable_frames
+        self.tolerance = tolerance
+        self.roi_radius = roi_radius
+        self.full_sweep_every = full_sweep_every
+        self.max_misses = max_misses
+        self.width = width
+        self.height = height
+        self.centers = []
+        self.blobs = []
+        self.converged = False
+        # Last frame searched, for drawing
+        self.img = None
+        self._stable = 0
+        self._frame = 0
+        # Consecutive ROI misses of each cached center, and ROI frames with no LED at all
+        self._misses = []
+        self._dark = 0
+        self._sweep = False
+
+    def _find(self, img, roi=None):
+        if roi is None:
+            return img.find_blobs(self.thresholds, invert=self.invert, pixels_threshold=self.pixels_threshold,
+                                  area_threshold=self.area_threshold, merge=True)
+        return img.find_blobs(self.thresholds, invert=self.invert, pixels_threshold=self.pixels_threshold,
+                              area_threshold=self.area_threshold, merge=True, roi=roi)
+
+    def _roi(self, center):
+        r = self.roi_radius
+        x = max(0, center[0] - r)
+        y = max(0, center[1] - r)
+        return (x, y, min(self.width, center[0] + r + 1) - x, min(self.height, center[1] + r + 1) - y)
+
+    def _near(self, a, b):
+        return abs(a[0] - b[0]) <= self.tolerance and abs(a[1] - b[1]) <= self.tolerance
+
+    def step(self, img):
+        """Search one frame; returns the current best centers (possibly cached)"""
+        self._frame += 1
+        self.img = img
+        full = (not self.converged) or self._sweep or self._frame % self.full_sweep_every == 0
+        if full:
+            blobs = self._find(img)
+            self._misses = [0] * len(self.centers)
+            self._dark = 0
+            self._sweep = False
+        else:
+            blobs = []
+            missed = []
+            for i in range(len(self.centers)):
+                found = self._find(img, self._roi(self.centers[i]))
+                if found:
+                    blobs.append(max(found, key=lambda b: b.pixels()))
+                    self._misses[i] = 0
+                else:
+                    missed.append(i)
+            if blobs:
+                self._dark = 0
+                for i in missed:
+                    self._misses[i] += 1
+                    if self._misses[i] >= self.max_misses:
+                        self._sweep = True
+            else:
+                self._dark += 1
+                if self._dark >= self.max_misses:
+                    self._sweep = True
+        if not blobs:
+            # LEDs off in this frame (they blink): keep the cached set as is
+            return self.centers
+        blobs = sorted(blobs, key=lambda b: b.pixels(), reverse=True)[:self.num_leds]
+        centers = [(int(b.cx()), int(b.cy())) for b in blobs]
+        new = [c for c in centers if not any(self._near(c, old) for old in self.centers)]
+        if not new:
+            # Every blob is a known LED; only a complete set counts towards stability
+            if len(centers) == len(self.centers):
+                self._stable += 1
+                self.blobs = blobs
+        else:
+            # Something appeared or moved: keep the cached LEDs not seen this frame
+            kept = [old for old in self.centers if not any(self._near(old, c) for c in centers)]
+            self.centers = (centers + kept)[:self.num_leds]
+            self._misses = [0] * len(self.centers)
+            self.blobs = blobs
+            self._stable = 1 if len(centers) == len(self.centers) else 0
+            self.converged = False
+        if self._stable >= self.stable_frames and len(self.centers) == self.num_leds:
+            self.converged = True
+        return self.centers
+
+    def detect(self, cam, timeout_ms=2000):
+        """Step until converged or timeout_ms; returns the centers found"""
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < timeout_ms:
+            self.step(cam.snapshot())
+            if self.converged:
+                break
+        return self.centers
+
+    def draw(self, img):
+        for blob in self.blobs:
+            img.draw_rectangle(blob.rect(), color=(255, 0, 0))
+            img.draw_cross(blob.cx(), blob.cy(), color=(0, 255, 0))
+
+
+def detect_led_center_via_blobs(cam, duration_s=2, thresholds=BRIGHT_THRESHOLDS, invert=False,
+                                pixels_threshold=10, area_threshold=10, draw=True, tracker=None):
+    """Return the center of the largest blob, or None.
+
+    Returns as soon as the position has been stable for a few frames;
+    duration_s is only the upper bound. Pass a BlobTracker to reuse its cache.
+    """
+    if tracker is None:
+        tracker = BlobTracker(thresholds, invert, pixels_threshold, area_threshold, num_leds=1)
+    centers = tracker.detect(cam, duration_s * 1000)
+    if not centers:
+        return None
+    if draw and tracker.img is not None:
+        tracker.draw(tracker.img)
+    return centers[0]
+
+
+def detect_led_centers_via_blobs(cam, num_leds=2, duration_s=2, thresholds=EVT_THRESHOLDS, invert=True,
+                                 pixels_threshold=10, area_threshold=100, draw=True, tracker=None):
+    """Return up to num_leds blob centers, largest first; stops once they are stable"""
+    if tracker is None:
+        tracker = BlobTracker(thresholds, invert, pixels_threshold, area_threshold, num_leds=num_leds)
+    centers = tracker.detect(cam, duration_s * 1000)
+    if draw and centers and tracker.img is not None:
+        tracker.draw(tracker.img)
+    return centers
+
+
+def find_led_center(cam, num_frames=10, width=320, height=320):
+    """Return the pixel with the highest intensity variance over num_frames"""
+    size = width * height
+    sum_img = array("H", bytes(2 * size))
+    sum_sq_img = array("I", bytes(4 * size))
+
+    for _ in range(num_frames):
+        img = cam.snapshot()
+        i = 0
+        for y in range(height):
+            for x in range(width):
+                val = img.get_pixel(x, y)
+                sum_img[i] += val
+                sum_sq_img[i] += val * val
+                i += 1
+
+    max_var = -1
+    max_i = 0
+    for i in range(size):
+        # num_frames^2 * variance, avoids floats in the scan
+        var = num_frames * sum_sq_img[i] - sum_img[i] * sum_img[i]
+        if var > max_var:
+            max_var = var
+            max_i = i
+    return (max_i % width, max_i // width)
+
+
+# --- Activity map ---
+
+class Candidate:
+    """A cluster of blinking cells: center (px), preliminary freq (Hz), summed activity and cell count"""
+
+    def __init__(self, center, freq, activity, cells):
+        self.center = center
+        self.freq = freq
+        self.activity = activity
+        self.cells = cells
+
+
+class ActivityMap:
+    """Decaying per-cell toggle counts from consecutive frames.
+
+    The frame is sampled on a grid of step x step px cells. A cell toggles
+    when its grey level moves by more than diff in the opposite direction
+    to its last big move, so only blinking shows up: static bright objects,
+    the palette and the ambient level never change between frames. activity
+    is halved every decay_frames frames so old activity fades; edges counts
+    every toggle since reset() for the frequency estimate.
+
+    Event sources can feed toggles directly with add_event().
+    """
+
+    def __init__(self, step=4, diff=40, decay_frames=30, width=320, height=320):
+        self.step = step
+        self.diff = diff
+        self.decay_frames = decay_frames
+        self.width = width
+        self.height = height
+        self.cols = width // step
+        self.rows = height // step
+        cells = self.cols * self.rows
+        # Framebuffer offset of every cell's sample pixel
+        self.index = array("I", [(r * step + step // 2) * width + c * step + step // 2
+                                 for r in range(self.rows) for c in range(self.cols)])
+        self.prev = bytearray(cells)
+        self.dir = bytearray(cells)
+        self.activity = array("H", bytes(2 * cells))
+        self.edges = array("H", bytes(2 * cells))
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.activity)):
+            self.activity[i] = 0
+            self.edges[i] = 0
+            self.dir[i] = 0
+        self.frames = 0
+        self.first_us = 0
+        self.last_us = 0
+
+    def _toggle(self, i):
+        if self.activity[i] < 65535:
+            self.activity[i] += 1
+        if self.edges[i] < 65535:
+            self.edges[i] += 1
+
+    def step_frame(self, img, t_us=None):
+        """Add one frame to the map"""
+        if t_us is None:
+            t_us = ticks_us()
+        buf = img.bytearray() if hasattr(img, "bytearray") else None
+        index = self.index
+        prev = self.prev
+        direction = self.dir
+        diff = self.diff
+        cols = self.cols
+        step = self.step
+        half = step // 2
+        first = self.frames == 0
+        for i in range(len(index)):
+            if buf is not None:
+                v = buf[index[i]]
+            else:
+                v = img.get_pixel((i % cols) * step + half, (i // cols) * step + half)
+            if not first:
+                d = v - prev[i]
+                if d > diff:
+                    if direction[i] != 1:
+                        self._toggle(i)
+                        direction[i] = 1
+                elif d < -diff:
+                    if direction[i] != 2:
+                        self._toggle(i)
+                        direction[i] = 2
+            prev[i] = v
+        if first:
+            self.first_us = t_us
+        self.last_us = t_us
+        self.frames += 1
+        if self.decay_frames and self.frames % self.decay_frames == 0:
+            for i in range(len(self.activity)):
+                self.activity[i] >>= 1
+
+    def add_event(self, x, y):
+        """Count one polarity change at pixel (x, y) from an event source"""
+        c = x // self.step
+        r = y // self.step
+        if 0 <= c < self.cols and 0 <= r < self.rows:
+            self._toggle(r * self.cols + c)
+
+    def span_us(self):
+        return ticks_diff(self.last_us, self.first_us)
+
+    def candidates(self, min_activity=4, num_leds=None):
+        """Clusters of 8-connected cells with activity >= min_activity, most active first.
+
+        The center is the activity-weighted mean of the cells; freq comes
+        from the busiest cell's edge count over the mapped time (two edges
+        per cycle), 0 if no time has passed.
+        """
+        cols = self.cols
+        rows = self.rows
+        seen = bytearray(len(self.activity))
+        span = self.span_us()
+        found = []
+        for start in range(len(self.activity)):
+            if seen[start] or self.activity[start] < min_activity:
+                continue
+            seen[start] = 1
+            stack = [start]
+            total = 0
+            sx = 0
+            sy = 0
+            cells = 0
+            peak = 0
+            while stack:
+                i = stack.pop()
+                a = self.activity[i]
+                c = i % cols
+                r = i // cols
+                total += a
+                sx += a * c
+                sy += a * r
+                cells += 1
+                if self.edges[i] > peak:
+                    peak = self.edges[i]
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        rr = r + dr
+                        cc = c + dc
+                        if 0 <= rr < rows and 0 <= cc < cols:
+                            j = rr * cols + cc
+                            if not seen[j] and self.activity[j] >= min_activity:
+                                seen[j] = 1
+                                stack.append(j)
+            half = self.step // 2
+            center = (int(sx * self.step / total) + half, int(sy * self.step / total) + half)
+            freq = peak * 500000.0 / span if span > 0 else 0.0
+            found.append(Candidate(center, freq, total, cells))
+        found.sort(key=lambda k: k.activity, reverse=True)
+        return found if num_leds is None else found[:num_leds]
+
+    def detect(self, cam, duration_ms=1000):
+        """Map duration_ms of frames from cam"""
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < duration_ms:
+            self.step_frame(cam.snapshot())
+        return self
+
+
+def detect_led_centers_via_activity(cam, num_leds=2, duration_ms=1000, step=4, diff=40, min_activity=4,
+                                    draw=True, activity_map=None):
+    """Return up to num_leds centers of blinking regions, most active first.
+
+    Unlike the blob detectors this needs no brightness band, so it works
+    on any palette and ignores lamps, reflections and other steady bright
+    spots. Pass an ActivityMap to reuse its buffers or read its candidates.
+    """
+    if activity_map is None:
+        activity_map = ActivityMap(step, diff)
+    activity_map.reset()
+    activity_map.detect(cam, duration_ms)
+    found = activity_map.candidates(min_activity, num_leds)
+    if draw and found:
+        img = cam.snapshot()
+        r = activity_map.step
+        for k in found:
+            img.draw_cross(k.center[0], k.center[1], color=(0, 255, 0))
+            img.draw_circle(k.center[0], k.center[1], r * 2, color=(255, 0, 0))
+    return [k.center for k in found]
@@ -0,0 +1,194 @@
+# memcheck.py
+#
+# Allocation check for the memory-bounded loops in bounded.py.
+#
+#   import ledfreq.memcheck as m; m.run()      # on the camera
+#   micropython -m ledfreq.memcheck            # MicroPython unix port
+#   python -m ledfreq.memcheck                 # desktop
+#
+# Each loop is run over a short and a long window against StaticCamera, an
+# allocation-free stand-in for the sensor, and the difference in heap use is
+# divided by the difference in frames. That cancels the fixed cost of the
+# call itself and leaves what one more frame costs.
+#
+# On MicroPython the heap is measured with gc.mem_alloc() while the GC is
+# disabled, so every allocation counts, freed or not. CPython boxes every
+# int above 256, which MicroPython doesn't, so there the peak traced memory
+# during the call (tracemalloc) is compared instead: it catches lists and
+# buffers that grow with the window, not short-lived temporaries. The peak
+# of two runs can still differ by one boxed int whatever their length, so
+# CPython gets SLACK bytes before a difference counts.
+
+import gc
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+MICROPYTHON = sys.implementation.name == "micropython"
+SLACK = 0 if MICROPYTHON else 64
+
+
+class StaticImage:
+    def __init__(self):
+        self.value = 20
+
+    def get_pixel(self, x, y):
+        return self.value
+
+
+class StaticCamera:
+    """Reuses one image whose pixels toggle every `half` frames; nothing is allocated per snapshot.
+
+    On the desktop it also drives a virtual clock, so windows last
+    `period_us` per frame, while it is used as a context manager; the
+    previous clock is put back on exit:
+
+        with StaticCamera() as cam:
+            bytes_per_frame(fn, cam)
+    """
+
+    def __init__(self, half=3, period_us=16667):
+        self.img = StaticImage()
+        self.half = half
+        self.frames = 0
+        self.period_us = period_us
+        self.t = 0
+        self._previous = None
+
+    def __enter__(self):
+        try:
+            from .compat import set_clock, get_clock
+        except ImportError:
+            # MicroPython: the real ticks, nothing to replace
+            return self
+        self._previous = get_clock()
+        set_clock(self)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            from .compat import set_clock
+        except ImportError:
+            return False
+        set_clock(self._previous)
+        self._previous = None
+        return False
+
+    def now_us(self):
+        return self.t
+
+    def sleep_us(self, us):
+        self.t += us
+
+    def snapshot(self):
+        self.frames += 1
+        self.t += self.period_us
+        self.img.value = 230 if (self.frames // self.half) & 1 else 20
+        return self.img
+
+
+def _heap_start():
+    if MICROPYTHON:
+        return gc.mem_alloc()
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _heap_end():
+    if MICROPYTHON:
+        return gc.mem_alloc()
+    return tracemalloc.get_traced_memory()[1]
+
+
+def bytes_per_frame(fn, cam, short_ms=200, long_ms=1000):
+    """Heap bytes per extra frame of fn(cam, duration_ms); see the module notes for what counts"""
+    started = False
+    if not MICROPYTHON and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started = True
+    results = []
+    try:
+        for duration in (short_ms, long_ms):
+            # Warm-up run so lazily created state is not counted
+            fn(cam, duration)
+            gc.collect()
+            gc.disable()
+            f0 = cam.frames
+            h0 = _heap_start()
+            fn(cam, duration)
+            h1 = _heap_end()
+            f1 = cam.frames
+            gc.enable()
+            results.append((h1 - h0, f1 - f0))
+    finally:
+        gc.enable()
+        if started:
+            tracemalloc.stop()
+    (a_short, f_short), (a_long, f_long) = results
+    extra = a_long - a_short - SLACK
+    if f_long == f_short or extra <= 0:
+        return 0.0
+    return extra / (f_long - f_short)
+
+
+def _bounded_edges(n):
+    from array import array
+    from .bounded import EdgeBuffer, sample_edges_bounded
+
+    xs = array("H", range(n))
+    ys = array("H", range(n))
+    th = array("H", [125] * n)
+    buf = EdgeBuffer(n, 256)
+
+    def fn(cam, duration_ms):
+        sample_edges_bounded(cam, xs, ys, th, duration_ms, buf)
+    return fn
+
+
+def _bounded_fsk():
+    from .bounded import count_transitions
+
+    def fn(cam, duration_ms):
+        count_transitions(cam, 0, 0, 125, duration_ms)
+    return fn
+
+
+def _list_edges(n):
+    from .sample import sample_edges
+
+    centers = [(i, i) for i in range(n)]
+    th = [125.0] * n
+
+    def fn(cam, duration_ms):
+        sample_edges(cam, centers, duration_ms, th)
+    return fn
+
+
+def run(verbose=True):
+    """Measure every loop; returns True if all bounded loops allocate nothing per frame"""
+    if not MICROPYTHON and tracemalloc is None:
+        print("memcheck: no tracemalloc, nothing to measure")
+        return False
+    checks = [
+        ("bounded.sample_edges_bounded x4", _bounded_edges(4), True),
+        ("bounded.count_transitions", _bounded_fsk(), True),
+        ("sample.sample_edges x4 (reference)", _list_edges(4), False),
+    ]
+    ok = True
+    mode = "allocated" if MICROPYTHON else "peak"
+    for name, fn, must_be_zero in checks:
+        with StaticCamera() as cam:
+            per_frame = bytes_per_frame(fn, cam)
+        passed = per_frame <= 0 or not must_be_zero
+        ok = ok and passed
+        if verbose:
+            print("{:36} {:8.1f} bytes {} per frame {}".format(
+                name, per_frame, mode, "" if not must_be_zero else ("ok" if passed else "FAIL")))
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run() else 1)
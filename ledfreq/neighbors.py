@@ -0,0 +1,280 @@
+# neighbors.py
+#
+# Neighbour discovery from live LED detections.
+#
+# Agents used to be built with fixed neighbour pixels, which go stale the
+# moment a robot moves. Here detections are tracked under stable ids in a
+# uniform spatial grid and each agent's neighbour list is a radius or
+# k-nearest query around its reference point, redone every round:
+#
+#   hood = Neighborhood(origin=(160, 160), k=2)
+#   agent = Agent(3, 22, 12, 1, 4, [], cam=sensor, discovery=hood)
+#
+# or, with any detector, once per frame:
+#
+#   hood = Neighborhood(origin=(160, 160), radius=60, max_missed=10)
+#   hood.observe([(b.cx(), b.cy()) for b in img.find_blobs(...)])
+#
+# The grid makes inserts and moves O(1) and a query only visits the cells
+# that can hold an answer, so the cost depends on how many LEDs are near
+# the query point, not on how many are tracked.
+
+from .compat import ticks_ms, ticks_diff
+from .localize import BRIGHT_THRESHOLDS
+
+
+class SpatialGrid:
+    """Points (id -> (x, y)) bucketed into cell x cell px squares"""
+
+    def __init__(self, cell=32):
+        self.cell = cell
+        self.cells = {}
+        self.pos = {}
+
+    def _key(self, x, y):
+        return (int(x) // self.cell, int(y) // self.cell)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __contains__(self, id):
+        return id in self.pos
+
+    def insert(self, id, x, y):
+        self.pos[id] = (x, y)
+        self.cells.setdefault(self._key(x, y), []).append(id)
+
+    def remove(self, id):
+        x, y = self.pos.pop(id)
+        key = self._key(x, y)
+        bucket = self.cells[key]
+        bucket.remove(id)
+        if not bucket:
+            del self.cells[key]
+
+    def move(self, id, x, y):
+        """Update a point's position; it only changes bucket when it crosses a cell border"""
+        old = self.pos[id]
+        if self._key(*old) != self._key(x, y):
+            self.remove(id)
+            self.insert(id, x, y)
+        else:
+            self.pos[id] = (x, y)
+
+    def within(self, x, y, r):
+        """[(squared distance, id)] of every point within r of (x, y), nearest first"""
+        c = self.cell
+        found = []
+        r2 = r * r
+        for cy in range(int(y - r) // c, int(y + r) // c + 1):
+            for cx in range(int(x - r) // c, int(x + r) // c + 1):
+                for id in self.cells.get((cx, cy), ()):
+                    px, py = self.pos[id]
+                    d = (px - x) * (px - x) + (py - y) * (py - y)
+                    if d <= r2:
+                        found.append((d, id))
+        found.sort()
+        return found
+
+    def nearest(self, x, y, k=1, max_r=None):
+        """[(squared distance, id)] of the k points nearest to (x, y), searching rings of cells outwards.
+
+        After ring R every unvisited point is at least R cells away, so the
+        search stops as soon as the k-th distance is within that.
+        """
+        found = []
+        if not self.pos:
+            return found
+        c = self.cell
+        qx, qy = self._key(x, y)
+        seen = 0
+        ring = 0
+        while True:
+            for cy in range(qy - ring, qy + ring + 1):
+                edge_row = cy == qy - ring or cy == qy + ring
+                step = 1 if edge_row else 2 * ring
+                for cx in range(qx - ring, qx + ring + 1, step or 1):
+                    bucket = self.cells.get((cx, cy))
+                    if not bucket:
+                        continue
+                    for id in bucket:
+                        px, py = self.pos[id]
+                        found.append(((px - x) * (px - x) + (py - y) * (py - y), id))
+                    seen += len(bucket)
+            found.sort()
+            bound = ring * c
+            if len(found) >= k and found[k - 1][0] <= bound * bound:
+                break
+            if seen >= len(self.pos) or (max_r is not None and bound > max_r):
+                break
+            ring += 1
+        found = found[:k]
+        if max_r is not None:
+            found = [f for f in found if f[0] <= max_r * max_r]
+        return found
+
+
+class LEDTracker:
+    """Stable ids for LED centers detected frame after frame.
+
+    Each detection is matched to the nearest unclaimed track within gate
+    px, closest pairs first; unmatched detections start new tracks and a
+    track unseen for more than max_missed updates is dropped. added and
+    removed list the ids that changed in the last update.
+    """
+
+    def __init__(self, gate=12, max_missed=5, cell=32):
+        self.grid = SpatialGrid(cell)
+        self.gate = gate
+        self.max_missed = max_missed
+        self.missed = {}
+        self.next_id = 0
+        self.added = []
+        self.removed = []
+
+    def update(self, centers):
+        """Match one frame's detections; returns the track id of every center"""
+        pairs = []
+        for j in range(len(centers)):
+            x, y = centers[j]
+            for d, id in self.grid.within(x, y, self.gate):
+                pairs.append((d, j, id))
+        pairs.sort()
+        ids = [None] * len(centers)
+        claimed = set()
+        for d, j, id in pairs:
+            if ids[j] is None and id not in claimed:
+                ids[j] = id
+                claimed.add(id)
+        self.added = []
+        self.removed = []
+        for j in range(len(centers)):
+            x, y = centers[j]
+            if ids[j] is None:
+                ids[j] = self.next_id
+                self.next_id += 1
+                self.grid.insert(ids[j], x, y)
+                self.added.append(ids[j])
+            else:
+                self.grid.move(ids[j], x, y)
+            self.missed[ids[j]] = 0
+        for id in list(self.grid.pos):
+            if id in claimed or id in self.added:
+                continue
+            self.missed[id] += 1
+            if self.missed[id] > self.max_missed:
+                self.grid.remove(id)
+                del self.missed[id]
+                self.removed.append(id)
+        return ids
+
+    def position(self, id):
+        return self.grid.pos[id]
+
+    def state(self):
+        pos = self.grid.pos
+        return {"next_id": self.next_id, "tracks": [[id, pos[id][0], pos[id][1], self.missed[id]] for id in pos]}
+
+    def restore(self, state):
+        for id in list(self.grid.pos):
+            self.grid.remove(id)
+        self.missed = {}
+        for id, x, y, missed in state["tracks"]:
+            self.grid.insert(id, x, y)
+            self.missed[id] = missed
+        self.next_id = state["next_id"]
+
+
+def blob_detector(window_ms=250, thresholds=BRIGHT_THRESHOLDS, invert=False, pixels_threshold=10,
+                  area_threshold=10, merge_px=4):
+    """detect(cam) -> the blob centers seen over window_ms.
+
+    Unlike BlobTracker, which keeps every LED it has ever confirmed, this
+    only reports what is in view now; the window should cover an off phase
+    of the slowest LED so a blinking one is not missed. Blobs within
+    merge_px of each other are one LED at its latest position.
+    """
+    def detect(cam):
+        found = []
+        start = ticks_ms()
+        while True:
+            img = cam.snapshot()
+            for b in img.find_blobs(thresholds, invert=invert, pixels_threshold=pixels_threshold,
+                                    area_threshold=area_threshold, merge=True):
+                c = (b.cx(), b.cy())
+                for i in range(len(found)):
+                    if abs(found[i][0] - c[0]) <= merge_px and abs(found[i][1] - c[1]) <= merge_px:
+                        found[i] = c
+                        break
+                else:
+                    found.append(c)
+            if ticks_diff(ticks_ms(), start) >= window_ms:
+                return found
+    return detect
+
+
+class Neighborhood:
+    """An agent's neighbour set, kept up to date from live detections.
+
+    The neighbours are the tracked LEDs within radius px of origin, or the
+    k nearest, or both (k nearest within radius), leaving out anything
+    within exclude_radius (e.g. the agent's own LED if it is in view). The
+    list keeps its order across rounds: LEDs that stay neighbours keep
+    their slot with their current position, new ones are appended.
+    detect(cam) -> centers defaults to blob_detector(). An LED is dropped
+    after max_missed updates without a detection: rounds for refresh(),
+    frames for observe(), where a blinking LED needs a few.
+    """
+
+    def __init__(self, origin=(160, 160), radius=None, k=None, exclude_radius=0, detect=None, gate=12,
+                 max_missed=0):
+        if radius is None and k is None:
+            raise ValueError("Neighborhood needs a radius, k or both")
+        self.origin = origin
+        self.radius = radius
+        self.k = k
+        self.exclude_radius = exclude_radius
+        self.detect = detect if detect is not None else blob_detector()
+        self.tracker = LEDTracker(gate, max_missed)
+        self.ids = []
+        self.changed = False
+
+    def query(self):
+        """Ids of the current neighbours, nearest first"""
+        grid = self.tracker.grid
+        x, y = self.origin
+        if self.k is None:
+            found = grid.within(x, y, self.radius)
+        else:
+            # Ask for extra so excluded points don't leave the list short
+            found = grid.nearest(x, y, self.k + len(grid) if self.exclude_radius else self.k, self.radius)
+        ex2 = self.exclude_radius * self.exclude_radius
+        ids = [id for d, id in found if not (self.exclude_radius and d <= ex2)]
+        return ids if self.k is None else ids[:self.k]
+
+    def observe(self, centers):
+        """Feed one frame's detections; returns the neighbour centers"""
+        self.tracker.update(centers)
+        current = self.query()
+        keep = [id for id in self.ids if id in current]
+        new = [id for id in current if id not in keep]
+        self.changed = bool(new) or len(keep) != len(self.ids)
+        self.ids = keep + new
+        return self.centers()
+
+    def centers(self):
+        pos = self.tracker.grid.pos
+        return [(int(pos[id][0]), int(pos[id][1])) for id in self.ids]
+
+    def state(self):
+        return {"ids": self.ids, "tracker": self.tracker.state()}
+
+    def restore(self, state):
+        """Take the tracks and neighbour order back from state(); the next refresh corrects any that moved"""
+        self.tracker.restore(state["tracker"])
+        self.ids = [id for id in state["ids"] if id in self.tracker.grid]
+        return self.centers()
+
+    def refresh(self, cam):
+        """Detect, track and query; returns the neighbour centers"""
+        return self.observe(self.detect(cam))
@@ -0,0 +1,97 @@
+# pipeline.py
+#
+# localize -> sample -> estimate -> report, wired together.
+#
+#   import sensor
+#   from ledfreq.pipeline import measure_led_frequency
+#   m = measure_led_frequency(sensor, (87, 154), duration_ms=1000)
+#   print(m.freq, m.quality)
+#
+# Pipeline bundles the stages as plain callables so a script can swap any of
+# them without copying the others.
+
+from . import profiler
+from .profiler import ESTIMATE
+from .jitter import FrameMonitor
+from .sample import calibrate_thresholds, sample_edges
+from .estimate import Measurement, fit_estimator
+
+prof = profiler.prof
+
+
+def measure_led_frequencies(cam, centers, duration_ms=1000, fps=60, thresholds=None,
+                            estimator=None, debounce_us=5000, monitor=None, trace=None, stop=None):
+    """Measure every center from the same frames; returns a list of Measurement.
+
+    Each Measurement also carries period_us, duty and phase_us from a
+    regression over all of its edges (see estimate.fit_edges). phase_us is
+    relative to the first frame of the window, whose tick is m.start_us.
+    The default estimator is frequency_from_fit with the monitor's frame
+    period (fps unless a monitor is passed), as is the regression.
+
+    With a stop rule (see sequential.py) the window ends as soon as every
+    center's estimate is good enough; duration_ms is then only the cap.
+    """
+    if thresholds is None:
+        thresholds = calibrate_thresholds(cam, centers)
+    if monitor is None:
+        monitor = FrameMonitor(fps=fps)
+    if estimator is None:
+        estimator = fit_estimator(monitor.nominal_us)
+    if stop is not None and hasattr(stop, "set_frame_us"):
+        # Stop rules judge edge timing against the frame period of this window
+        stop.set_frame_us(monitor.nominal_us)
+    levels = []
+    edges, monitor = sample_edges(cam, centers, duration_ms, thresholds, debounce_us, monitor, trace, stop, levels)
+    t = prof.start()
+    span = monitor.span_us()
+    quality = monitor.quality()
+    results = []
+    for i in range(len(centers)):
+        m = Measurement(centers[i], estimator(edges[i], span), quality, edges[i], span)
+        # Edges alternate, so an LED that starts off rises first
+        m.fit(not levels[i], monitor.nominal_us)
+        m.start_us = monitor.first_us
+        results.append(m)
+    prof.stop(ESTIMATE, t)
+    return results
+
+
+def measure_led_frequency(cam, led_center, duration_ms=1000, **kwargs):
+    """Measure one LED; returns a Measurement"""
+    return measure_led_frequencies(cam, [led_center], duration_ms, **kwargs)[0]
+
+
+class Pipeline:
+    """Configurable localize -> measure -> report loop.
+
+    localize(cam) returns a list of centers, measure(cam, centers) returns a
+    list of Measurement and report(measurements) does whatever the script
+    needs with them. Centers are localized once and reused until relocalize().
+    """
+
+    def __init__(self, cam, localize=None, measure=None, report=None, centers=None,
+                 default_center=(160, 160)):
+        self.cam = cam
+        self.localize = localize
+        self.measure = measure if measure is not None else measure_led_frequencies
+        self.report = report
+        self.centers = centers
+        self.default_center = default_center
+
+    def relocalize(self):
+        centers = self.localize(self.cam) if self.localize is not None else None
+        if not centers:
+            centers = [self.default_center]
+        elif isinstance(centers, tuple):
+            centers = [centers]
+        self.centers = centers
+        return centers
+
+    def run_once(self):
+        if not self.centers:
+            self.relocalize()
+        results = self.measure(self.cam, self.centers)
+        if self.report is not None:
+            self.report(results)
+        return results
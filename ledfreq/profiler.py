@@ -0,0 +1,103 @@
+# profiler.py
+#
+# Cheap per-stage timing for the measurement loops.
+#
+# Each span is stored as (stage id, duration in us) in a fixed-size ring made
+# of a bytearray and an array('L'), so recording never allocates and never
+# prints. When the profiler is disabled start()/stop() return straight away.
+#
+#   from ledfreq import profiler
+#   prof = profiler.prof
+#   prof.enabled = True
+#   t = prof.start()
+#   img = sensor.snapshot()
+#   prof.stop(profiler.SNAPSHOT, t)
+#   ...
+#   prof.dump()       # print over USB
+#   prof.dump(uart)   # or write over UART
+
+from array import array
+
+from .compat import ticks_us, ticks_diff
+
+# --- Stage ids ---
+SNAPSHOT = 0
+PIXEL = 1
+THRESHOLD = 2
+EDGE = 3
+ESTIMATE = 4
+UART = 5
+
+STAGE_NAMES = ("snapshot", "pixel", "threshold", "edge", "estimate", "uart")
+
+
+class Profiler:
+    def __init__(self, size=512, enabled=False):
+        self.enabled = enabled
+        self.size = size
+        self._stage = bytearray(size)
+        self._dur = array("L", [0] * size)
+        self._head = 0
+        self._count = 0
+
+    def start(self):
+        """Return the span start time, or 0 when disabled"""
+        if not self.enabled:
+            return 0
+        return ticks_us()
+
+    def stop(self, stage, t0):
+        """Record the span that started at t0 under the given stage id"""
+        if not self.enabled:
+            return
+        i = self._head
+        self._stage[i] = stage
+        self._dur[i] = ticks_diff(ticks_us(), t0)
+        i += 1
+        if i == self.size:
+            i = 0
+        self._head = i
+        if self._count < self.size:
+            self._count += 1
+
+    def reset(self):
+        self._head = 0
+        self._count = 0
+
+    def summary(self):
+        """Return {stage name: (count, total_us, min_us, max_us)} for the spans in the ring"""
+        stats = {}
+        for i in range(self._count):
+            stage = self._stage[i]
+            dur = self._dur[i]
+            s = stats.get(stage)
+            if s is None:
+                stats[stage] = [1, dur, dur, dur]
+            else:
+                s[0] += 1
+                s[1] += dur
+                if dur < s[2]:
+                    s[2] = dur
+                if dur > s[3]:
+                    s[3] = dur
+        result = {}
+        for stage, s in stats.items():
+            name = STAGE_NAMES[stage] if stage < len(STAGE_NAMES) else str(stage)
+            result[name] = tuple(s)
+        return result
+
+    def dump(self, out=None):
+        """Print the summary, or write it to `out` (anything with a write method, e.g. a UART)"""
+        lines = ["PROF stage count mean_us min_us max_us total_ms\n"]
+        for name, (count, total, lo, hi) in self.summary().items():
+            lines.append("PROF {} {} {} {} {} {:.1f}\n".format(
+                name, count, total // count, lo, hi, total / 1000.0))
+        for line in lines:
+            if out is None:
+                print(line, end="")
+            else:
+                out.write(line)
+
+
+# Shared instance so every module records into the same ring
+prof = Profiler()
@@ -0,0 +1,66 @@
+# record.py
+#
+# Binary frame logs for offline analysis on the host (ledhost/analyze.py).
+#
+# A TraceWriter goes anywhere a `trace` list is accepted (sample_edges,
+# measure_led_frequencies, ...). Each frame is written as one fixed-size
+# record instead of being kept in RAM, so a log can run for as long as the
+# flash or SD card has room:
+#
+#   with TraceWriter("trace.bin", centers, fps=60) as log:
+#       for _ in range(30):
+#           measure_led_frequencies(sensor, centers, 1000, trace=log)
+#
+# Layout: one JSON header line {"version": 1, "centers": [[x, y], ...],
+# "fps": 60}, then little-endian records of <uint32 t_us><uint8 value> per
+# center. t_us runs from the first frame of the log across all windows.
+
+import json
+import struct
+
+from .compat import ticks_us, ticks_diff, ticks_add
+
+TRACE_VERSION = 1
+
+
+class TraceWriter:
+    """File-backed stand-in for a trace list; every append() writes one record"""
+
+    def __init__(self, path, centers, fps=60):
+        self.n = len(centers)
+        self.f = open(path, "wb")
+        header = {"version": TRACE_VERSION, "centers": [list(c) for c in centers], "fps": fps}
+        self.f.write((json.dumps(header) + "\n").encode())
+        self.fmt = "<I" + "B" * self.n
+        self.record = bytearray(struct.calcsize(self.fmt))
+        self.start = None
+        self.base = 0
+        self.last = 0
+        self.frames = 0
+
+    def append(self, item):
+        t, values = item
+        if self.start is None:
+            self.start = ticks_add(ticks_us(), -t)
+        elif t < self.last:
+            # A new window restarts its times near 0; anchor it on the real clock
+            self.base = ticks_diff(ticks_us(), self.start) - t
+        self.last = t
+        struct.pack_into("<I", self.record, 0, (self.base + t) & 0xFFFFFFFF)
+        for i in range(self.n):
+            v = int(values[i])
+            self.record[4 + i] = 255 if v > 255 else (0 if v < 0 else v)
+        self.f.write(self.record)
+        self.frames += 1
+
+    def __len__(self):
+        return self.frames
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
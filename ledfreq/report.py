@@ -0,0 +1,66 @@
+# report.py
+#
+# Sending results to the Arduino LED driver over UART.
+
+from . import profiler
+from .profiler import UART
+from .compat import ticks_us
+
+prof = profiler.prof
+
+
+def open_uart(bus=3, baudrate=19200, **kwargs):
+    """Return pyb.UART(bus, baudrate), or None when running off hardware"""
+    try:
+        import pyb
+    except ImportError:
+        return None
+    return pyb.UART(bus, baudrate, **kwargs)
+
+
+def send_frequency(uart, freq, verbose=True):
+    """Write "<freq>\\n" with two decimals, the format ArduinoCodeforUART.c parses"""
+    msg = "{:.2f}\n".format(freq)
+    if uart is not None:
+        t = prof.start()
+        uart.write(msg)
+        prof.stop(UART, t)
+        if verbose:
+            print("Sent frequency:", msg.strip())
+    elif verbose:
+        print("UART not available, frequency:", msg.strip())
+    return msg
+
+
+def send_phase(uart, delay_ms, verbose=True):
+    """Write "P<delay_ms>\n": the driver's next rising edge comes delay_ms from now"""
+    msg = "P{:.1f}\n".format(delay_ms)
+    if uart is not None:
+        t = prof.start()
+        uart.write(msg)
+        prof.stop(UART, t)
+        if verbose:
+            print("Sent phase:", msg.strip())
+    elif verbose:
+        print("UART not available, phase:", msg.strip())
+    return msg
+
+
+def telemetry_line(cam_id, measurements):
+    """One line per measurement window for the host fusion service (ledhost/fusion.py).
+
+    "LED <cam_id> <start_tick_us> <span_us> x,y,freq,confidence,phase_us ..."
+    where phase_us is a rising edge after the start tick, or -1 if unknown.
+    """
+    if measurements:
+        start = measurements[0].start_us
+        span = measurements[0].span_us
+    else:
+        start = ticks_us()
+        span = 0
+    parts = ["LED", str(cam_id), str(start), str(int(span))]
+    for m in measurements:
+        phase = -1 if m.phase_us is None else m.phase_us
+        parts.append("{:.1f},{:.1f},{:.3f},{:.2f},{:.0f}".format(
+            m.center[0], m.center[1], m.freq, m.confidence, phase))
+    return " ".join(parts)
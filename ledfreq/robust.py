@@ -0,0 +1,80 @@
+# robust.py
+#
+# Weighted robust location estimates used to fuse neighbour readings.
+# All take parallel lists of values and non-negative weights and return None
+# when the total weight is zero.
+
+
+def weighted_mean(values, weights):
+    total = sum(weights)
+    if total <= 0:
+        return None
+    return sum(v * w for v, w in zip(values, weights)) / total
+
+
+def weighted_median(values, weights):
+    total = sum(weights)
+    if total <= 0:
+        return None
+    pairs = sorted(zip(values, weights))
+    acc = 0.0
+    for v, w in pairs:
+        acc += w
+        if acc >= total / 2.0:
+            return v
+    return pairs[-1][0]
+
+
+def trimmed_mean(values, weights, trim=0.25):
+    """Weighted mean after dropping `trim` of the weight from each tail"""
+    total = sum(weights)
+    if total <= 0:
+        return None
+    pairs = sorted(zip(values, weights))
+    lo = total * trim
+    hi = total * (1.0 - trim)
+    acc = 0.0
+    s = 0.0
+    kept = 0.0
+    for v, w in pairs:
+        # Portion of this sample's weight that falls inside [lo, hi]
+        a = max(acc, lo)
+        b = min(acc + w, hi)
+        if b > a:
+            s += v * (b - a)
+            kept += b - a
+        acc += w
+    if kept <= 0:
+        return weighted_median(values, weights)
+    return s / kept
+
+
+def huber_mean(values, weights, k=2.0, iterations=5):
+    """Weighted Huber M-estimate: residuals beyond k count only as k"""
+    center = weighted_median(values, weights)
+    if center is None:
+        return None
+    for _ in range(iterations):
+        num = 0.0
+        den = 0.0
+        for v, w in zip(values, weights):
+            r = abs(v - center)
+            hw = w if r <= k else w * k / r
+            num += hw * v
+            den += hw
+        if den <= 0:
+            break
+        new = num / den
+        if abs(new - center) < 1e-3:
+            center = new
+            break
+        center = new
+    return center
+
+
+FUSERS = {
+    "mean": weighted_mean,
+    "median": weighted_median,
+    "trimmed": trimmed_mean,
+    "huber": huber_mean,
+}
@@ -0,0 +1,148 @@
+# roi.py
+#
+# Multi-pixel LED sampling.
+#
+# Instead of reading the single pixel at the blob's integer center, a
+# Footprint covers the pixels of the LED that actually blink and sums them
+# with integer weights (their blink amplitude) on every frame. The summed
+# signal has better SNR than any one pixel, so shorter windows are enough,
+# and the weights give a sub-pixel centroid for free.
+#
+#   fp = roi.footprint(sensor, (87, 154), radius=1)
+#   print(fp.centroid)
+#   m = roi.measure_roi_frequencies(sensor, [fp], duration_ms=500)[0]
+
+from .compat import ticks_ms, ticks_us, ticks_diff
+from .jitter import FrameMonitor
+from .sample import read_pixel
+from .estimate import Measurement, fit_estimator
+from . import profiler
+from .profiler import SNAPSHOT, PIXEL, THRESHOLD, EDGE, ESTIMATE
+
+prof = profiler.prof
+
+
+class Footprint:
+    """Weighted pixel set of one LED"""
+
+    def __init__(self, center, pixels, weights, threshold, centroid):
+        self.center = center
+        self.pixels = pixels
+        self.weights = weights
+        self.threshold = threshold
+        self.centroid = centroid
+
+    def read(self, img):
+        """Weighted sum of the footprint pixels in img"""
+        total = 0
+        weights = self.weights
+        i = 0
+        for x, y in self.pixels:
+            total += weights[i] * read_pixel(img, x, y)
+            i += 1
+        return total
+
+    def __repr__(self):
+        return "Footprint(({:.2f}, {:.2f}), {} px)".format(self.centroid[0], self.centroid[1], len(self.pixels))
+
+
+def footprint(cam, center, radius=2, frames=10, min_fraction=0.25, width=320, height=320):
+    """Find the blinking pixels around center and weight them by blink amplitude.
+
+    Pixels whose max-min over `frames` snapshots is below min_fraction of the
+    strongest pixel are dropped. If nothing blinks the footprint is just the
+    center pixel with weight 1. A center outside the frame is moved to the
+    nearest pixel in it first, so the window is never empty.
+    """
+    t = prof.start()
+    cx = min(width - 1, max(0, center[0]))
+    cy = min(height - 1, max(0, center[1]))
+    window = [(x, y)
+              for y in range(cy - radius, cy + radius + 1)
+              for x in range(cx - radius, cx + radius + 1)
+              if 0 <= x < width and 0 <= y < height]
+    n = len(window)
+    history = []
+    for _ in range(frames):
+        img = cam.snapshot()
+        history.append([read_pixel(img, x, y) for x, y in window])
+
+    amplitude = [0] * n
+    for i in range(n):
+        column = [row[i] for row in history]
+        amplitude[i] = max(column) - min(column)
+    peak = max(amplitude) if amplitude else 0
+
+    if peak == 0:
+        keep = [window.index((cx, cy))]
+        weights = [1]
+    else:
+        cutoff = peak * min_fraction
+        keep = [i for i in range(n) if amplitude[i] >= cutoff]
+        weights = [amplitude[i] for i in keep]
+    pixels = [window[i] for i in keep]
+    sums = [sum(weights[k] * row[keep[k]] for k in range(len(keep))) for row in history]
+
+    total_w = sum(weights)
+    centroid = (sum(weights[k] * pixels[k][0] for k in range(len(pixels))) / total_w,
+                sum(weights[k] * pixels[k][1] for k in range(len(pixels))) / total_w)
+    threshold = (max(sums) + min(sums)) // 2
+    prof.stop(THRESHOLD, t)
+    return Footprint(center, pixels, weights, threshold, centroid)
+
+
+def sample_roi_edges(cam, footprints, duration_ms, debounce_us=5000, monitor=None):
+    """Like sample.sample_edges, but thresholds each footprint's weighted sum"""
+    n = len(footprints)
+    if monitor is None:
+        monitor = FrameMonitor()
+    monitor.reset()
+    edges = [[] for _ in range(n)]
+    polarity = [0] * n
+
+    img = cam.snapshot()
+    prev_time = monitor.frame(ticks_us())
+    for i in range(n):
+        fp = footprints[i]
+        polarity[i] = 1 if fp.read(img) > fp.threshold else -1
+    start = ticks_ms()
+
+    while ticks_diff(ticks_ms(), start) < duration_ms:
+        t = prof.start()
+        img = cam.snapshot()
+        prof.stop(SNAPSHOT, t)
+        now = monitor.frame(ticks_us())
+        for i in range(n):
+            fp = footprints[i]
+            t = prof.start()
+            val = fp.read(img)
+            prof.stop(PIXEL, t)
+            t = prof.start()
+            p = 1 if val > fp.threshold else -1
+            if p != polarity[i]:
+                edge_time = (prev_time + now) // 2
+                e = edges[i]
+                if not e or (edge_time - e[-1]) > debounce_us:
+                    e.append(edge_time)
+                polarity[i] = p
+            prof.stop(EDGE, t)
+        prev_time = now
+
+    return edges, monitor
+
+
+def measure_roi_frequencies(cam, footprints, duration_ms=1000, fps=60, estimator=None,
+                            debounce_us=5000, monitor=None):
+    """Measure every footprint from the same frames; Measurement.center is the sub-pixel centroid"""
+    if monitor is None:
+        monitor = FrameMonitor(fps=fps)
+    if estimator is None:
+        estimator = fit_estimator(monitor.nominal_us)
+    edges, monitor = sample_roi_edges(cam, footprints, duration_ms, debounce_us, monitor)
+    t = prof.start()
+    span = monitor.span_us()
+    quality = monitor.quality()
+    results = [Measurement(footprints[i].centroid, estimator(edges[i], span), quality, edges[i], span)
+               for i in range(len(footprints))]
+    prof.stop(ESTIMATE, t)
+    return results
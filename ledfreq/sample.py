@@ -0,0 +1,160 @@
+# sample.py
+#
+# Pixel sampling and edge collection.
+#
+# All tracked LEDs are read from the same snapshot, so measuring N LEDs costs
+# one capture window instead of N. Edge times are in us since the first frame
+# of the window (see jitter.FrameMonitor).
+
+from .compat import ticks_ms, ticks_us, ticks_diff
+from .jitter import FrameMonitor
+from .kernels import EdgeKernel
+from . import profiler
+from .profiler import SNAPSHOT, PIXEL, THRESHOLD, EDGE
+
+prof = profiler.prof
+
+
+def read_pixel(img, x, y):
+    """Grayscale value at (x, y); takes the first channel if the pixel is a tuple"""
+    val = img.get_pixel(x, y)
+    if isinstance(val, tuple):
+        val = val[0]
+    return val
+
+
+def calibrate_thresholds(cam, centers, frames=10, default=127):
+    """Return a mid-level threshold for each center from `frames` snapshots"""
+    if frames <= 0:
+        return [default] * len(centers)
+    t = prof.start()
+    n = len(centers)
+    lo = [255] * n
+    hi = [0] * n
+    for _ in range(frames):
+        img = cam.snapshot()
+        for i in range(n):
+            x, y = centers[i]
+            val = read_pixel(img, x, y)
+            if val < lo[i]:
+                lo[i] = val
+            if val > hi[i]:
+                hi[i] = val
+    thresholds = [(hi[i] + lo[i]) / 2.0 for i in range(n)]
+    prof.stop(THRESHOLD, t)
+    return thresholds
+
+
+def sample_edges(cam, centers, duration_ms, thresholds, debounce_us=5000, monitor=None, trace=None, stop=None,
+                 start_levels=None, hysteresis=0):
+    """Threshold every center on each frame for duration_ms and collect edge times.
+
+    Returns (edges, monitor) where edges[i] is the list of edge times of
+    centers[i]. An edge is placed midway between the two frames that bracket
+    it. If trace is a list, (time, values) is appended for every frame.
+    stop(edges[i]) is called after each new edge (see sequential.py); the
+    window ends early once it has returned True for every center.
+    If start_levels is a list it receives each center's level on the first
+    frame (True = on), so the direction of every edge is known. With
+    hysteresis h a center only turns on above threshold + h and off at or
+    below threshold - h. The per-pixel work runs in kernels.py.
+    """
+    n = len(centers)
+    if monitor is None:
+        monitor = FrameMonitor()
+    monitor.reset()
+    edges = [[] for _ in range(n)]
+    done = [False] * n
+    pending = n
+    kernel = EdgeKernel(thresholds, centers, debounce_us, hysteresis)
+    changed = kernel.changed
+
+    img = cam.snapshot()
+    prev_time = monitor.frame(ticks_us())
+    kernel.start(kernel.read(img))
+    if start_levels is not None:
+        start_levels[:] = [kernel.level(i) for i in range(n)]
+    start = ticks_ms()
+
+    while ticks_diff(ticks_ms(), start) < duration_ms:
+        t = prof.start()
+        img = cam.snapshot()
+        prof.stop(SNAPSHOT, t)
+        now = monitor.frame(ticks_us())
+        t = prof.start()
+        values = kernel.read(img)
+        prof.stop(PIXEL, t)
+        t = prof.start()
+        edge_time = (prev_time + now) // 2
+        for j in range(kernel.step(values, edge_time)):
+            i = changed[j]
+            e = edges[i]
+            e.append(edge_time)
+            if stop is not None and not done[i] and stop(e):
+                done[i] = True
+                pending -= 1
+        prof.stop(EDGE, t)
+        if trace is not None:
+            trace.append((now, list(values)))
+        prev_time = now
+        if stop is not None and pending == 0:
+            break
+
+    return edges, monitor
+
+
+def falling_trend_times(cam, pos, duration_ms, draw=True, final_check=True, min_drop=0):
+    """Times (ms) at which one pixel's trend turns from rising to falling.
+
+    This is the event-camera per-pixel sweep used by the userfreq scripts:
+    no threshold, just the sign of the frame-to-frame change.
+    """
+    x, y = pos
+    prev_trend = 0
+    times = []
+
+    img = cam.snapshot()
+    prev_val = read_pixel(img, x, y)
+
+    start = ticks_ms()
+    while ticks_diff(ticks_ms(), start) < duration_ms:
+        img = cam.snapshot()
+        now = ticks_ms()
+        if draw:
+            img.draw_rectangle(x - 2, y - 2, 5, 5, color=(255, 0, 0))
+        val = read_pixel(img, x, y)
+
+        if val > prev_val:
+            trend = 1
+        elif val < prev_val:
+            trend = -1
+        else:
+            trend = prev_trend
+
+        # Detect high-to-low transition
+        if trend == -1 and prev_trend == 1:
+            times.append(now)
+
+        prev_val = val
+        prev_trend = trend
+
+    if final_check:
+        # One more sample to catch a transition right at the end of the window
+        img = cam.snapshot()
+        val = read_pixel(img, x, y)
+        if val < prev_val and prev_trend == 1 and prev_val - val > min_drop:
+            times.append(ticks_ms())
+    return times
+
+
+def window_pixels(center, rows=3, cols=3, width=320, height=320):
+    """Pixels of a rows x cols window around center, clipped to the frame"""
+    px, py = center
+    half_rows = rows // 2
+    half_cols = cols // 2
+    return [
+        (x, y)
+        for y in range(py - half_rows, py + half_rows + 1)
+        for x in range(px - half_cols, px + half_cols + 1)
+        if 0 <= x < width and 0 <= y < height
+    ]
@@ -0,0 +1,106 @@
+# sequential.py
+#
+# Stop rules for adaptive-duration measurement windows.
+#
+# A stop rule is called with an LED's edge list every time a new edge is
+# recorded and returns True once the estimate is good enough. sample_edges
+# ends the window as soon as every LED's rule is satisfied; duration_ms stays
+# as the hard cap.
+#
+#   m = measure_led_frequency(sensor, c, duration_ms=3000, stop=ToleranceStop(0.25))
+#   m = measure_led_frequency(sensor, c, duration_ms=500, stop=ClassifyStop((10, 20)))
+#
+# Without a frame_us of their own the rules use the frame period of the
+# window they run in: measure_led_frequencies (and FrameRateController)
+# pass it in with set_frame_us() before sampling.
+
+DEFAULT_FRAME_US = 16667
+
+
+def frequency_interval(edge_times_us, frame_us=DEFAULT_FRAME_US, z=2.0):
+    """Return (freq, half_width) in Hz from the edges so far, or (0.0, None) with fewer than 3 edges.
+
+    The half width is the larger of the statistical error of the mean
+    half-period and the error from timing the first and last edge only to
+    within one frame.
+    """
+    n = len(edge_times_us)
+    if n < 3:
+        return 0.0, None
+    span = edge_times_us[-1] - edge_times_us[0]
+    if span <= 0:
+        return 0.0, None
+    k = n - 1
+    mean = span / k
+    freq = 500000.0 / mean
+    var = 0.0
+    for i in range(k):
+        d = edge_times_us[i + 1] - edge_times_us[i] - mean
+        var += d * d
+    var /= k
+    rel_stat = z * (var ** 0.5) / (mean * k ** 0.5)
+    rel_quant = frame_us / span
+    return freq, freq * max(rel_stat, rel_quant)
+
+
+class FrameRule:
+    """Base of the stop rules: the frame period, fixed or taken from the window"""
+
+    def __init__(self, frame_us=None):
+        self.frame_us = frame_us
+        self.window_frame_us = DEFAULT_FRAME_US
+
+    def set_frame_us(self, frame_us):
+        """The frame period of the window about to run; a frame_us given at construction wins"""
+        if frame_us:
+            self.window_frame_us = frame_us
+
+    def period_us(self):
+        return self.frame_us if self.frame_us is not None else self.window_frame_us
+
+
+class ToleranceStop(FrameRule):
+    """Stop once the frequency is known to within tolerance_hz"""
+
+    def __init__(self, tolerance_hz, frame_us=None, z=2.0, min_edges=4):
+        FrameRule.__init__(self, frame_us)
+        self.tolerance_hz = tolerance_hz
+        self.z = z
+        self.min_edges = min_edges
+
+    def __call__(self, edges):
+        if len(edges) < self.min_edges:
+            return False
+        freq, half_width = frequency_interval(edges, self.period_us(), self.z)
+        return half_width is not None and half_width <= self.tolerance_hz
+
+
+class ClassifyStop(FrameRule):
+    """Stop once the confidence interval sits on one side of every decision boundary.
+
+    With classes (10, 20) the boundary is 15 Hz, so a 20 Hz LED is decided
+    after a few edges instead of a full window.
+    """
+
+    def __init__(self, classes=(10.0, 20.0), frame_us=None, z=2.0):
+        FrameRule.__init__(self, frame_us)
+        self.classes = sorted(classes)
+        self.boundaries = [(self.classes[i] + self.classes[i + 1]) / 2.0 for i in range(len(self.classes) - 1)]
+        self.z = z
+
+    def decide(self, edges):
+        """The class the edges fall into, or None while still ambiguous"""
+        freq, half_width = frequency_interval(edges, self.period_us(), self.z)
+        if half_width is None:
+            return None
+        lo = freq - half_width
+        hi = freq + half_width
+        for i, b in enumerate(self.boundaries):
+            if lo < b < hi:
+                return None
+            if hi <= b:
+                return self.classes[i]
+        return self.classes[-1]
+
+    def __call__(self, edges):
+        return self.decide(edges) is not None
@@ -0,0 +1,279 @@
+# spectral.py
+#
+# Separating LEDs that share a small ROI by blink frequency.
+#
+# Two LEDs a few pixels apart bleed into each other's pixels, so counting
+# threshold crossings on one pixel mixes both. Here every pixel of the ROI is
+# recorded for one capture window and run through a bank of DFT bins (one
+# Goertzel-style correlation per candidate frequency, evaluated at the real
+# frame times so jittery frames don't smear the peaks). Each pixel is assigned
+# to its strongest frequency and pixels sharing a frequency are merged into a
+# source with a power-weighted centroid.
+#
+#   sources = spectral.separate_sources(sensor, (87, 159), radius=7)
+#   for s in sources:
+#       print(s.freq, s.center)
+
+import math
+from array import array
+
+from .compat import ticks_ms, ticks_us, ticks_diff
+from .jitter import FrameMonitor
+from .sample import read_pixel
+from .estimate import Measurement
+from . import profiler
+from .profiler import SNAPSHOT, PIXEL, ESTIMATE
+
+prof = profiler.prof
+
+# 1..25 Hz in 0.5 Hz steps, the range the Arduino driver clamps to
+DEFAULT_FREQS = [0.5 * k for k in range(2, 51)]
+
+
+class Source:
+    """One blinking LED found in the ROI"""
+
+    def __init__(self, freq, center, power, pixels, phase_us=None, ratio=float("inf")):
+        self.freq = freq
+        self.center = center
+        self.power = power
+        self.pixels = pixels
+        # A rising edge, in us since the first frame, modulo the period
+        self.phase_us = phase_us
+        # Peak power over the strongest bin outside the peak (inf if there is none)
+        self.ratio = ratio
+
+    def __repr__(self):
+        return "Source({:.2f} Hz at ({:.1f}, {:.1f}), {} px)".format(
+            self.freq, self.center[0], self.center[1], len(self.pixels))
+
+
+def capture_roi(cam, roi, duration_ms, fps=60, monitor=None):
+    """Record every pixel of roi=(x, y, w, h) for duration_ms.
+
+    Returns (series, times, monitor): series[i] is an array('B') of pixel i
+    (row-major in the ROI) and times the frame times in us since the first frame.
+    """
+    x0, y0, w, h = roi
+    max_frames = duration_ms * fps // 1000 + fps // 4 + 2
+    series = [array("B", bytes(max_frames)) for _ in range(w * h)]
+    times = array("L", [0] * max_frames)
+    if monitor is None:
+        monitor = FrameMonitor(fps=fps)
+    monitor.reset()
+
+    n = 0
+    start = ticks_ms()
+    while n < max_frames and (n == 0 or ticks_diff(ticks_ms(), start) < duration_ms):
+        t = prof.start()
+        img = cam.snapshot()
+        prof.stop(SNAPSHOT, t)
+        times[n] = monitor.frame(ticks_us())
+        t = prof.start()
+        i = 0
+        for y in range(y0, y0 + h):
+            for x in range(x0, x0 + w):
+                series[i][n] = read_pixel(img, x, y)
+                i += 1
+        prof.stop(PIXEL, t)
+        n += 1
+    return [s[:n] for s in series], times[:n], monitor
+
+
+def _tables(times, freqs):
+    cos_t = []
+    sin_t = []
+    for f in freqs:
+        w = 2.0 * math.pi * f / 1000000.0
+        cos_t.append(array("f", [math.cos(w * t) for t in times]))
+        sin_t.append(array("f", [math.sin(w * t) for t in times]))
+    return cos_t, sin_t
+
+
+def pixel_spectrum(samples, cos_t, sin_t):
+    """Power of the mean-removed samples at every bin of the tables"""
+    n = len(samples)
+    mean = sum(samples) / n
+    centered = [v - mean for v in samples]
+    power = []
+    for k in range(len(cos_t)):
+        c = cos_t[k]
+        s = sin_t[k]
+        re = 0.0
+        im = 0.0
+        for i in range(n):
+            v = centered[i]
+            re += v * c[i]
+            im += v * s[i]
+        power.append(re * re + im * im)
+    return power
+
+
+def _refine(freqs, power, k):
+    # Parabolic interpolation of the peak between neighbouring bins
+    if 0 < k < len(freqs) - 1:
+        a, b, c = power[k - 1], power[k], power[k + 1]
+        denom = a - 2 * b + c
+        if denom != 0:
+            offset = 0.5 * (a - c) / denom
+            if -1.0 < offset < 1.0:
+                return freqs[k] + offset * (freqs[k + 1] - freqs[k])
+    return freqs[k]
+
+
+def source_phase(series, times, members, freq):
+    """Rising-edge time (us since the first frame, modulo the period) of members at freq.
+
+    The fundamental of a 50 % square wave that rises at r peaks a quarter
+    period later, so r follows from the angle of one DFT bin.
+    """
+    w = 2.0 * math.pi * freq / 1000000.0
+    re = 0.0
+    im = 0.0
+    for i in members:
+        s = series[i]
+        mean = sum(s) / len(s)
+        for n in range(len(s)):
+            v = s[n] - mean
+            re += v * math.cos(w * times[n])
+            im += v * math.sin(w * times[n])
+    period = 1000000.0 / freq
+    return (math.atan2(im, re) / w - period / 4) % period
+
+
+def separate_sources(cam, center, radius=6, duration_ms=1000, freqs=DEFAULT_FREQS, fps=60,
+                     min_amplitude=20, min_power_fraction=0.05, monitor=None, width=320, height=320):
+    """Find the blinking sources in a (2*radius+1)^2 ROI; strongest first.
+
+    Pixels whose max-min stays under min_amplitude are skipped before the DFT,
+    which keeps the cost proportional to the lit area, not the ROI size.
+    """
+    cx, cy = center
+    x0 = max(0, cx - radius)
+    y0 = max(0, cy - radius)
+    w = min(width, cx + radius + 1) - x0
+    h = min(height, cy + radius + 1) - y0
+    series, times, monitor = capture_roi(cam, (x0, y0, w, h), duration_ms, fps, monitor)
+
+    t = prof.start()
+    # Keep bins below Nyquist of the actual frame rate
+    rate = 1000000.0 / monitor.mean_interval_us()
+    freqs = [f for f in freqs if f < rate / 2]
+    if not freqs or len(times) < 4:
+        prof.stop(ESTIMATE, t)
+        return []
+    cos_t, sin_t = _tables(times, freqs)
+
+    # Strongest bin of every modulated pixel
+    peaks = []
+    for i in range(len(series)):
+        s = series[i]
+        if max(s) - min(s) < min_amplitude:
+            continue
+        power = pixel_spectrum(s, cos_t, sin_t)
+        k = 0
+        for j in range(1, len(power)):
+            if power[j] > power[k]:
+                k = j
+        peaks.append((i, k, power))
+
+    if not peaks:
+        prof.stop(ESTIMATE, t)
+        return []
+    floor = max(p[2][p[1]] for p in peaks) * min_power_fraction
+
+    # Group pixels by peak bin; adjacent bins are the same source
+    groups = {}
+    for i, k, power in peaks:
+        if power[k] < floor:
+            continue
+        key = k
+        if k - 1 in groups:
+            key = k - 1
+        elif k + 1 in groups:
+            key = k + 1
+        groups.setdefault(key, []).append((i, k, power))
+
+    sources = []
+    for members in groups.values():
+        total = 0.0
+        sx = 0.0
+        sy = 0.0
+        spectrum = [0.0] * len(freqs)
+        pixels = []
+        for i, k, power in members:
+            p = power[k]
+            x = x0 + i % w
+            y = y0 + i // w
+            total += p
+            sx += p * x
+            sy += p * y
+            pixels.append((x, y))
+            for j in range(len(freqs)):
+                spectrum[j] += power[j]
+        k = 0
+        for j in range(1, len(spectrum)):
+            if spectrum[j] > spectrum[k]:
+                k = j
+        freq = _refine(freqs, spectrum, k)
+        phase = source_phase(series, times, [m[0] for m in members], freq)
+        sources.append(Source(freq, (sx / total, sy / total), total, pixels, phase, peak_ratio(spectrum, k)))
+    sources.sort(key=lambda s: s.power, reverse=True)
+    prof.stop(ESTIMATE, t)
+    return sources
+
+
+def peak_ratio(power, k):
+    """power[k] over the strongest bin not next to k (the peak's own leakage), inf if there is none"""
+    second = 0.0
+    for j in range(len(power)):
+        if abs(j - k) > 1 and power[j] > second:
+            second = power[j]
+    return power[k] / second if second > 0 else float("inf")
+
+
+def measure_led_frequencies(cam, centers, duration_ms=1000, fps=60, radius=3, max_distance=6):
+    """Drop-in for pipeline.measure_led_frequencies when the LEDs are close together.
+
+    One ROI covering all centers is separated into sources and each center is
+    given a source within max_distance px, one-to-one, closest pairs first,
+    so two centers can't both report the same LED. Centers left without a
+    source get 0 Hz, quality 0 and confidence 0. The confidence is the frame quality scaled by how
+    far the source's peak stands out: 1 - 1/ratio of its spectrum, so a peak
+    barely above another bin (a neighbour's leakage, a harmonic) counts little.
+    """
+    xs = [c[0] for c in centers]
+    ys = [c[1] for c in centers]
+    mid = ((min(xs) + max(xs)) // 2, (min(ys) + max(ys)) // 2)
+    r = max(max(xs) - min(xs), max(ys) - min(ys)) // 2 + radius
+    monitor = FrameMonitor(fps=fps)
+    sources = separate_sources(cam, mid, r, duration_ms, fps=fps, monitor=monitor)
+    span = monitor.span_us()
+    quality = monitor.quality()
+    # One source per center, closest pairs first (as LEDTracker.update)
+    pairs = []
+    for j in range(len(centers)):
+        c = centers[j]
+        for k in range(len(sources)):
+            d = (sources[k].center[0] - c[0]) ** 2 + (sources[k].center[1] - c[1]) ** 2
+            if d <= max_distance * max_distance:
+                pairs.append((d, j, k))
+    pairs.sort()
+    match = [None] * len(centers)
+    claimed = set()
+    for d, j, k in pairs:
+        if match[j] is None and k not in claimed:
+            match[j] = k
+            claimed.add(k)
+    results = []
+    for j in range(len(centers)):
+        c = centers[j]
+        best = sources[match[j]] if match[j] is not None else None
+        if best is None:
+            results.append(Measurement(c, 0.0, 0.0, [], span, confidence=0.0))
+        else:
+            m = Measurement(best.center, best.freq, quality, [], span, confidence=quality * (1.0 - 1.0 / best.ratio))
+            m.phase_us = best.phase_us
+            m.start_us = monitor.first_us
+            results.append(m)
+    return results
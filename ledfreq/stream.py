@@ -0,0 +1,219 @@
+# stream.py
+#
+# Streaming the pixels around tracked LEDs to the host over USB-CDC.
+#
+# The cam has no time for spectral analysis of whole LED neighbourhoods at
+# 60 fps, and the IDE preview is the only way frames leave it. RoiStreamer
+# sends just the ROI crops of every frame, coded against the previous
+# frame, as small self-checking packets; ledhost/stream.py rebuilds them
+# into a memory-mapped NumPy array for analysis at the full frame rate:
+#
+#   stream.stream_rois(sensor, centers, radius=8)     # or, frame by frame:
+#   streamer = stream.RoiStreamer(stream.usb_port(), [stream.roi_around(c, 8) for c in centers])
+#   streamer.frame(sensor.snapshot())
+#
+# Run it from main.py with the IDE disconnected: the IDE talks over the
+# same USB port. Anything printed meanwhile is skipped by the receiver.
+#
+# Packet (little-endian):
+#
+#   0xA5 0x5A  sync
+#   uint8      kind: HEADER (JSON {"version", "rois": [[x, y, w, h], ...], "fps"}), KEY or DELTA
+#   uint16     seq, frame counter (wraps)
+#   uint32     t_us, ticks_us() of the frame (wraps at 2**30, as on the cam)
+#   uint16     payload length
+#   payload
+#   uint32     CRC-32 of everything from kind to the end of the payload
+#
+# A frame payload walks the rows of all crops in order (ROI 0 row 0, ROI 0
+# row 1, ..., ROI 1 row 0, ...) as runs: a byte c < 128 skips c + 1 rows
+# that are the same as in the previous frame, c >= 128 is followed by the
+# c - 127 changed rows, raw. Rows are compared and copied in place by the
+# same() and copy() kernels (kernels.py, viper on the cam), with no
+# per-pixel Python, and on the GenX320's event frames most rows of a crop
+# are still most of the time. A KEY frame sends every row, and comes
+# after a HEADER every key_every frames so a receiver can start or recover
+# mid-stream.
+
+import json
+import struct
+
+from .compat import ticks_ms, ticks_us, ticks_diff
+from .sample import read_pixel
+from .kernels import same, copy
+
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+STREAM_VERSION = 1
+SYNC = b"\xa5\x5a"
+HEADER = 0
+KEY = 1
+DELTA = 2
+# kind, seq, t_us, payload length
+PACKET_HEAD = "<BHIH"
+HEAD_SIZE = 2 + struct.calcsize(PACKET_HEAD)
+TICKS_MASK = (1 << 30) - 1
+
+
+def _crc32(data, crc=0):
+    # binascii.crc32 if the firmware has it, else the bitwise CRC-32 it computes
+    if crc32 is not None:
+        return crc32(data, crc) & 0xFFFFFFFF
+    crc ^= 0xFFFFFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ (0xEDB88320 if crc & 1 else 0)
+    return crc ^ 0xFFFFFFFF
+
+
+def roi_around(center, radius=8, width=320, height=320):
+    """(x, y, w, h) square of side 2 * radius + 1 around center, clipped to the frame"""
+    x = max(0, center[0] - radius)
+    y = max(0, center[1] - radius)
+    return (x, y, min(width, center[0] + radius + 1) - x, min(height, center[1] + radius + 1) - y)
+
+
+def usb_port():
+    """The USB virtual COM port on the cam, or stdout's binary stream on a desktop"""
+    try:
+        import pyb
+        return pyb.USB_VCP()
+    except ImportError:
+        import sys
+        return sys.stdout.buffer
+
+
+class RoiStreamer:
+    """Writes the ROI crops of every frame to out (anything with write(bytes)) as packets.
+
+    Two crop buffers are swapped every frame and the packet buffer is
+    allocated once, and rows are compared and copied in place, so the only
+    allocation per frame is the memoryviews of the CRC and the write
+    (with the compiled kernels; the Python fallback slices). bytes_sent and
+    raw_bytes (what uncoded crops would have cost) give the compression.
+    """
+
+    def __init__(self, out, rois, fps=60, key_every=60, width=320):
+        self.out = out
+        self.rois = [tuple(r) for r in rois]
+        self.fps = fps
+        self.key_every = key_every
+        self.width = width
+        # Offset and length of every crop row, in the crop buffer and in the frame
+        self.rows = []
+        for x, y, w, h in self.rois:
+            for r in range(h):
+                self.rows.append((x, y + r, w))
+        size = sum(w for _, _, w in self.rows)
+        self.cur = bytearray(size)
+        self.prev = bytearray(size)
+        self.header_data = json.dumps({"version": STREAM_VERSION, "rois": [list(r) for r in self.rois],
+                                       "fps": fps}).encode()
+        # Worst case payload: every row raw behind its own control byte
+        self.packet = bytearray(HEAD_SIZE + max(size + len(self.rows), len(self.header_data)) + 4)
+        self.packet[0:2] = SYNC
+        self.seq = 0
+        self.frames = 0
+        self.bytes_sent = 0
+        self.raw_bytes = 0
+
+    def _crop(self, img):
+        buf = img.bytearray() if hasattr(img, "bytearray") else None
+        cur = self.cur
+        o = 0
+        for x, y, w in self.rows:
+            if buf is not None:
+                copy(cur, o, buf, y * self.width + x, w)
+            else:
+                for i in range(w):
+                    cur[o + i] = read_pixel(img, x + i, y)
+            o += w
+
+    def _send(self, kind, t_us, n):
+        p = self.packet
+        struct.pack_into(PACKET_HEAD, p, 2, kind, self.seq & 0xFFFF, t_us & TICKS_MASK, n)
+        end = HEAD_SIZE + n
+        struct.pack_into("<I", p, end, _crc32(memoryview(p)[2:end]))
+        self.out.write(memoryview(p)[:end + 4])
+        self.bytes_sent += end + 4
+
+    def header(self):
+        """Send the ROI list"""
+        data = self.header_data
+        self.packet[HEAD_SIZE:HEAD_SIZE + len(data)] = data
+        self._send(HEADER, ticks_us(), len(data))
+
+    def _payload(self, key):
+        # Runs of unchanged rows and of changed rows, written straight into the packet buffer
+        p = self.packet
+        cur = self.cur
+        prev = self.prev
+        n = HEAD_SIZE
+        o = 0
+        i = 0
+        rows = self.rows
+        count = len(rows)
+        while i < count:
+            if not key:
+                skip = 0
+                while i < count and skip < 128:
+                    w = rows[i][2]
+                    if not same(cur, o, prev, o, w):
+                        break
+                    o += w
+                    i += 1
+                    skip += 1
+                if skip:
+                    p[n] = skip - 1
+                    n += 1
+                    continue
+            # A run of changed rows; its control byte is filled in once its length is known
+            at = n
+            n += 1
+            run = 0
+            start = o
+            while i < count and run < 128:
+                w = rows[i][2]
+                if not key and run and same(cur, o, prev, o, w):
+                    break
+                o += w
+                i += 1
+                run += 1
+            p[at] = 127 + run
+            copy(p, n, cur, start, o - start)
+            n += o - start
+        return n - HEAD_SIZE
+
+    def frame(self, img, t_us=None):
+        """Crop img and send it; returns the packet size in bytes"""
+        if t_us is None:
+            t_us = ticks_us()
+        self._crop(img)
+        key = self.frames % self.key_every == 0
+        sent = self.bytes_sent
+        if key:
+            self.header()
+        self._send(KEY if key else DELTA, t_us, self._payload(key))
+        self.cur, self.prev = self.prev, self.cur
+        self.seq += 1
+        self.frames += 1
+        self.raw_bytes += len(self.cur)
+        return self.bytes_sent - sent
+
+    def ratio(self):
+        """Raw crop bytes per byte sent"""
+        return self.raw_bytes / self.bytes_sent if self.bytes_sent else 0.0
+
+
+def stream_rois(cam, centers, radius=8, duration_ms=None, out=None, **kwargs):
+    """Stream the crops around centers until duration_ms has passed (forever if None); returns the RoiStreamer"""
+    streamer = RoiStreamer(out if out is not None else usb_port(), [roi_around(c, radius) for c in centers],
+                           **kwargs)
+    start = ticks_ms()
+    while duration_ms is None or ticks_diff(ticks_ms(), start) < duration_ms:
+        streamer.frame(cam.snapshot())
+    return streamer
@@ -0,0 +1,8 @@
+# ledhost
+#
+# Desktop-side tools for the GenX320 LED scripts: fusing telemetry from
+# several cameras, offline analysis and simulation. These run on CPython with
+# NumPy and are never copied to the camera; the on-device code lives in
+# ledfreq.
+#
+# Nothing is imported here on purpose, as in ledfreq.
@@ -0,0 +1,474 @@
+# analyze.py
+#
+# Offline analysis of recorded sessions.
+#
+# Works on the binary frame logs written by ledfreq.record.TraceWriter
+# (memory-mapped, so hour-long logs don't have to fit in RAM), on console
+# captures of UartPranay.py ("the values at these times [...]") and, for
+# consensus runs, on console captures of Agent.metrics_line():
+#
+#   python -m ledhost.analyze freq trace.bin --window-ms 1000 --step-ms 250
+#   python -m ledhost.analyze spectrogram trace.bin --out spec.npz
+#   python -m ledhost.analyze ber trace.bin --message Hi --bit-ms 100
+#   python -m ledhost.analyze convergence console.txt --tol 0.5
+#   python -m ledhost.analyze sweep trace.bin --thresholds 40:200:20 --windows 100,250,500,1000 --expect 10
+#
+# Every analysis is vectorized over frames and windows; sweeps run one grid
+# point per worker process and each worker maps the log itself.
+
+import argparse
+import ast
+import itertools
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+class Trace:
+    """Frame times (us, float64) and per-LED pixel values (frames x LEDs)"""
+
+    def __init__(self, times, values, centers, fps=60):
+        self.times = times
+        self.values = values
+        self.centers = centers
+        self.fps = fps
+
+    def __len__(self):
+        return len(self.times)
+
+
+def load_trace(path):
+    """Load a TraceWriter log (memory-mapped) or a console capture of a trace"""
+    with open(path, "rb") as f:
+        first = f.readline()
+    try:
+        header = json.loads(first)
+    except ValueError:
+        header = None
+    if isinstance(header, dict) and "centers" in header:
+        n = len(header["centers"])
+        dtype = np.dtype([("t", "<u4"), ("v", "u1", (n,))])
+        size = os.path.getsize(path) - len(first)
+        records = np.memmap(path, dtype, "r", offset=len(first), shape=(size // dtype.itemsize,))
+        return Trace(records["t"].astype(np.float64), records["v"].reshape(-1, n),
+                     [tuple(c) for c in header["centers"]], header.get("fps", 60))
+    return load_console_trace(path)
+
+
+def load_console_trace(path):
+    """Parse "the values at these times [(ms, value), ...]" lines of a console capture"""
+    times = []
+    values = []
+    with open(path) as f:
+        for line in f:
+            if "the values at these times" not in line:
+                continue
+            pairs = ast.literal_eval(line[line.index("["):].strip())
+            base = times[-1] + 1000.0 / 60 if times else 0.0
+            first = pairs[0][0] if pairs else 0
+            for t, v in pairs:
+                times.append(base + (t - first) * 1000.0)
+                values.append(v)
+    if not times:
+        raise ValueError("{}: no trace found".format(path))
+    return Trace(np.array(times), np.array(values, dtype=np.uint8).reshape(-1, 1), [None])
+
+
+# --- Edges and frequency ---
+
+def auto_thresholds(values):
+    """Mid-level between the 5th and 95th percentile of every column"""
+    lo, hi = np.percentile(values, [5, 95], axis=0)
+    return (lo + hi) / 2.0
+
+
+def edge_times(times, column, threshold, debounce_us=5000, with_rising=False):
+    """Edge times of one LED, placed midway between the frames that bracket them.
+
+    Same rule as ledfreq.sample.sample_edges: an edge closer than debounce_us
+    to the last kept edge is dropped. Level changes across a gap in the log
+    (more than three frame intervals, e.g. between capture windows) have no
+    usable time and are dropped too. With with_rising, also returns a bool
+    array that is True for rising edges.
+    """
+    above = np.asarray(column) > threshold
+    idx = np.flatnonzero(above[1:] != above[:-1]) + 1
+    if len(times) > 1:
+        frame = np.median(np.diff(times))
+        idx = idx[times[idx] - times[idx - 1] <= 3 * frame]
+    edges = (times[idx - 1] + times[idx]) // 2
+    rising = above[idx]
+    if debounce_us > 0 and len(edges) > 1 and not (np.diff(edges) > debounce_us).all():
+        keep = [0]
+        last = edges[0]
+        for i in range(1, len(edges)):
+            if edges[i] - last > debounce_us:
+                keep.append(i)
+                last = edges[i]
+        edges = edges[keep]
+        rising = rising[keep]
+    if with_rising:
+        return edges, rising
+    return edges
+
+
+def half_period_index(edges, rising=None, span=9):
+    """Cumulative half-period index of every edge.
+
+    A gap much longer than the local (rolling median) interval means edges
+    were lost, so it counts as the nearest whole number of half-periods
+    instead of one: odd between edges of opposite direction, even between
+    edges of the same direction (odd whenever rising is not given).
+    """
+    gaps = np.diff(edges)
+    if len(gaps) == 0:
+        return np.zeros(len(edges))
+    if len(gaps) >= span:
+        pad = span // 2
+        padded = np.pad(gaps, pad, mode="edge")
+        local = np.median(np.lib.stride_tricks.sliding_window_view(padded, span), axis=1)
+    else:
+        local = np.full(len(gaps), np.median(gaps))
+    r = gaps / np.where(local > 0, local, 1)
+    odd = np.maximum(1, 2 * np.rint((r - 1) / 2) + 1)
+    if rising is None:
+        steps = odd
+    else:
+        even = np.maximum(2, 2 * np.rint(r / 2))
+        steps = np.where(rising[1:] == rising[:-1], even, odd)
+    return np.concatenate([[0], np.cumsum(steps)])
+
+
+def windowed_frequency(edges, starts, window_us, rising=None):
+    """Frequency in every window [start, start + window_us) from its edges.
+
+    Half-periods between the first and last edge over their time difference
+    with 3 or more edges, edge-pair count otherwise, as in
+    estimate.frequency_from_edges but bridging lost edges.
+    """
+    lo = np.searchsorted(edges, starts)
+    hi = np.searchsorted(edges, starts + window_us)
+    n = hi - lo
+    freq = (n // 2) / (window_us / 1e6)
+    ok = n >= 3
+    if ok.any() and len(edges):
+        index = half_period_index(edges, rising)
+        first = np.minimum(lo, len(edges) - 1)
+        last = np.maximum(hi - 1, 0)
+        span = edges[last] - edges[first]
+        good = ok & (span > 0)
+        halves = index[last] - index[first]
+        freq = np.where(good, 500000.0 * halves / np.where(good, span, 1), freq)
+    return freq
+
+
+def window_starts(trace, window_us, step_us):
+    t0 = trace.times[0]
+    t1 = trace.times[-1]
+    if t1 - t0 < window_us:
+        return np.array([t0])
+    return np.arange(t0, t1 - window_us + 1, step_us)
+
+
+def frequency_over_time(trace, window_ms=1000, step_ms=250, thresholds=None, debounce_us=5000):
+    """(starts_us, freqs) with freqs[i, k] the frequency of LED i in window k"""
+    if thresholds is None:
+        thresholds = auto_thresholds(trace.values)
+    window_us = window_ms * 1000.0
+    starts = window_starts(trace, window_us, step_ms * 1000.0)
+    freqs = []
+    for i in range(trace.values.shape[1]):
+        edges, rising = edge_times(trace.times, trace.values[:, i], thresholds[i], debounce_us, with_rising=True)
+        freqs.append(windowed_frequency(edges, starts, window_us, rising))
+    return starts, np.array(freqs)
+
+
+def spectrogram(trace, led=0, window_ms=1000, step_ms=250, freqs=None):
+    """(starts_us, freqs, power) with power[k, j] at freqs[j] in window k.
+
+    Each window is correlated against the bins at the real frame times, as
+    ledfreq.spectral does on the camera, so dropped frames don't smear peaks.
+    """
+    if freqs is None:
+        rate = 1e6 / np.median(np.diff(trace.times))
+        freqs = np.arange(0.5, rate / 2, 0.25)
+    window_us = window_ms * 1000.0
+    starts = window_starts(trace, window_us, step_ms * 1000.0)
+    lo = np.searchsorted(trace.times, starts)
+    hi = np.searchsorted(trace.times, starts + window_us)
+    column = trace.values[:, led].astype(np.float64)
+    w = 2 * np.pi * freqs[None, :] / 1e6
+    power = np.zeros((len(starts), len(freqs)))
+    for k in range(len(starts)):
+        t = trace.times[lo[k]:hi[k]]
+        v = column[lo[k]:hi[k]]
+        if len(v) < 4:
+            continue
+        v = v - v.mean()
+        basis = np.exp(-1j * w * (t - t[0])[:, None])
+        power[k] = np.abs(v @ basis) ** 2 / len(v)
+    return starts, freqs, power
+
+
+# --- FSK bit error rate ---
+
+def uart_bits(message):
+    """11-bit frames (start 0, 8 data LSB first, even parity, stop 1), as fsk.validate_uart_frame expects"""
+    bits = []
+    for ch in message.encode():
+        data = [(ch >> i) & 1 for i in range(8)]
+        bits += [0] + data + [sum(data) & 1, 1]
+    return np.array(bits, dtype=np.int8)
+
+
+def decode_bits(edges, t0, t1, bit_us, window_us=None, max_transitions=2):
+    """Bits for every phase of the bit clock: bits[p, k] for offset p of len(offsets).
+
+    A bit is 1 (20 Hz) when its decision window holds more than
+    max_transitions edges, the fsk.classify_transitions rule. The decision
+    window is the middle window_us of each bit (default the whole bit).
+    """
+    if window_us is None:
+        window_us = bit_us
+    step = max(1000.0, bit_us / 20)
+    offsets = np.arange(0, bit_us, step)
+    nbits = int((t1 - t0 - bit_us) // bit_us)
+    if nbits <= 0:
+        return offsets, np.zeros((len(offsets), 0), dtype=np.int8)
+    margin = (bit_us - window_us) / 2
+    starts = t0 + offsets[:, None] + np.arange(nbits)[None, :] * bit_us + margin
+    counts = np.searchsorted(edges, starts + window_us) - np.searchsorted(edges, starts)
+    scale = bit_us / window_us
+    return offsets, (counts * scale > max_transitions).astype(np.int8)
+
+
+def bit_error_rate(decoded, expected):
+    """Lowest error rate of expected against any alignment in any row of decoded.
+
+    Returns (ber, row, position). Rows are bit-clock phases, positions the
+    bit at which the message starts.
+    """
+    m = len(expected)
+    if decoded.shape[1] < m:
+        return 1.0, None, None
+    windows = np.lib.stride_tricks.sliding_window_view(decoded, m, axis=1)
+    errors = (windows != expected).sum(axis=2)
+    row, pos = np.unravel_index(np.argmin(errors), errors.shape)
+    return errors[row, pos] / float(m), int(row), int(pos)
+
+
+def fsk_ber(trace, message, led=0, bit_ms=100, window_ms=None, threshold=None, debounce_us=5000):
+    if threshold is None:
+        threshold = auto_thresholds(trace.values)[led]
+    edges = edge_times(trace.times, trace.values[:, led], threshold, debounce_us)
+    window_us = None if window_ms is None else window_ms * 1000.0
+    offsets, decoded = decode_bits(edges, trace.times[0], trace.times[-1], bit_ms * 1000.0, window_us)
+    return bit_error_rate(decoded, uart_bits(message))
+
+
+# --- Consensus convergence ---
+
+METRICS_RE = re.compile(r"agent (\S+) round (\d+) freq (-?[\d.]+) .*?disagreement (-?[\d.]+)")
+
+
+def load_convergence(path):
+    """{agent: (rounds, freqs, disagreement)} from Agent.metrics_line() output"""
+    runs = {}
+    with open(path) as f:
+        for line in f:
+            m = METRICS_RE.search(line)
+            if m:
+                runs.setdefault(m.group(1), []).append((int(m.group(2)), float(m.group(3)), float(m.group(4))))
+    out = {}
+    for agent, rows in runs.items():
+        a = np.array(rows)
+        out[agent] = (a[:, 0].astype(int), a[:, 1], a[:, 2])
+    return out
+
+
+def convergence_curve(runs, tol=0.5):
+    """(rounds, spread, settled) where spread is the max-min agent frequency per round.
+
+    With one agent the spread is its own disagreement with its neighbours.
+    settled is the first round after which the spread stays under tol, or None.
+    """
+    if not runs:
+        return np.zeros(0, dtype=int), np.zeros(0), None
+    rounds = np.unique(np.concatenate([r for r, _, _ in runs.values()]))
+    if len(runs) == 1:
+        r, _, dis = next(iter(runs.values()))
+        spread = np.interp(rounds, r, dis)
+    else:
+        table = np.array([np.interp(rounds, r, f) for r, f, _ in runs.values()])
+        spread = table.max(axis=0) - table.min(axis=0)
+    above = np.flatnonzero(spread >= tol)
+    if len(above) == 0:
+        settled = int(rounds[0])
+    elif above[-1] + 1 < len(rounds):
+        settled = int(rounds[above[-1] + 1])
+    else:
+        settled = None
+    return rounds, spread, settled
+
+
+# --- Sweeps ---
+
+def _sweep_point(job):
+    # Runs in a worker process; the log is mapped again there
+    path, threshold, window_ms, step_ms, led, expect, message, bit_ms = job
+    trace = load_trace(path)
+    if message:
+        ber, _, _ = fsk_ber(trace, message, led, bit_ms, window_ms, threshold)
+        return threshold, window_ms, {"ber": ber}
+    thresholds = auto_thresholds(trace.values)
+    thresholds[led] = threshold
+    _, freqs = frequency_over_time(trace, window_ms, step_ms, thresholds)
+    f = freqs[led]
+    result = {"mean": float(f.mean()), "std": float(f.std())}
+    if expect is not None:
+        err = np.abs(f - expect)
+        result["mae"] = float(err.mean())
+        result["p95"] = float(np.percentile(err, 95))
+    return threshold, window_ms, result
+
+
+def sweep(path, thresholds, windows, step_ms=250, led=0, expect=None, message=None, bit_ms=100, jobs=None):
+    """Run every (threshold, window) pair in a process pool; returns [(threshold, window_ms, result)]"""
+    grid = [(path, th, w, step_ms, led, expect, message, bit_ms) for th, w in itertools.product(thresholds, windows)]
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(_sweep_point, grid))
+
+
+def parse_range(text):
+    """"40:200:20" -> [40, 60, ...] (end inclusive); "10,20" -> [10, 20]"""
+    if ":" in text:
+        lo, hi, step = [float(v) for v in text.split(":")]
+        return list(np.arange(lo, hi + step / 2, step))
+    return [float(v) for v in text.split(",")]
+
+
+# --- Command line ---
+
+def _save(path, **arrays):
+    if path:
+        np.savez(path, **arrays)
+        print("saved", path)
+
+
+def cmd_freq(args):
+    trace = load_trace(args.log)
+    starts, freqs = frequency_over_time(trace, args.window_ms, args.step_ms, debounce_us=args.debounce_us)
+    print("{} frames, {:.1f} s, {} LEDs".format(len(trace), (trace.times[-1] - trace.times[0]) / 1e6, len(freqs)))
+    print("   t (s)  " + "  ".join("LED {:<4}".format(i) for i in range(len(freqs))))
+    for k in range(len(starts)):
+        print("{:8.2f}  ".format((starts[k] - trace.times[0]) / 1e6) + "  ".join("{:8.2f}".format(f) for f in freqs[:, k]))
+    for i in range(len(freqs)):
+        print("LED {} {}: mean {:.3f} Hz, std {:.3f}".format(i, trace.centers[i], freqs[i].mean(), freqs[i].std()))
+    _save(args.out, starts=starts, freqs=freqs)
+
+
+def cmd_spectrogram(args):
+    trace = load_trace(args.log)
+    starts, freqs, power = spectrogram(trace, args.led, args.window_ms, args.step_ms)
+    peaks = freqs[np.argmax(power, axis=1)]
+    for k in range(len(starts)):
+        print("{:8.2f} s  peak {:6.2f} Hz".format((starts[k] - trace.times[0]) / 1e6, peaks[k]))
+    _save(args.out, starts=starts, freqs=freqs, power=power)
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.pcolormesh((starts - trace.times[0]) / 1e6, freqs, power.T, shading="auto")
+        plt.xlabel("time (s)")
+        plt.ylabel("frequency (Hz)")
+        plt.show()
+
+
+def cmd_ber(args):
+    trace = load_trace(args.log)
+    ber, row, pos = fsk_ber(trace, args.message, args.led, args.bit_ms, args.window_ms, args.threshold, args.debounce_us)
+    print("BER {:.4f} over {} bits ({} chars), message starts at bit {}".format(
+        ber, len(uart_bits(args.message)), len(args.message), pos))
+
+
+def cmd_convergence(args):
+    runs = load_convergence(args.log)
+    rounds, spread, settled = convergence_curve(runs, args.tol)
+    print("{} agents, {} rounds".format(len(runs), len(rounds)))
+    for r, s in zip(rounds, spread):
+        print("round {:4d}  spread {:.3f}".format(r, s))
+    print("settled below {} Hz at round {}".format(args.tol, settled))
+    _save(args.out, rounds=rounds, spread=spread)
+
+
+def cmd_sweep(args):
+    thresholds = parse_range(args.thresholds)
+    windows = parse_range(args.windows)
+    results = sweep(args.log, thresholds, windows, args.step_ms, args.led, args.expect, args.message,
+                    args.bit_ms, args.jobs)
+    key = "ber" if args.message else ("mae" if args.expect is not None else "std")
+    results.sort(key=lambda r: r[2][key])
+    print("threshold  window_ms  " + "  ".join("{:>8}".format(k) for k in results[0][2]))
+    for th, w, res in results:
+        print("{:9.1f}  {:9.1f}  ".format(th, w) + "  ".join("{:8.4f}".format(v) for v in res.values()))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Offline analysis of recorded LED sessions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("freq", help="per-LED frequency over time")
+    p.add_argument("log")
+    p.add_argument("--window-ms", type=float, default=1000)
+    p.add_argument("--step-ms", type=float, default=250)
+    p.add_argument("--debounce-us", type=float, default=5000)
+    p.add_argument("--out", help="save arrays to this .npz")
+    p.set_defaults(func=cmd_freq)
+
+    p = sub.add_parser("spectrogram", help="power over time and frequency for one LED")
+    p.add_argument("log")
+    p.add_argument("--led", type=int, default=0)
+    p.add_argument("--window-ms", type=float, default=1000)
+    p.add_argument("--step-ms", type=float, default=250)
+    p.add_argument("--out", help="save arrays to this .npz")
+    p.add_argument("--plot", action="store_true", help="show it (needs matplotlib)")
+    p.set_defaults(func=cmd_spectrogram)
+
+    p = sub.add_parser("ber", help="bit error rate of a 10/20 Hz FSK run against the sent message")
+    p.add_argument("log")
+    p.add_argument("--message", required=True)
+    p.add_argument("--led", type=int, default=0)
+    p.add_argument("--bit-ms", type=float, default=100)
+    p.add_argument("--window-ms", type=float, help="decision window inside each bit (default the whole bit)")
+    p.add_argument("--threshold", type=float)
+    p.add_argument("--debounce-us", type=float, default=5000)
+    p.set_defaults(func=cmd_ber)
+
+    p = sub.add_parser("convergence", help="consensus convergence from Agent.metrics_line() output")
+    p.add_argument("log")
+    p.add_argument("--tol", type=float, default=0.5)
+    p.add_argument("--out", help="save arrays to this .npz")
+    p.set_defaults(func=cmd_convergence)
+
+    p = sub.add_parser("sweep", help="thresholds x window lengths, in parallel")
+    p.add_argument("log")
+    p.add_argument("--thresholds", default="40:200:20")
+    p.add_argument("--windows", default="100,250,500,1000", help="window (or FSK decision window) lengths in ms")
+    p.add_argument("--step-ms", type=float, default=250)
+    p.add_argument("--led", type=int, default=0)
+    p.add_argument("--expect", type=float, help="true frequency, to rank by error")
+    p.add_argument("--message", help="sent FSK message, to rank by BER")
+    p.add_argument("--bit-ms", type=float, default=100)
+    p.add_argument("--jobs", type=int, help="worker processes (default: all cores)")
+    p.set_defaults(func=cmd_sweep)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+# fusion.py
+#
+# Multi-camera fusion service.
+#
+# Every camera prints one telemetry line per measurement window (see
+# ledfreq.report.telemetry_line). This service reads those lines from any
+# number of cameras in one asyncio loop, maps each camera's tick counter onto
+# the host clock and its pixel coordinates into arena coordinates, and merges
+# all readings into one table of LED tracks:
+#
+#   python -m ledhost.fusion --listen 0.0.0.0:7000 --cameras cameras.json
+#   python -m ledhost.fusion --serial /dev/ttyACM0 --serial /dev/ttyACM1
+#   python -m ledhost.fusion --simulate 20 --leds 12
+#
+# cameras.json maps a camera id to the 2x3 affine transform from its pixels
+# to arena coordinates: {"1": [[1, 0, 0], [0, 1, 0]], "2": [[1, 0, 320], ...]}.
+# Cameras without a transform are merged by frequency signature only.
+#
+# Readings are buffered as they arrive and merged in one vectorized batch
+# every `interval` seconds, so the cost per reading stays flat with tens of
+# cameras.
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+# ticks_us() on the OpenMV Cam wraps at 2**30
+TICKS_PERIOD = 1 << 30
+
+
+def host_us():
+    return time.monotonic() * 1000000.0
+
+
+def parse_line(line):
+    """Parse a telemetry line into (cam_id, start_tick, span_us, readings) or None.
+
+    readings is a list of (x, y, freq, confidence, phase_us) with phase_us
+    None when the camera could not fit one.
+    """
+    parts = line.split()
+    if len(parts) < 4 or parts[0] != "LED":
+        return None
+    try:
+        start = int(parts[2])
+        span = int(parts[3])
+        readings = []
+        for field in parts[4:]:
+            x, y, freq, conf, phase = [float(v) for v in field.split(",")]
+            readings.append((x, y, freq, conf, None if phase < 0 else phase))
+    except ValueError:
+        return None
+    return parts[1], start, span, readings
+
+
+class ClockAligner:
+    """Maps one camera's wrapping tick counter onto the host clock.
+
+    The offset is the minimum of (receive time - unwrapped tick) over the
+    last `window` lines: transport delay only ever adds to it, so the minimum
+    is the least-delayed sample, and the sliding window follows slow drift.
+    """
+
+    def __init__(self, window=64, period=TICKS_PERIOD):
+        self.period = period
+        self.samples = deque((), window)
+        self.last_tick = None
+        self.wraps = 0
+        self.offset = None
+
+    def unwrap(self, tick):
+        if self.last_tick is not None and tick < self.last_tick - self.period // 2:
+            self.wraps += 1
+        self.last_tick = tick
+        return tick + self.wraps * self.period
+
+    def update(self, tick, received_us):
+        """Feed the tick a line was sent at and its receive time; returns that tick on the host clock"""
+        t = self.unwrap(tick)
+        self.samples.append(received_us - t)
+        self.offset = min(self.samples)
+        return t + self.offset
+
+
+class Camera:
+    """Per-camera state: clock alignment and pixel -> arena transform"""
+
+    def __init__(self, cam_id, index, affine=None):
+        self.id = cam_id
+        self.index = index
+        self.affine = None if affine is None else np.asarray(affine, dtype=float)
+        self.clock = ClockAligner()
+        self.lines = 0
+
+    def to_arena(self, xy):
+        if self.affine is None:
+            return np.full(xy.shape, np.nan)
+        return xy @ self.affine[:, :2].T + self.affine[:, 2]
+
+
+class TrackTable:
+    """Global LED tracks, kept as parallel NumPy arrays.
+
+    An observation joins the track that minimises
+    (distance / pos_gate)^2 + (freq difference / freq_gate)^2, provided both
+    terms are within their gates; without arena coordinates only the
+    frequency term is used. Tracks blend new readings by confidence, with the
+    old state's weight halving every `half_life` seconds, and are dropped
+    after `ttl` seconds without a reading. `last` is the time the state
+    was last aged to (every track, every merge), `last_seen` the time a
+    reading last joined the track.
+    """
+
+    def __init__(self, pos_gate=8.0, freq_gate=0.75, half_life=2.0, ttl=10.0):
+        self.pos_gate = pos_gate
+        self.freq_gate = freq_gate
+        self.half_life = half_life
+        self.ttl = ttl
+        self.next_id = 0
+        self._alloc(0)
+
+    def _alloc(self, n):
+        self.ids = np.zeros(n, dtype=np.int64)
+        self.pos = np.full((n, 2), np.nan)
+        self.freq = np.zeros(n)
+        self.weight = np.zeros(n)
+        self.phase_c = np.zeros(n)
+        self.phase_s = np.zeros(n)
+        self.last = np.zeros(n)
+        self.last_seen = np.zeros(n)
+        self.cams = np.zeros(n, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _append(self, pos, freq, weight, phase_c, phase_s, last, cams):
+        n = len(freq)
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + n)])
+        self.next_id += n
+        self.pos = np.concatenate([self.pos, pos])
+        self.freq = np.concatenate([self.freq, freq])
+        self.weight = np.concatenate([self.weight, weight])
+        self.phase_c = np.concatenate([self.phase_c, phase_c])
+        self.phase_s = np.concatenate([self.phase_s, phase_s])
+        self.last = np.concatenate([self.last, last])
+        self.last_seen = np.concatenate([self.last_seen, last])
+        self.cams = np.concatenate([self.cams, cams])
+
+    def _cost(self, pos, freq, tpos, tfreq):
+        df = ((freq[:, None] - tfreq[None, :]) / self.freq_gate) ** 2
+        dp = ((pos[:, None, :] - tpos[None, :, :]) ** 2).sum(axis=2) / (self.pos_gate ** 2)
+        # No position on either side: frequency signature alone
+        dp = np.where(np.isnan(dp), 0.0, dp)
+        cost = df + dp
+        cost[(df > 1.0) | (dp > 1.0)] = np.inf
+        return cost
+
+    def merge(self, now, pos, freq, conf, rise, cam_bits):
+        """Merge a batch of M observations (arrays of length M, pos is M x 2).
+
+        rise is the host time of a rising edge (NaN if unknown), cam_bits
+        the observing camera as a bit mask.
+        """
+        keep = (freq > 0) & (conf > 0)
+        pos, freq, conf, rise, cam_bits = pos[keep], freq[keep], conf[keep], rise[keep], cam_bits[keep]
+        m = len(freq)
+
+        # Age the old state before blending in new readings, and turn the
+        # phase vectors forward so they refer to `now`
+        if len(self):
+            decay = 0.5 ** ((now - self.last) / (self.half_life * 1e6))
+            turn = 2 * np.pi * self.freq * (now - self.last) / 1e6
+            c, s = np.cos(turn), np.sin(turn)
+            self.phase_c, self.phase_s = (decay * (c * self.phase_c - s * self.phase_s),
+                                          decay * (s * self.phase_c + c * self.phase_s))
+            self.weight *= decay
+            self.last[:] = now
+
+        if m:
+            # Phase as an angle at `now`; rising edges are at most a window old
+            angle = 2 * np.pi * freq * (now - np.where(np.isnan(rise), now, rise)) / 1e6
+            has_phase = ~np.isnan(rise)
+            pc = np.where(has_phase, conf * np.cos(angle), 0.0)
+            ps = np.where(has_phase, conf * np.sin(angle), 0.0)
+
+            if len(self):
+                cost = self._cost(pos, freq, self.pos, self.freq)
+                best = np.argmin(cost, axis=1)
+                matched = np.isfinite(cost[np.arange(m), best])
+            else:
+                best = np.zeros(m, dtype=np.int64)
+                matched = np.zeros(m, dtype=bool)
+
+            if matched.any():
+                j = best[matched]
+                w = conf[matched]
+                n = len(self)
+                wsum = np.bincount(j, w, n)
+                fsum = np.bincount(j, w * freq[matched], n)
+                p = pos[matched]
+                has_pos = ~np.isnan(p[:, 0])
+                pw = np.where(has_pos, w, 0.0)
+                pwsum = np.bincount(j, pw, n)
+                xsum = np.bincount(j, pw * np.nan_to_num(p[:, 0]), n)
+                ysum = np.bincount(j, pw * np.nan_to_num(p[:, 1]), n)
+                old_has_pos = ~np.isnan(self.pos[:, 0])
+                old_pw = np.where(old_has_pos, self.weight, 0.0)
+                total_pw = old_pw + pwsum
+                upd = total_pw > 0
+                self.pos[upd, 0] = (old_pw[upd] * np.nan_to_num(self.pos[upd, 0]) + xsum[upd]) / total_pw[upd]
+                self.pos[upd, 1] = (old_pw[upd] * np.nan_to_num(self.pos[upd, 1]) + ysum[upd]) / total_pw[upd]
+                total = self.weight + wsum
+                self.freq = (self.weight * self.freq + fsum) / np.where(total > 0, total, 1.0)
+                self.weight = total
+                self.phase_c += np.bincount(j, pc[matched], n)
+                self.phase_s += np.bincount(j, ps[matched], n)
+                seen = wsum > 0
+                self.last_seen[seen] = now
+                self.cams[seen] = 0
+                np.bitwise_or.at(self.cams, j, cam_bits[matched])
+
+            # Unmatched readings found new tracks; several cameras seeing the
+            # same new LED in one batch must still end up on one track
+            first_new = len(self)
+            for i in np.flatnonzero(~matched):
+                if len(self) > first_new:
+                    cost = self._cost(pos[i:i + 1], freq[i:i + 1], self.pos[first_new:], self.freq[first_new:])[0]
+                    k = int(np.argmin(cost))
+                    if np.isfinite(cost[k]):
+                        self._blend(first_new + k, pos[i], freq[i], conf[i], pc[i], ps[i], cam_bits[i])
+                        continue
+                self._append(pos[i:i + 1], freq[i:i + 1], conf[i:i + 1], pc[i:i + 1], ps[i:i + 1],
+                             np.array([now]), cam_bits[i:i + 1])
+
+        self.expire(now)
+
+    def _blend(self, t, pos, freq, conf, pc, ps, cam_bit):
+        total = self.weight[t] + conf
+        self.freq[t] = (self.weight[t] * self.freq[t] + conf * freq) / total
+        if not np.isnan(pos[0]):
+            if np.isnan(self.pos[t, 0]):
+                self.pos[t] = pos
+            else:
+                self.pos[t] = (self.weight[t] * self.pos[t] + conf * pos) / total
+        self.weight[t] = total
+        self.phase_c[t] += pc
+        self.phase_s[t] += ps
+        self.cams[t] |= cam_bit
+
+    def expire(self, now):
+        """Drop tracks that have had no reading for more than ttl seconds"""
+        if not len(self):
+            return
+        alive = now - self.last_seen <= self.ttl * 1e6
+        if alive.all():
+            return
+        for name in ("ids", "pos", "freq", "weight", "phase_c", "phase_s", "last", "last_seen", "cams"):
+            setattr(self, name, getattr(self, name)[alive])
+
+    def snapshot(self, cameras=()):
+        """The table as a list of dicts, most trusted first"""
+        names = {c.index: c.id for c in cameras}
+        rows = []
+        for k in np.argsort(-self.weight):
+            phase = None
+            if self.phase_c[k] or self.phase_s[k]:
+                period = 1e6 / self.freq[k]
+                angle = math.atan2(self.phase_s[k], self.phase_c[k])
+                phase = self.last[k] - (angle / (2 * math.pi)) % 1.0 * period
+            bits = int(self.cams[k])
+            rows.append({
+                "id": int(self.ids[k]),
+                "x": None if np.isnan(self.pos[k, 0]) else round(float(self.pos[k, 0]), 2),
+                "y": None if np.isnan(self.pos[k, 1]) else round(float(self.pos[k, 1]), 2),
+                "freq": round(float(self.freq[k]), 3),
+                "weight": round(float(self.weight[k]), 3),
+                # Host time (us) of a rising edge, if any camera reported phase
+                "rise_us": None if phase is None else round(phase),
+                "cameras": [names.get(b, b) for b in range(64) if bits >> b & 1],
+            })
+        return rows
+
+
+class FusionService:
+    """Collects telemetry from many cameras and merges it every `interval` seconds"""
+
+    def __init__(self, transforms=None, interval=0.25, table=None, clock=host_us):
+        self.transforms = transforms or {}
+        self.interval = interval
+        self.table = table if table is not None else TrackTable()
+        self.clock = clock
+        self.cameras = {}
+        self.pending = []
+        self.subscribers = []
+        self.merges = 0
+        self.bad_lines = 0
+
+    def camera(self, cam_id):
+        cam = self.cameras.get(cam_id)
+        if cam is None:
+            if len(self.cameras) >= 64:
+                raise ValueError("at most 64 cameras")
+            cam = Camera(cam_id, len(self.cameras), self.transforms.get(cam_id))
+            self.cameras[cam_id] = cam
+        return cam
+
+    def ingest(self, line, received_us=None):
+        """Queue the readings of one telemetry line; returns False if it did not parse"""
+        if received_us is None:
+            received_us = self.clock()
+        parsed = parse_line(line)
+        if parsed is None:
+            self.bad_lines += 1
+            return False
+        cam_id, start, span, readings = parsed
+        cam = self.camera(cam_id)
+        cam.lines += 1
+        # The line is sent when the window ends
+        start_host = cam.clock.update((start + span) % TICKS_PERIOD, received_us) - span
+        for x, y, freq, conf, phase in readings:
+            rise = math.nan if phase is None else start_host + phase
+            self.pending.append((cam.index, x, y, freq, conf, rise))
+        return True
+
+    def merge(self, now=None):
+        """Merge everything queued since the last call and notify subscribers"""
+        if now is None:
+            now = self.clock()
+        batch = self.pending
+        self.pending = []
+        if batch:
+            a = np.array(batch, dtype=float)
+            idx = a[:, 0].astype(np.int64)
+            pos = np.full((len(a), 2), np.nan)
+            for cam in self.cameras.values():
+                sel = idx == cam.index
+                if sel.any():
+                    pos[sel] = cam.to_arena(a[sel, 1:3])
+            self.table.merge(now, pos, a[:, 3], a[:, 4], a[:, 5], np.left_shift(1, idx))
+        else:
+            self.table.merge(now, np.empty((0, 2)), np.empty(0), np.empty(0), np.empty(0),
+                             np.empty(0, dtype=np.int64))
+        self.merges += 1
+        rows = self.table.snapshot(self.cameras.values())
+        for q in self.subscribers:
+            if q.full():
+                q.get_nowait()
+            q.put_nowait(rows)
+        return rows
+
+    def subscribe(self, maxsize=1):
+        """Queue that receives the table after every merge; slow readers only see the latest"""
+        q = asyncio.Queue(maxsize)
+        self.subscribers.append(q)
+        return q
+
+    async def consume(self, lines):
+        """Ingest every line of an async iterator of str"""
+        async for line in lines:
+            self.ingest(line)
+
+    async def run(self):
+        """Merge forever every `interval` seconds"""
+        while True:
+            await asyncio.sleep(self.interval)
+            self.merge()
+
+    async def handle_client(self, reader, writer):
+        # One TCP connection per camera (or per forwarding bridge)
+        async def lines():
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    return
+                yield raw.decode("ascii", "replace")
+
+        try:
+            await self.consume(lines())
+        finally:
+            writer.close()
+
+
+async def serial_lines(port, baudrate=115200):
+    """Lines from a USB serial port, read in a worker thread (needs pyserial)"""
+    import serial
+
+    ser = serial.Serial(port, baudrate, timeout=1)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, ser.readline)
+            if raw:
+                yield raw.decode("ascii", "replace")
+    finally:
+        ser.close()
+
+
+# --- Simulated cameras ---
+
+async def simulated_camera(cam_id, leds, affine, window_ms=1000, offset_us=None, freq_noise=0.05,
+                           pos_noise=0.3, drop=0.0, max_delay_ms=20, speed=1.0, rng=None, seed=0):
+    """Telemetry lines of one fake camera watching `leds`.
+
+    leds is a list of (arena_x, arena_y, freq, rise_us) with rise_us a host
+    time of a rising edge. The camera sees every LED that falls inside its
+    320x320 view under `affine` (pixels -> arena), stamps windows with its
+    own wrapping tick counter and delivers each line after a random delay.
+    Without rng the noise is seeded from cam_id and seed, the same in every
+    run.
+    """
+    rng = rng or random.Random(zlib.crc32(str(cam_id).encode()) ^ seed)
+    a = np.asarray(affine, dtype=float)
+    inv = np.linalg.inv(np.vstack([a, [0, 0, 1]]))[:2]
+    if offset_us is None:
+        offset_us = rng.randrange(TICKS_PERIOD)
+    while True:
+        start_host = host_us()
+        await asyncio.sleep(window_ms / 1000.0 / speed)
+        parts = []
+        tick = int(start_host + offset_us) % TICKS_PERIOD
+        for x, y, freq, rise in leds:
+            px, py = inv @ np.array([x, y, 1.0])
+            if not (0 <= px < 320 and 0 <= py < 320) or rng.random() < drop:
+                continue
+            period = 1e6 / freq
+            phase = (rise - start_host) % period
+            parts.append("{:.1f},{:.1f},{:.3f},{:.2f},{:.0f}".format(
+                px + rng.gauss(0, pos_noise), py + rng.gauss(0, pos_noise),
+                freq + rng.gauss(0, freq_noise), 0.6 + 0.4 * rng.random(), phase))
+        line = "LED {} {} {} {}".format(cam_id, tick, window_ms * 1000, " ".join(parts))
+        await asyncio.sleep(rng.random() * max_delay_ms / 1000.0)
+        yield line
+
+
+def simulated_arena(num_cameras, num_leds, seed=1):
+    """A grid of overlapping camera views and LEDs scattered over it"""
+    rng = random.Random(seed)
+    cols = max(1, int(math.ceil(math.sqrt(num_cameras))))
+    transforms = {}
+    for i in range(num_cameras):
+        # 320 px views on a 240 px pitch, so neighbouring views overlap
+        transforms[str(i + 1)] = [[1, 0, 240 * (i % cols)], [0, 1, 240 * (i // cols)]]
+    rows = (num_cameras + cols - 1) // cols
+    now = host_us()
+    leds = [(rng.uniform(0, 240 * cols + 80), rng.uniform(0, 240 * rows + 80), rng.choice(range(2, 25)),
+             now + rng.uniform(0, 1e6)) for _ in range(num_leds)]
+    return transforms, leds
+
+
+def load_transforms(path):
+    with open(path) as f:
+        return {str(k): v for k, v in json.load(f).items()}
+
+
+def print_table(rows, out=sys.stdout):
+    out.write("{} tracks\n".format(len(rows)))
+    for r in rows:
+        pos = "     -,     -" if r["x"] is None else "{:6.1f},{:6.1f}".format(r["x"], r["y"])
+        out.write("  #{:<4} {}  {:6.2f} Hz  w {:5.2f}  cams {}\n".format(
+            r["id"], pos, r["freq"], r["weight"], ",".join(str(c) for c in r["cameras"])))
+
+
+async def main(args):
+    transforms = load_transforms(args.cameras) if args.cameras else {}
+    tasks = []
+    if args.simulate:
+        sim_transforms, leds = simulated_arena(args.simulate, args.leds, args.seed)
+        transforms.update(sim_transforms)
+    service = FusionService(transforms, interval=args.interval)
+    if args.simulate:
+        for cam_id, affine in sim_transforms.items():
+            tasks.append(asyncio.ensure_future(service.consume(simulated_camera(cam_id, leds, affine, seed=args.seed))))
+    for port in args.serial:
+        tasks.append(asyncio.ensure_future(service.consume(serial_lines(port, args.baudrate))))
+    server = None
+    if args.listen:
+        host, _, port = args.listen.rpartition(":")
+        server = await asyncio.start_server(service.handle_client, host or "0.0.0.0", int(port))
+    tasks.append(asyncio.ensure_future(service.run()))
+
+    updates = service.subscribe()
+    deadline = None if args.duration is None else time.monotonic() + args.duration
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                rows = await asyncio.wait_for(updates.get(), 1.0)
+            except asyncio.TimeoutError:
+                continue
+            if args.json:
+                print(json.dumps(rows))
+            elif service.merges % max(1, int(1.0 / args.interval)) == 0:
+                print_table(rows)
+        if args.simulate:
+            truth = sorted((round(f, 2), round(x), round(y)) for x, y, f, _ in leds)
+            print("truth:", truth)
+    finally:
+        for t in tasks:
+            t.cancel()
+        if server is not None:
+            server.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Fuse LED telemetry from several cameras")
+    parser.add_argument("--cameras", help="JSON file of per-camera pixel -> arena affine transforms")
+    parser.add_argument("--listen", help="host:port to accept telemetry over TCP")
+    parser.add_argument("--serial", action="append", default=[], help="USB serial port of a camera (needs pyserial)")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--simulate", type=int, default=0, help="number of simulated cameras")
+    parser.add_argument("--leds", type=int, default=8, help="LEDs in the simulated arena")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the simulated arena and cameras")
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between merges")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--json", action="store_true", help="print the table as JSON lines")
+    return parser
+
+
+if __name__ == "__main__":
+    asyncio.run(main(build_parser().parse_args()))
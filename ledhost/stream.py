@@ -0,0 +1,375 @@
+# stream.py
+#
+# Receiving ledfreq.stream ROI packets and rebuilding the frames on the host.
+#
+# The cam sends the crops around its tracked LEDs, coded against the
+# previous frame (see ledfreq/stream.py for the packet format). The
+# receiver checks every packet, rebuilds the crops and appends them to a
+# ring of records in a memory-mapped file, so the analysis side can work
+# on an hour of full-rate frames with NumPy without holding them in RAM:
+#
+#   python -m ledhost.stream --serial /dev/ttyACM0 --out roi.dat --seconds 60
+#   python -m ledhost.stream --replay capture.bin --out roi.dat
+#   buf = open_roi_buffer("roi.dat")          # later, read-only
+#   times, values = buf.latest(600)
+#   crop = buf.crop(values, 0)                # frames x h x w
+#
+# While receiving, the CLI prints the link rate, the compression, lost
+# frames and the frequencies found in every ROI from per-pixel spectra, the
+# analysis the cam can't afford at 60 fps: two LEDs sharing a crop show up
+# as two peaks.
+
+import argparse
+import json
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from ledfreq.stream import SYNC, HEADER, KEY, DELTA, PACKET_HEAD, HEAD_SIZE, STREAM_VERSION
+
+from .analyze import Trace
+from .fusion import TICKS_PERIOD
+
+
+class PacketParser:
+    """Splits a byte stream into (kind, seq, t_us, payload), skipping anything that isn't a good packet.
+
+    Text printed by the script between packets, a packet cut short by a
+    USB hiccup and false sync bytes all end in a CRC or sync failure and
+    a resync one byte further on.
+    """
+
+    def __init__(self, max_payload=65535):
+        self.buf = bytearray()
+        self.max_payload = max_payload
+        self.packets = 0
+        self.bad = 0
+        self.skipped = 0
+
+    def feed(self, data):
+        buf = self.buf
+        buf += data
+        packets = []
+        i = 0
+        while True:
+            j = buf.find(SYNC, i)
+            if j < 0:
+                # Keep a trailing first sync byte, its second may be in the next read
+                keep = 1 if buf.endswith(SYNC[:1]) else 0
+                self.skipped += len(buf) - i - keep
+                i = len(buf) - keep
+                break
+            self.skipped += j - i
+            if len(buf) - j < HEAD_SIZE:
+                i = j
+                break
+            kind, seq, t_us, n = struct.unpack_from(PACKET_HEAD, buf, j + 2)
+            if kind > DELTA or n > self.max_payload:
+                self.bad += 1
+                i = j + 1
+                continue
+            end = j + HEAD_SIZE + n
+            if len(buf) < end + 4:
+                i = j
+                break
+            if zlib.crc32(memoryview(buf)[j + 2:end]) != struct.unpack_from("<I", buf, end)[0]:
+                self.bad += 1
+                i = j + 1
+                continue
+            packets.append((kind, seq, t_us, bytes(buf[j + HEAD_SIZE:end])))
+            self.packets += 1
+            i = end + 4
+        del buf[:i]
+        return packets
+
+
+class RoiBuffer:
+    """Ring of rebuilt frames: records of <int64 t_us><uint8 pixels...> in a memory-mapped file.
+
+    The pixels of a record are the crops one after the other, each row by
+    row. path + ".json" holds the ROIs so open_roi_buffer() can map the
+    file again later; without a path the ring is kept in RAM.
+    """
+
+    def __init__(self, rois, capacity=36000, path=None, fps=60, mode="w+"):
+        self.rois = [tuple(r) for r in rois]
+        self.fps = fps
+        self.capacity = capacity
+        self.offsets = np.cumsum([0] + [w * h for _, _, w, h in self.rois])
+        self.dtype = np.dtype([("t", "<i8"), ("v", "u1", (int(self.offsets[-1]),))])
+        self.path = path
+        if path is None:
+            self.records = np.zeros(capacity, self.dtype)
+        else:
+            self.records = np.memmap(path, self.dtype, mode, shape=(capacity,))
+        self.count = 0
+        if path is not None and mode == "w+":
+            self._write_meta()
+
+    def _write_meta(self):
+        with open(self.path + ".json", "w") as f:
+            json.dump({"version": STREAM_VERSION, "rois": [list(r) for r in self.rois], "fps": self.fps,
+                       "capacity": self.capacity, "count": self.count}, f)
+
+    def append(self, t_us, pixels):
+        r = self.records[self.count % self.capacity]
+        r["t"] = t_us
+        r["v"] = pixels
+        self.count += 1
+
+    def latest(self, n=None):
+        """(times, values) of the last n frames (all held if None), oldest first"""
+        held = min(self.count, self.capacity)
+        n = held if n is None else min(n, held)
+        end = self.count % self.capacity
+        if n <= end:
+            r = self.records[end - n:end]
+        else:
+            r = np.concatenate([self.records[self.capacity - (n - end):], self.records[:end]])
+        return r["t"], r["v"]
+
+    def crop(self, values, roi):
+        """The pixels of one ROI from latest()'s values, frames x h x w"""
+        x, y, w, h = self.rois[roi]
+        return values[:, self.offsets[roi]:self.offsets[roi + 1]].reshape(-1, h, w)
+
+    def trace(self, n=None, reduce=np.max):
+        """analyze.Trace with one column per ROI (its brightest pixel by default)"""
+        times, values = self.latest(n)
+        cols = [reduce(values[:, self.offsets[k]:self.offsets[k + 1]], axis=1) for k in range(len(self.rois))]
+        centers = [(x + w // 2, y + h // 2) for x, y, w, h in self.rois]
+        return Trace(times.astype(np.float64), np.stack(cols, axis=1).astype(np.uint8), centers, self.fps)
+
+    def flush(self):
+        if self.path is not None:
+            self.records.flush()
+            self._write_meta()
+
+
+def open_roi_buffer(path):
+    """Map a RoiBuffer written by a receiver, read-only"""
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    buf = RoiBuffer(meta["rois"], meta["capacity"], path, meta.get("fps", 60), mode="r")
+    buf.count = meta["count"]
+    return buf
+
+
+class StreamReceiver:
+    """Rebuilds frames from packets into a RoiBuffer.
+
+    A DELTA only applies to the frame right before it; after a lost packet
+    the deltas are dropped until the next KEY. lost counts the frames that
+    never made it into the buffer for either reason. Times are unwrapped
+    from the cam's 30-bit ticks.
+    """
+
+    def __init__(self, path=None, capacity=36000):
+        self.path = path
+        self.capacity = capacity
+        self.parser = PacketParser()
+        self.buffer = None
+        self.rois = None
+        self.frame = None
+        self.expect = None
+        self.synced = False
+        self.frames = 0
+        self.lost = 0
+        self.bytes = 0
+        self._last_tick = None
+        self._t = 0
+
+    def feed(self, data):
+        """Parse data; returns the number of frames added"""
+        self.bytes += len(data)
+        before = self.frames
+        for kind, seq, t_us, payload in self.parser.feed(data):
+            self._packet(kind, seq, t_us, payload)
+        return self.frames - before
+
+    def _header(self, payload):
+        header = json.loads(payload.decode())
+        if header.get("version") != STREAM_VERSION:
+            return
+        rois = [tuple(r) for r in header["rois"]]
+        if rois == self.rois:
+            return
+        if self.buffer is not None:
+            self.buffer.flush()
+        self.rois = rois
+        self.buffer = RoiBuffer(rois, self.capacity, self.path, header.get("fps", 60))
+        # Row offsets into the record, in the order the cam walks them
+        ends = [0]
+        for x, y, w, h in rois:
+            for _ in range(h):
+                ends.append(ends[-1] + w)
+        self.row_ends = ends
+        self.frame = np.zeros(ends[-1], np.uint8)
+        self.parser.max_payload = ends[-1] + len(ends)
+        self.synced = False
+
+    def _apply(self, payload):
+        ends = self.row_ends
+        rows = len(ends) - 1
+        frame = self.frame
+        i = 0
+        p = 0
+        while p < len(payload) and i < rows:
+            c = payload[p]
+            p += 1
+            if c < 128:
+                i += c + 1
+                continue
+            n = min(c - 127, rows - i)
+            a = ends[i]
+            b = ends[i + n]
+            frame[a:b] = np.frombuffer(payload, np.uint8, b - a, p)
+            p += b - a
+            i += n
+        return i == rows and p == len(payload)
+
+    def _unwrap(self, tick):
+        if self._last_tick is not None:
+            self._t += (tick - self._last_tick) % TICKS_PERIOD
+        self._last_tick = tick
+        return self._t
+
+    def _packet(self, kind, seq, t_us, payload):
+        if kind == HEADER:
+            self._header(payload)
+            return
+        if self.buffer is None:
+            return
+        if self.expect is not None and seq != self.expect:
+            self.lost += (seq - self.expect) & 0xFFFF
+            self.synced = False
+        self.expect = (seq + 1) & 0xFFFF
+        if kind == DELTA and not self.synced:
+            self.lost += 1
+            return
+        if not self._apply(payload):
+            self.lost += 1
+            self.synced = False
+            return
+        self.synced = True
+        self.buffer.append(self._unwrap(t_us), self.frame)
+        self.frames += 1
+
+
+# --- Analysis ---
+
+def pixel_spectra(times, pixels, freqs):
+    """Power at freqs (F) of every pixel column of pixels (frames x P), at the real frame times; P x F"""
+    v = pixels.astype(np.float64)
+    v -= v.mean(axis=0)
+    t = (times - times[0]).astype(np.float64)
+    basis = np.exp(-2j * np.pi * t[:, None] * freqs[None, :] / 1e6)
+    return np.abs(v.T @ basis) ** 2 / max(1, len(t))
+
+
+def roi_frequencies(times, crop, freqs=None, max_leds=2, min_ratio=0.2):
+    """Frequencies of up to max_leds LEDs in a crop (frames x h x w).
+
+    Pixel spectra are summed without phase, so LEDs at different spots of
+    the crop don't cancel; the peaks of the sum at least min_ratio of the
+    strongest are the LEDs.
+    """
+    if len(times) < 8:
+        return []
+    if freqs is None:
+        rate = 1e6 / np.median(np.diff(times))
+        freqs = np.arange(0.5, rate / 2, 0.25)
+    total = pixel_spectra(times, crop.reshape(len(times), -1), freqs).sum(axis=0)
+    if total.max() <= 0:
+        return []
+    peaks = [k for k in range(1, len(total) - 1) if total[k] >= total[k - 1] and total[k] > total[k + 1]]
+    peaks = [k for k in sorted(peaks, key=lambda k: total[k], reverse=True) if total[k] >= min_ratio * total.max()]
+    return [float(freqs[k]) for k in peaks[:max_leds]]
+
+
+def serial_chunks(port):
+    """Raw bytes from the cam's USB serial port (needs pyserial)"""
+    import serial
+
+    ser = serial.Serial(port, 115200, timeout=0.1)
+    while True:
+        data = ser.read(ser.in_waiting or 1)
+        if data:
+            yield data
+
+
+def file_chunks(path, size=65536):
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(size)
+            if not data:
+                return
+            yield data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive ROI frames streamed by ledfreq.stream")
+    parser.add_argument("--serial", help="USB serial port of the camera (needs pyserial)")
+    parser.add_argument("--replay", help="raw stream bytes captured earlier (--raw)")
+    parser.add_argument("--out", help="memory-mapped frame file (default: keep the frames in RAM)")
+    parser.add_argument("--raw", help="also save the raw stream bytes here")
+    parser.add_argument("--capacity", type=int, default=36000, help="frames the ring holds")
+    parser.add_argument("--seconds", type=float, help="stop after this many seconds")
+    parser.add_argument("--report-s", type=float, default=1.0, help="seconds of frames per report")
+    parser.add_argument("--max-leds", type=int, default=2, help="LEDs to look for in each ROI")
+    args = parser.parse_args(argv)
+    if not (args.serial or args.replay):
+        parser.error("--serial or --replay is needed")
+
+    rx = StreamReceiver(args.out, args.capacity)
+    chunks = serial_chunks(args.serial) if args.serial else file_chunks(args.replay)
+    raw = open(args.raw, "wb") if args.raw else None
+    start = time.monotonic()
+    next_report = None
+    try:
+        for data in chunks:
+            if raw is not None:
+                raw.write(data)
+            rx.feed(data)
+            if rx.buffer is None or not rx.frames:
+                continue
+            now_us = rx._t
+            if next_report is None:
+                next_report = now_us + args.report_s * 1e6
+            if now_us >= next_report:
+                next_report += args.report_s * 1e6
+                report(rx, args.report_s, args.max_leds)
+            if args.seconds and time.monotonic() - start > args.seconds:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if raw is not None:
+            raw.close()
+        if rx.buffer is not None:
+            rx.buffer.flush()
+    print("{} frames, {} lost, {} bad packets, {} bytes skipped".format(rx.frames, rx.lost, rx.parser.bad,
+                                                                       rx.parser.skipped))
+
+
+def report(rx, seconds, max_leds=2):
+    buf = rx.buffer
+    times, values = buf.latest(int(seconds * buf.fps * 1.5))
+    times = times[times >= times[-1] - seconds * 1e6]
+    values = values[-len(times):]
+    raw = len(times) * values.shape[1]
+    parts = []
+    for k in range(len(buf.rois)):
+        found = roi_frequencies(times, buf.crop(values, k), max_leds=max_leds)
+        parts.append("roi{} {}".format(k, "/".join("{:.2f}".format(f) for f in found) or "-"))
+    rate = rx.bytes / max(1e-9, times[-1] / 1e6) if len(times) else 0.0
+    sys.stdout.write("{:8.1f} s  {:5.1f} fps  link {:6.1f} kB/s ({:.1f}x smaller)  lost {}  {}\n".format(
+        times[-1] / 1e6, len(times) / seconds, rate / 1000, raw * (times[-1] / 1e6) / seconds / max(1, rx.bytes),
+        rx.lost, "  ".join(parts)))
+
+
+if __name__ == "__main__":
+    main()
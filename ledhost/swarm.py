@@ -0,0 +1,417 @@
+# swarm.py
+#
+# Closed-loop swarm simulation on a virtual clock.
+#
+# Each simulated robot has an LED driver running ArduinoCodeforUART.c's
+# loop, a camera that sees some of the other robots' LEDs, and an
+# ledfreq.agent.Agent measuring them with the real on-device code. After
+# every round the agent's frequency goes to its own driver as the same
+# UART line main.py sends, so the whole loop is closed:
+#
+#   camera frames -> measure -> agent.update() -> "<freq>\n" -> setFrequency -> toggles -> frames
+#
+# Frames are rendered when the agent takes them, from the toggle times the
+# drivers actually produced, and nobody ever waits on the wall clock: an
+# hour of 12 s rounds for a handful of robots runs in seconds.
+#
+#   python -m ledhost.swarm --freqs 4,10,22,15 --topology ring --minutes 60
+#   python -m ledhost.swarm --freqs 4,10,22 --tick-us 1000 --phase-coupling 0.5
+#
+# Rounds run one at a time in order of their start; a round whose window
+# overlaps another's sees that round's UART lines at the times they were
+# sent. The one case that can't be honoured is a line sent to an LED some
+# longer, earlier-started window has already looked past; it is applied
+# as soon as possible instead and counted in Driver.late.
+
+import argparse
+import heapq
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+from ledfreq import compat
+from ledfreq.agent import Agent
+from ledfreq.report import send_frequency, send_phase
+
+from .synth import LED, Clock, Scene, SynthCamera, SynthImage
+
+
+def _to_float(text):
+    # Arduino String.toFloat(): the leading number, 0 if there is none
+    text = text.strip()
+    for end in range(len(text), 0, -1):
+        try:
+            return float(text[:end])
+        except ValueError:
+            pass
+    return 0.0
+
+
+class Driver:
+    """ArduinoCodeforUART.c on the virtual clock.
+
+    loop() runs every loop_us: it handles a received line, then toggles the
+    LED if the next toggle is due and schedules the one after it a half
+    period later. The sketch keeps time in whole tick_us ticks, 1 for the
+    micros() version in this repo and 1000 for the earlier millis() one,
+    whose half period was truncated to whole ms. A line arrives once its
+    characters have crossed the UART at baud. The LED boots at freq, 1 Hz
+    in the sketch, and stays there until the first line.
+    """
+
+    def __init__(self, freq=1.0, tick_us=1, loop_us=100, baud=19200, start_us=0):
+        self.tick_us = tick_us
+        self.loop_us = loop_us
+        self.baud = baud
+        self.freq = freq
+        self.prev_freq = freq
+        self.interval = self._interval(freq)
+        self.next_toggle = self._quantize(start_us) + self.interval
+        self.on = False
+        self.times = [start_us]
+        self.states = [False]
+        self.inbox = []
+        self.now = start_us
+        self.last_toggle = None
+        self.received = 0
+        self.late = 0
+
+    def _interval(self, freq):
+        if freq <= 0:
+            freq = 1.0
+        return int(500000.0 / freq / self.tick_us) * self.tick_us
+
+    def _quantize(self, t_us):
+        return int(t_us) // self.tick_us * self.tick_us
+
+    def _iteration(self, t_us):
+        # First loop() pass at or after t_us
+        if self.loop_us <= 0:
+            return int(t_us)
+        return -(-int(t_us) // self.loop_us) * self.loop_us
+
+    def write(self, line, t_us):
+        """A line written to the driver's UART at t_us"""
+        arrival = t_us + int(len(line) * 10 * 1000000 / self.baud)
+        if arrival < self.now:
+            arrival = self.now
+            self.late += 1
+        self.inbox.append((arrival, line))
+        self.inbox.sort(key=lambda e: e[0])
+
+    def _set(self, t_us, on):
+        self.on = on
+        self.times.append(t_us)
+        self.states.append(on)
+
+    def _command(self, line, at):
+        now = self._quantize(at)
+        line = line.strip()
+        self.received += 1
+        if line.startswith("P"):
+            delay_ms = _to_float(line[1:])
+            if delay_ms >= 0:
+                if self.on:
+                    self._set(at, False)
+                self.next_toggle = now + self._quantize(delay_ms * 1000.0)
+        else:
+            freq = _to_float(line)
+            if freq > 0 and freq != self.prev_freq:
+                # Keep the phase: scale the time left in this half period to the new interval
+                old = self.interval
+                remaining = max(0, self.next_toggle - now)
+                self.freq = freq
+                self.prev_freq = freq
+                self.interval = self._interval(freq)
+                self.next_toggle = now + self._quantize(remaining * self.interval / old)
+
+    def advance(self, t_us):
+        """Run loop() up to t_us"""
+        while True:
+            due = self._iteration(self.next_toggle)
+            if self.last_toggle is not None and due <= self.last_toggle:
+                # One toggle per pass
+                due = self.last_toggle + max(1, self.loop_us)
+            if self.inbox:
+                at = self._iteration(self.inbox[0][0])
+                if at <= due:
+                    if at > t_us:
+                        break
+                    self.now = at
+                    self._command(self.inbox.pop(0)[1], at)
+                    continue
+            if due > t_us:
+                break
+            self.now = due
+            self._set(due, not self.on)
+            self.last_toggle = due
+            self.next_toggle += self.interval
+        if t_us > self.now:
+            self.now = int(t_us)
+
+    def state(self, t_us):
+        """On/off (bool array) at the times in t_us"""
+        t = np.asarray(t_us, dtype=np.float64)
+        self.advance(int(t.max()))
+        times = self.times
+        states = self.states
+        out = [states[max(0, bisect_right(times, x) - 1)] for x in t.ravel()]
+        return np.array(out, dtype=bool).reshape(t.shape)
+
+    def blink_hz(self):
+        """The frequency the LED really blinks at, after the half period is cut to whole ticks"""
+        return 500000.0 / self.interval if self.interval else 0.0
+
+
+class DriverLED(LED):
+    """An LED in one camera's view whose on/off comes from a Driver"""
+
+    def __init__(self, x, y, driver, **kwargs):
+        LED.__init__(self, x, y, freq=None, **kwargs)
+        self.driver = driver
+
+    def state(self, t_us):
+        return self.driver.state(t_us)
+
+
+class LiveCamera(SynthCamera):
+    """SynthCamera that renders every frame when it is taken, so the scene can react to the code under test.
+
+    The sensor free-runs at fps from phase_us; snapshot() returns the first
+    frame after the clock. jitter_us, drop, noise and exposure_us are as in
+    synth.render().
+    """
+
+    def __init__(self, scene, clock, fps=60, phase_us=0, jitter_us=0.0, drop=0.0, noise=0.0, exposure_us=0.0,
+                 seed=0):
+        self.scene = scene
+        self.clock = clock
+        self.phase_us = phase_us
+        self.jitter_us = jitter_us
+        self.drop = drop
+        self.noise = noise
+        self.sub = np.linspace(-exposure_us, 0.0, 5) if exposure_us else np.zeros(1)
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.realtime = None
+        self.set_framerate(fps)
+
+    def set_framerate(self, fps):
+        self.period_us = 1e6 / fps
+
+    def snapshot(self):
+        k = int((self.clock.t - self.phase_us) // self.period_us) + 1
+        while self.drop and self.rng.random() < self.drop:
+            k += 1
+        t = self.phase_us + k * self.period_us
+        if self.jitter_us:
+            t += self.rng.normal(0.0, self.jitter_us)
+        t = max(int(t), self.clock.t + 1)
+        self.clock.t = t
+        levels = []
+        for led in self.scene.leds:
+            v = led.off + (led.on - led.off) * led.state(t + self.sub).mean()
+            if self.noise:
+                v += self.rng.normal(0.0, self.noise)
+            levels.append(int(min(255, max(0, round(v)))))
+        self.count += 1
+        return SynthImage(self.scene, levels)
+
+
+class DriverUART:
+    """The camera's UART, wired to a Driver: write() is what report.send_frequency calls"""
+
+    def __init__(self, driver, clock):
+        self.driver = driver
+        self.clock = clock
+
+    def write(self, msg):
+        self.driver.write(msg, self.clock.t)
+        return len(msg)
+
+
+class Node:
+    """One robot: its LED driver, its camera and the agent running on the camera"""
+
+    def __init__(self, agent, camera, driver, first_us=0):
+        self.agent = agent
+        self.camera = camera
+        self.driver = driver
+        self.uart = DriverUART(driver, camera.clock)
+        self.first_us = first_us
+
+
+class Swarm:
+    """Runs every node's rounds on one virtual clock, the way main.py schedules them.
+
+    main.py bumps the agent's flag once a second and updates when it
+    reaches timeperiod; the second the update falls in lasts as long as
+    the measurement does. So a round starts timeperiod s after the last
+    one, or timeperiod - 1 s after it ended if it took over a second.
+    With announce, every agent sends its starting frequency at time 0;
+    main.py doesn't, so the LEDs blink at the driver's boot rate until
+    each agent's first round.
+    """
+
+    def __init__(self, nodes, clock, announce=False):
+        self.nodes = nodes
+        self.clock = clock
+        self.announce = announce
+        self.log = []
+        self.wall_s = 0.0
+        self.queue = None
+        self.end_us = 0
+
+    def _send(self, node):
+        agent = node.agent
+        send_frequency(node.uart, agent.freq, verbose=False)
+        if agent.phase_coupling > 0:
+            send_phase(node.uart, agent.sync_delay_ms(), verbose=False)
+
+    def run(self, duration_s, on_round=None):
+        """Simulate duration_s more of virtual time; on_round(row) is called after every round"""
+        compat.set_clock(self.clock)
+        if self.queue is None:
+            self.queue = [(node.first_us, i) for i, node in enumerate(self.nodes)]
+            heapq.heapify(self.queue)
+            if self.announce:
+                self.clock.t = 0
+                for node in self.nodes:
+                    self._send(node)
+        self.end_us += int(duration_s * 1e6)
+        queue = self.queue
+        wall = time.perf_counter()
+        while queue and queue[0][0] <= self.end_us:
+            start, i = heapq.heappop(queue)
+            node = self.nodes[i]
+            self.clock.t = start
+            node.agent.update()
+            self._send(node)
+            end = self.clock.t
+            period = node.agent.timeperiod * 1000000
+            heapq.heappush(queue, (max(start + period, end + period - 1000000), i))
+            row = dict(node.agent.metrics)
+            row.update({"t_s": end / 1e6, "agent": node.agent.id, "led_hz": node.driver.blink_hz()})
+            self.log.append(row)
+            if on_round is not None:
+                on_round(row)
+        self.wall_s += time.perf_counter() - wall
+        return self.log
+
+    def freqs(self):
+        return [node.agent.freq for node in self.nodes]
+
+    def spread(self):
+        """Largest difference between two agents' frequencies"""
+        f = self.freqs()
+        return max(f) - min(f)
+
+    def converged_at(self, tolerance=0.1):
+        """Time (s) after which every agent stayed within tolerance of the others, or None"""
+        latest = {}
+        since = None
+        for row in self.log:
+            latest[row["agent"]] = row["freq"]
+            if len(latest) < len(self.nodes):
+                continue
+            if max(latest.values()) - min(latest.values()) <= tolerance:
+                if since is None:
+                    since = row["t_s"]
+            else:
+                since = None
+        return since
+
+
+# --- Builders ---
+
+def visible(topology, n):
+    """For each robot, the robots whose LEDs its camera sees"""
+    if topology == "full":
+        return [[j for j in range(n) if j != i] for i in range(n)]
+    if topology == "ring":
+        return [sorted({(i - 1) % n, (i + 1) % n} - {i}) for i in range(n)]
+    if topology == "line":
+        return [[j for j in (i - 1, i + 1) if 0 <= j < n] for i in range(n)]
+    raise ValueError("unknown topology {!r}".format(topology))
+
+
+def build_swarm(freqs, topology="ring", timeperiod=12, stepsize=0.2, duration_ms=1000, fusion="sum",
+                phase_coupling=0.0, measure=None, fps=60, jitter_us=0.0, drop=0.0, noise=0.0, exposure_us=0.0,
+                tick_us=1, loop_us=100, boot_hz=1.0, announce=False, seed=0):
+    """A Swarm of len(freqs) robots starting at those frequencies.
+
+    Cameras free-run at random sensor phases and the robots were switched
+    on at random times, so their rounds are staggered as on the bench.
+    """
+    rng = np.random.default_rng(seed)
+    clock = Clock(0)
+    n = len(freqs)
+    drivers = [Driver(boot_hz, tick_us, loop_us) for _ in range(n)]
+    nodes = []
+    for i, seen in enumerate(visible(topology, n)):
+        # LEDs across the middle of the view, far enough apart not to bleed into each other
+        leds = [DriverLED(int(40 + 240 * (k + 0.5) / len(seen)), 160, drivers[j]) for k, j in enumerate(seen)]
+        cam = LiveCamera(Scene(leds), clock, fps, phase_us=int(rng.uniform(0, 1e6 / fps)), jitter_us=jitter_us,
+                         drop=drop, noise=noise, exposure_us=exposure_us, seed=seed * 1000 + i)
+        flag = int(rng.integers(0, timeperiod))
+        agent = Agent(i, freqs[i], timeperiod, stepsize, flag, [(led.x, led.y) for led in leds], cam=cam,
+                      duration_ms=duration_ms, measure=measure, fusion=fusion, phase_coupling=phase_coupling)
+        first = (timeperiod - flag) * 1000000 + int(rng.uniform(0, 1e6))
+        nodes.append(Node(agent, cam, drivers[i], first))
+    return Swarm(nodes, clock, announce)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the camera -> agent -> LED driver loop of a swarm")
+    parser.add_argument("--freqs", default="4,10,22,15", help="starting frequency of every robot")
+    parser.add_argument("--topology", default="ring", choices=("ring", "line", "full"))
+    parser.add_argument("--minutes", type=float, default=60.0, help="virtual time to simulate")
+    parser.add_argument("--timeperiod", type=int, default=12, help="seconds between an agent's rounds")
+    parser.add_argument("--stepsize", type=float, default=0.2)
+    parser.add_argument("--window-ms", type=int, default=1000, help="measurement window")
+    parser.add_argument("--fusion", default="sum")
+    parser.add_argument("--phase-coupling", type=float, default=0.0)
+    parser.add_argument("--fps", type=float, default=60)
+    parser.add_argument("--jitter-us", type=float, default=0.0)
+    parser.add_argument("--drop", type=float, default=0.0)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--tick-us", type=int, default=1, help="driver clock tick: 1 = micros(), 1000 = millis()")
+    parser.add_argument("--loop-us", type=int, default=100, help="time one pass of the driver's loop() takes")
+    parser.add_argument("--announce", action="store_true", help="send every starting frequency at time 0")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="convergence tolerance in Hz")
+    parser.add_argument("--every", type=float, default=60.0, help="print the swarm state every this many s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    freqs = [float(f) for f in args.freqs.split(",")]
+    swarm = build_swarm(freqs, args.topology, args.timeperiod, args.stepsize, args.window_ms, args.fusion,
+                        args.phase_coupling, fps=args.fps, jitter_us=args.jitter_us, drop=args.drop,
+                        noise=args.noise, tick_us=args.tick_us, loop_us=args.loop_us, announce=args.announce,
+                        seed=args.seed)
+    state = {"next": args.every}
+
+    def show(row):
+        if row["t_s"] >= state["next"]:
+            state["next"] += args.every
+            print("{:8.1f} s  spread {:7.3f} Hz  agents {}  leds {}".format(
+                row["t_s"], swarm.spread(), " ".join("{:.2f}".format(f) for f in swarm.freqs()),
+                " ".join("{:.2f}".format(node.driver.blink_hz()) for node in swarm.nodes)))
+
+    print("    time      spread")
+    swarm.run(args.minutes * 60, show)
+    converged = swarm.converged_at(args.tolerance)
+    virtual = args.minutes * 60
+    print("{} rounds, {:.0f} s simulated in {:.1f} s ({:.0f}x real time)".format(
+        len(swarm.log), virtual, swarm.wall_s, virtual / swarm.wall_s if swarm.wall_s else 0))
+    if converged is None:
+        print("not converged to {} Hz".format(args.tolerance))
+    else:
+        print("converged to {} Hz at {:.1f} s".format(args.tolerance, converged))
+    late = sum(node.driver.late for node in swarm.nodes)
+    if late:
+        print("{} UART lines reached an LED after another camera had looked past them".format(late))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+# sweep.py
+#
+# Parameter sweeps of the ledfreq measurement and decoding code.
+#
+# A sweep runs one of the tasks below over every point of a parameter grid.
+# The tasks call the real on-device functions (pipeline, fsk, localize)
+# against a SynthCamera, so what is tuned here is exactly what runs on the
+# camera:
+#
+#   python -m ledhost.sweep freq --set decode.window_ms=100,250,500,1000 --set sample.debounce_us=0,5000
+#   python -m ledhost.sweep fsk --set decode.max_transitions=1,2,3 --set camera.jitter_us=0,2000
+#   python -m ledhost.sweep fec --set link.code=parity,hamming12,hamming7 --set camera.drop=0.02,0.05
+#   python -m ledhost.sweep blob --set blob.lo=150,200,240 --set blob.pixels=5,10,20
+#   python -m ledhost.sweep freq --trace trace.bin --expect 7.3
+#
+# Parameters are named <stage>.<name>. "scene." and "camera." parameters
+# decide the rendered frames; everything else only changes how they are
+# processed, except "link." parameters (what the transmitter sends), which
+# decide the frames too but are compared like decoder settings. Grid points
+# are grouped by their frames, each group runs in one worker process and
+# renders its frames once (or loads them from the on-disk cache), so a sweep
+# that only varies later stages never re-renders.
+#
+# Tasks split into a sampling pass over the frames and a decode of what it
+# collected (freq, fsk, fec) cache that too: the sampled edges or counts
+# are keyed by the frames plus the parameters the sampling depends on
+# ("sample." ones and the task's own list, e.g. the decision window), so a
+# sweep over decoder settings alone samples each set of frames once.
+#
+# Results are averaged over the scene/camera variations of each decoder
+# setting and the non-dominated settings (lowest error for their latency)
+# are printed as the accuracy-versus-latency Pareto front.
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .synth import LED, Scene, Frames, SynthCamera, EndOfFrames, render, replay_trace
+
+DEFAULT_CACHE = ".sweep_cache"
+FRAME_STAGES = ("scene", "camera")
+RENDER_STAGES = FRAME_STAGES + ("link",)
+
+
+# --- Tasks ---
+#
+# A task is (defaults, duration_ms(params), scene(params), run(cam, scene, params), stages)
+# where run returns {"error": ..., "latency_ms": ..., ...}. stages is None,
+# or (names, sample(cam, scene, params), decode(samples, scene, params)) for
+# tasks whose run is decode(sample(...)); sample returns plain JSON-able
+# data that depends only on the frames and on the parameters in names
+# besides the "sample." ones.
+
+def _freq_scene(p):
+    return Scene([LED(160, 160, freq=p["scene.freq"], phase=p["scene.phase"], duty=p["scene.duty"])])
+
+
+def _freq_sample(cam, scene, p):
+    from ledfreq.pipeline import measure_led_frequencies
+    from ledfreq.sequential import ToleranceStop
+
+    led = scene.leds[0]
+    center = (led.x, led.y)
+    start = cam.now_ms()
+    thresholds = None if p["sample.threshold"] is None else [p["sample.threshold"]]
+    stop = ToleranceStop(p["decode.tolerance_hz"], 1000000 // p["camera.fps"]) if p["decode.tolerance_hz"] else None
+    # frequency_from_fit is the pipeline default, which also knows the frame period
+    m = measure_led_frequencies(cam, [center], p["decode.window_ms"], fps=p["camera.fps"], thresholds=thresholds,
+                                debounce_us=p["sample.debounce_us"], stop=stop)[0]
+    return {"edges": list(m.edges), "span_us": m.span_us, "fit_freq": m.freq, "latency_ms": cam.now_ms() - start}
+
+
+def _freq_decode(s, scene, p):
+    from ledfreq import estimate
+
+    name = p["decode.estimator"]
+    freq = s["fit_freq"] if name == "frequency_from_fit" else getattr(estimate, name)(s["edges"], s["span_us"])
+    truth = p.get("expect", scene.leds[0].freq)
+    return {"error": abs(freq - truth), "latency_ms": s["latency_ms"], "freq": freq}
+
+
+def _fsk_bits(p):
+    rng = np.random.default_rng(p["scene.seed"])
+    return [int(b) for b in rng.integers(0, 2, p["scene.bits"])]
+
+
+def _fsk_scene(p):
+    return Scene([LED(160, 160, bits=_fsk_bits(p), bit_ms=p["scene.bit_ms"], phase=p["scene.phase"])])
+
+
+def _fsk_sample(cam, scene, p):
+    from ledfreq.fsk import measure_led_frequency_robust
+    from ledfreq.sample import calibrate_thresholds
+
+    led = scene.leds[0]
+    center = (led.x, led.y)
+    threshold = p["sample.threshold"]
+    if threshold is None:
+        threshold = calibrate_thresholds(cam, [center])[0]
+    bit_us = led.bit_ms * 1000
+    window = p["decode.window_ms"]
+    # Centre the decision window in each bit, shifted by the sync error
+    lead = (led.bit_ms - window) / 2.0 + p["decode.sync_ms"]
+    counts = []
+    for k in range(len(led.bits)):
+        cam.clock.t = int(k * bit_us + lead * 1000) - 1
+        _, count = measure_led_frequency_robust(cam, center, window, threshold)
+        counts.append(count)
+    return counts
+
+
+def _fsk_decode(counts, scene, p):
+    bits = scene.leds[0].bits
+    errors = 0
+    for count, bit in zip(counts, bits):
+        errors += int((count > p["decode.max_transitions"]) != bool(bit))
+    return {"error": errors / float(len(bits)), "latency_ms": p["decode.window_ms"]}
+
+
+FEC_CODES = {"parity": None, "hamming12": "HAMMING_12_8", "hamming7": "HAMMING_7_4"}
+
+
+def _fec_bytes(p):
+    rng = np.random.default_rng(p["scene.seed"])
+    return [int(b) for b in rng.integers(0, 256, p["scene.bytes"])]
+
+
+def _fec_frame_bits(p):
+    from ledfreq import fec
+    from ledfreq.fsk import uart_frame
+
+    name = FEC_CODES[p["link.code"]]
+    bits = []
+    for byte in _fec_bytes(p):
+        bits += uart_frame(byte) if name is None else fec.encode_frame(byte, getattr(fec, name))
+    return bits
+
+
+def _fec_scene(p):
+    return Scene([LED(160, 160, bits=_fec_frame_bits(p), bit_ms=p["scene.bit_ms"], phase=p["scene.phase"])])
+
+
+def _fec_sample(cam, scene, p):
+    from ledfreq.sample import calibrate_thresholds, sample_edges
+
+    led = scene.leds[0]
+    center = (led.x, led.y)
+    threshold = calibrate_thresholds(cam, [center])[0]
+    bit_us = led.bit_ms * 1000
+    window = p["decode.window_ms"]
+    lead = (led.bit_ms - window) / 2.0 + p["decode.sync_ms"]
+    windows = []
+    for k in range(len(led.bits)):
+        cam.clock.t = int(k * bit_us + lead * 1000) - 1
+        edges, _ = sample_edges(cam, [center], window, [threshold])
+        windows.append(edges[0])
+    return windows
+
+
+def _fec_decode(windows, scene, p):
+    from ledfreq import fec
+    from ledfreq.fsk import soft_bit, validate_uart_frame
+
+    led = scene.leds[0]
+    bits = []
+    rel = []
+    for edges in windows:
+        b, r = soft_bit(edges, p["decode.max_transitions"])
+        bits.append(b)
+        rel.append(r)
+    name = FEC_CODES[p["link.code"]]
+    size = 11 if name is None else fec.frame_length(getattr(fec, name))
+    sent = _fec_bytes(p)
+    good = 0
+    for j, byte in enumerate(sent):
+        frame = bits[j * size:(j + 1) * size]
+        if name is None:
+            got = validate_uart_frame(frame, verbose=False)
+        else:
+            res = fec.decode_frame(frame, rel[j * size:(j + 1) * size] if p["decode.soft"] else None,
+                                   getattr(fec, name))
+            got = None if res is None else res[0]
+        good += int(got == byte)
+    frame_ms = size * led.bit_ms
+    # A byte that fails is sent again after a resync round trip, so every
+    # attempt costs frame_ms + turnaround and only good ones carry data
+    attempt_ms = frame_ms + p["arq.turnaround_ms"]
+    return {"error": 1.0 - good / float(len(sent)), "latency_ms": frame_ms,
+            "goodput_bps": 8000.0 * good / len(sent) / attempt_ms}
+
+
+def _blob_scene(p):
+    return Scene([LED(120 + 60 * i, 160, freq=p["scene.freq"] + 3 * i, phase=0.37 * i, on=p["scene.on"],
+                      radius=p["scene.radius"]) for i in range(p["scene.leds"])])
+
+
+def _blob_run(cam, scene, p):
+    from ledfreq.localize import BlobTracker
+
+    tracker = BlobTracker([(p["blob.lo"], 255)], pixels_threshold=p["blob.pixels"],
+                          area_threshold=p["blob.pixels"], num_leds=len(scene.leds),
+                          stable_frames=p["blob.stable_frames"])
+    start = cam.now_ms()
+    centers = tracker.detect(cam, p["blob.timeout_ms"])
+    latency = cam.now_ms() - start
+    # Mean distance to the true LEDs, with a missed LED costing 50 px
+    error = 0.0
+    for led in scene.leds:
+        d = [((c[0] - led.x) ** 2 + (c[1] - led.y) ** 2) ** 0.5 for c in centers]
+        error += min(d + [50.0])
+    return {"error": error / len(scene.leds), "latency_ms": latency, "found": len(centers)}
+
+
+TASKS = {
+    "freq": ({
+        "scene.freq": [7.3], "scene.phase": [0.0], "scene.duty": [0.5],
+        "camera.fps": [60], "camera.jitter_us": [800], "camera.drop": [0.01], "camera.noise": [4.0],
+        "camera.seed": [0, 1, 2],
+        "sample.threshold": [None], "sample.debounce_us": [5000],
+        "decode.window_ms": [100, 250, 500, 1000], "decode.estimator": ["frequency_from_fit"],
+        "decode.tolerance_hz": [0],
+    }, lambda p: p["decode.window_ms"] + 400, _freq_scene, None,
+        (("decode.window_ms", "decode.tolerance_hz"), _freq_sample, _freq_decode)),
+    "fsk": ({
+        "scene.bits": [64], "scene.bit_ms": [100], "scene.phase": [0.0], "scene.seed": [0],
+        "camera.fps": [60], "camera.jitter_us": [800], "camera.drop": [0.01], "camera.noise": [4.0],
+        "camera.seed": [0, 1],
+        "sample.threshold": [None],
+        "decode.window_ms": [50, 80, 100], "decode.max_transitions": [1, 2, 3], "decode.sync_ms": [0],
+    }, lambda p: p["scene.bits"] * p["scene.bit_ms"] + 200, _fsk_scene, None,
+        (("decode.window_ms", "decode.sync_ms"), _fsk_sample, _fsk_decode)),
+    "fec": ({
+        "link.code": ["parity", "hamming12", "hamming7"], "scene.bytes": [32], "scene.bit_ms": [100],
+        "scene.phase": [0.0], "scene.seed": [0],
+        "camera.fps": [60], "camera.jitter_us": [800], "camera.drop": [0.03], "camera.noise": [4.0],
+        "camera.seed": [0, 1],
+        "decode.window_ms": [80], "decode.max_transitions": [2], "decode.sync_ms": [0, 10],
+        "decode.soft": [False, True], "arq.turnaround_ms": [500],
+    }, lambda p: p["scene.bytes"] * 16 * p["scene.bit_ms"] + 200, _fec_scene, None,
+        (("decode.window_ms", "decode.sync_ms"), _fec_sample, _fec_decode)),
+    "blob": ({
+        "scene.leds": [1], "scene.freq": [10.0], "scene.on": [230], "scene.radius": [4],
+        "camera.fps": [60], "camera.jitter_us": [0], "camera.drop": [0.0], "camera.noise": [4.0],
+        "camera.seed": [0, 1],
+        "blob.lo": [200], "blob.pixels": [10], "blob.stable_frames": [3], "blob.timeout_ms": [2000],
+    }, lambda p: p["blob.timeout_ms"] + 100, _blob_scene, _blob_run, None),
+}
+
+
+# --- Frames and the cache ---
+
+def frame_key(task, params):
+    """The scene/camera/link part of a grid point, which alone decides its frames"""
+    return tuple(sorted((k, v) for k, v in params.items() if k.split(".")[0] in RENDER_STAGES)) + (("task", task),)
+
+
+def _cache_path(cache_dir, key, ext=".npz"):
+    digest = hashlib.sha1(json.dumps(list(key)).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, digest + ext)
+
+
+def frames_for(task, params, duration, cache_dir=None):
+    """Render duration ms of frames for a grid point, or load them from cache_dir.
+
+    Cached frames are reused whenever they are long enough; a longer
+    render replaces them.
+    """
+    key = frame_key(task, params)
+    path = None
+    if cache_dir:
+        path = _cache_path(cache_dir, key)
+        if os.path.exists(path):
+            data = np.load(path)
+            if len(data["times"]) and data["times"][-1] >= duration * 1000 - 1e6 / params["camera.fps"]:
+                return Frames(data["times"], data["levels"])
+    scene = TASKS[task][2](params)
+    frames = render(scene, duration, fps=params["camera.fps"], jitter_us=params["camera.jitter_us"],
+                    drop=params["camera.drop"], noise=params["camera.noise"], seed=params["camera.seed"])
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, times=frames.times, levels=frames.levels)
+        os.replace(tmp, path)
+    return frames
+
+
+def sample_key(params, names):
+    """The sample-stage part of a grid point: "sample." parameters plus the task's own names"""
+    return tuple(sorted((k, v) for k, v in params.items() if k.split(".")[0] == "sample" or k in names))
+
+
+def samples_for(task, params, scene, frames, cache_dir=None):
+    """The sample stage's output for a grid point, from cache_dir if it has been run on these frames before.
+
+    None if the frames ran out during sampling.
+    """
+    names, sample, _ = TASKS[task][4]
+    path = None
+    if cache_dir:
+        path = _cache_path(cache_dir, frame_key(task, params) + sample_key(params, names) + (("stage", "sample"),),
+                           ".json")
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+    try:
+        data = sample(SynthCamera(scene, frames), scene, params)
+    except EndOfFrames:
+        return None
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    return data
+
+
+def run_group(job):
+    """Run every grid point sharing one set of frames; executed in a worker process.
+
+    For staged tasks the points are grouped again by sample_key, and each
+    group samples the frames once and decodes every point from that.
+    """
+    task, points, cache_dir, trace = job
+    _, duration_fn, scene_fn, run, stages = TASKS[task]
+    if trace:
+        scene, frames = replay_trace(trace)
+        # The frame key doesn't know the trace, so its samples aren't cached on disk
+        cache_dir = None
+    else:
+        scene = scene_fn(points[0])
+        frames = frames_for(task, points[0], max(duration_fn(p) for p in points), cache_dir)
+    failed = {"error": float("inf"), "latency_ms": float("inf")}
+    results = []
+    if stages is None:
+        for p in points:
+            try:
+                res = run(SynthCamera(scene, frames), scene, p)
+            except EndOfFrames:
+                res = failed
+            results.append((p, res))
+        return results
+    names, _, decode = stages
+    samples = {}
+    for p in points:
+        key = sample_key(p, names)
+        if key not in samples:
+            samples[key] = samples_for(task, p, scene, frames, cache_dir)
+        data = samples[key]
+        results.append((p, failed if data is None else decode(data, scene, p)))
+    return results
+
+
+# --- Grid, aggregation and the Pareto front ---
+
+def expand(grid):
+    names = sorted(grid)
+    for values in itertools.product(*[grid[n] for n in names]):
+        yield dict(zip(names, values))
+
+
+def run_sweep(task, grid, jobs=None, cache_dir=DEFAULT_CACHE, trace=None):
+    """Every grid point of task; returns [(params, result)]"""
+    groups = {}
+    for p in expand(grid):
+        groups.setdefault(frame_key(task, p), []).append(p)
+    work = [(task, points, cache_dir, trace) for points in groups.values()]
+    if jobs == 1 or len(work) == 1:
+        chunks = [run_group(w) for w in work]
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            chunks = list(pool.map(run_group, work))
+    return [r for chunk in chunks for r in chunk]
+
+
+def aggregate(results):
+    """Mean error and latency of every decoder setting over the scene/camera variations"""
+    table = {}
+    for p, res in results:
+        key = tuple(sorted((k, v) for k, v in p.items() if k.split(".")[0] not in FRAME_STAGES))
+        table.setdefault(key, []).append(res)
+    rows = []
+    for key, runs in table.items():
+        err = np.array([r["error"] for r in runs], dtype=float)
+        lat = np.array([r["latency_ms"] for r in runs], dtype=float)
+        row = {"params": dict(key), "error": float(err.mean()), "error_max": float(err.max()),
+               "latency_ms": float(lat.mean()), "runs": len(runs), "extra": {}}
+        # Any other numeric result (e.g. goodput_bps) is averaged too
+        for name in sorted(set(k for r in runs for k in r) - {"error", "latency_ms"}):
+            values = [r[name] for r in runs if isinstance(r.get(name), (int, float))]
+            if values:
+                row["extra"][name] = float(np.mean(values))
+        rows.append(row)
+    return rows
+
+
+def pareto_front(rows):
+    """Rows no other row beats on both error and latency, fastest first"""
+    ordered = sorted(rows, key=lambda r: (r["latency_ms"], r["error"]))
+    front = []
+    best = float("inf")
+    for r in ordered:
+        if r["error"] < best:
+            front.append(r)
+            best = r["error"]
+    return front
+
+
+# --- Command line ---
+
+def _parse_value(text):
+    if text in ("None", "none"):
+        return None
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def build_grid(task, sets, grid_file=None):
+    grid = {k: list(v) for k, v in TASKS[task][0].items()}
+    if grid_file:
+        with open(grid_file) as f:
+            grid.update(json.load(f))
+    for item in sets:
+        name, _, values = item.partition("=")
+        if name not in grid:
+            raise SystemExit("unknown parameter {} for task {}".format(name, task))
+        grid[name] = [_parse_value(v) for v in values.split(",")]
+    return grid
+
+
+def _describe(params, varied):
+    return " ".join("{}={}".format(k, params[k]) for k in varied) or "(defaults)"
+
+
+def write_csv(path, results):
+    names = sorted(set(k for p, _ in results for k in p) | set(k for _, r in results for k in r))
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, names)
+        w.writeheader()
+        for p, r in results:
+            row = dict(p)
+            row.update(r)
+            w.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep ledfreq parameters against simulated or replayed frames")
+    parser.add_argument("task", choices=sorted(TASKS))
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=V1,V2",
+                        help="values of one grid parameter (repeatable)")
+    parser.add_argument("--grid", help="JSON file of {parameter: [values]}")
+    parser.add_argument("--trace", help="replay a TraceWriter log instead of rendering scenes (freq only: "
+                        "a trace holds levels, not the bits that fsk and fec score against)")
+    parser.add_argument("--expect", type=float, help="true frequency of a replayed trace")
+    parser.add_argument("--jobs", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="frame cache directory ('' to disable)")
+    parser.add_argument("--out", help="write every grid point to this CSV")
+    parser.add_argument("--list", action="store_true", help="print the task's parameters and defaults")
+    args = parser.parse_args(argv)
+
+    grid = build_grid(args.task, args.set, args.grid)
+    if args.list:
+        for k in sorted(grid):
+            print("{:24} {}".format(k, grid[k]))
+        return
+    if args.trace:
+        if args.task != "freq":
+            raise SystemExit("--trace only works with the freq task")
+        if args.expect is None:
+            raise SystemExit("--expect is needed to score a replayed trace")
+        grid["expect"] = [args.expect]
+    results = run_sweep(args.task, grid, args.jobs, args.cache or None, args.trace)
+    if args.out:
+        write_csv(args.out, results)
+
+    rows = aggregate(results)
+    varied = [k for k in sorted(grid) if len(grid[k]) > 1 and k.split(".")[0] not in FRAME_STAGES]
+    print("{} grid points, {} settings".format(len(results), len(rows)))
+    print("\nPareto front (error vs latency):")
+    print("  latency_ms      error  error_max  setting")
+    for r in pareto_front(rows):
+        extra = " ".join("{}={:.4g}".format(k, v) for k, v in r["extra"].items())
+        print("  {:10.1f} {:10.4f} {:10.4f}  {}{}".format(r["latency_ms"], r["error"], r["error_max"],
+                                                        _describe(r["params"], varied), "  " + extra if extra else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# synth.py
+#
+# Synthetic and replayed cameras for running the ledfreq code on the host.
+#
+# render() turns a Scene of blinking LEDs into frames: frame times (with
+# jitter and drops) and the level of every LED in every frame. A SynthCamera
+# plays frames back through the same snapshot() / get_pixel() / find_blobs()
+# calls the scripts make on the OpenMV Cam, driving ledfreq's ticks from a
+# virtual clock so a 10 s window takes milliseconds:
+#
+#   scene = Scene([LED(160, 160, freq=10)])
+#   cam = SynthCamera(scene, render(scene, 3000, fps=60, jitter_us=800))
+#   m = measure_led_frequency(cam, (160, 160), duration_ms=1000)
+#
+# Frames from a recorded log (ledfreq.record.TraceWriter) replay the same way
+# through replay_trace().
+
+import math
+import time
+
+import numpy as np
+
+from ledfreq import compat
+
+
+class EndOfFrames(Exception):
+    """The camera ran out of rendered frames"""
+
+
+class LED:
+    """One blinking LED.
+
+    With bits, the LED sends them as 10/20 Hz FSK: bit k lasts bit_ms and
+    blinks at freqs[bit]. phase is in cycles, duty the on fraction.
+    """
+
+    def __init__(self, x, y, freq=10.0, phase=0.0, duty=0.5, radius=4, on=230, off=20,
+                 bits=None, bit_ms=100, freqs=(10.0, 20.0)):
+        self.x = x
+        self.y = y
+        self.freq = freq
+        self.phase = phase
+        self.duty = duty
+        self.radius = radius
+        self.on = on
+        self.off = off
+        self.bits = bits
+        self.bit_ms = bit_ms
+        self.freqs = freqs
+
+    def state(self, t_us):
+        """On/off (bool array) at the times in t_us"""
+        t = np.asarray(t_us, dtype=np.float64)
+        if self.bits is None:
+            cycles = t * self.freq / 1e6 + self.phase
+        else:
+            bit_us = self.bit_ms * 1000.0
+            k = np.clip((t // bit_us).astype(np.int64), 0, len(self.bits) - 1)
+            f = np.asarray(self.freqs, dtype=np.float64)[np.asarray(self.bits)[k]]
+            cycles = (t - k * bit_us) * f / 1e6 + self.phase
+        return (cycles % 1.0) < self.duty
+
+
+class Scene:
+    def __init__(self, leds, width=320, height=320, background=10):
+        self.leds = leds
+        self.width = width
+        self.height = height
+        self.background = background
+
+
+class Frames:
+    """Frame times (us) and LED levels (frames x LEDs, uint8)"""
+
+    def __init__(self, times, levels):
+        self.times = times
+        self.levels = levels
+
+    def __len__(self):
+        return len(self.times)
+
+
+def render(scene, duration_ms, fps=60, jitter_us=0.0, drop=0.0, noise=0.0, exposure_us=0.0, seed=0):
+    """Frames for duration_ms of the scene.
+
+    jitter_us is the std of the frame time error, drop the chance that a
+    frame is lost, noise the std of the level in grey levels and exposure_us
+    the integration time (the level is the on fraction during it).
+    """
+    rng = np.random.default_rng(seed)
+    period = 1e6 / fps
+    n = int(duration_ms * 1000 / period) + 1
+    times = np.arange(n) * period + rng.normal(0.0, jitter_us, n) if jitter_us else np.arange(n) * period
+    times = np.sort(np.maximum(times, 0.0))
+    if drop:
+        times = times[rng.random(n) >= drop]
+    levels = np.empty((len(times), len(scene.leds)))
+    sub = np.linspace(-exposure_us, 0.0, 5) if exposure_us else np.zeros(1)
+    for i, led in enumerate(scene.leds):
+        on = led.state(times[:, None] + sub[None, :]).mean(axis=1)
+        levels[:, i] = led.off + (led.on - led.off) * on
+    if noise:
+        levels += rng.normal(0.0, noise, levels.shape)
+    return Frames(times.astype(np.int64), np.clip(np.rint(levels), 0, 255).astype(np.uint8))
+
+
+# --- Camera ---
+
+class Clock:
+    """Virtual clock for compat.set_clock"""
+
+    def __init__(self, t=0):
+        self.t = t
+
+    def now_us(self):
+        return self.t
+
+    def sleep_us(self, us):
+        self.t += us
+
+
+class Blob:
+    def __init__(self, x, y, pixels, radius):
+        self._x = x
+        self._y = y
+        self._pixels = pixels
+        self._r = radius
+
+    def cx(self):
+        return self._x
+
+    def cy(self):
+        return self._y
+
+    def pixels(self):
+        return self._pixels
+
+    def area(self):
+        return (2 * self._r + 1) ** 2
+
+    def rect(self):
+        return (self._x - self._r, self._y - self._r, 2 * self._r + 1, 2 * self._r + 1)
+
+
+def _profile(led, dx, dy):
+    # Full level inside half the radius, fading to the background at the edge
+    d = math.sqrt(dx * dx + dy * dy)
+    if d > led.radius:
+        return 0.0
+    inner = led.radius * 0.5
+    if d <= inner:
+        return 1.0
+    return (led.radius - d) / (led.radius - inner)
+
+
+class SynthImage:
+    """One frame, answering the image calls the ledfreq code makes"""
+
+    def __init__(self, scene, levels):
+        self.scene = scene
+        self.levels = levels
+
+    def get_pixel(self, x, y):
+        v = self.scene.background
+        for i, led in enumerate(self.scene.leds):
+            dx = x - led.x
+            dy = y - led.y
+            if -led.radius <= dx <= led.radius and -led.radius <= dy <= led.radius:
+                p = _profile(led, dx, dy)
+                if p:
+                    v += (self.levels[i] - self.scene.background) * p
+        return 255 if v > 255 else int(v)
+
+    def find_blobs(self, thresholds, invert=False, pixels_threshold=10, area_threshold=10, merge=True,
+                   roi=None, **kwargs):
+        # Grayscale (lo, hi) or LAB (l_lo, l_hi, ...) bands, L taken as the grey level scaled to 0..100
+        lo, hi = thresholds[0][0], thresholds[0][1]
+        scale = 100.0 / 255 if len(thresholds[0]) == 6 else 1.0
+        blobs = []
+        for led in self.scene.leds:
+            if roi is not None:
+                x, y, w, h = roi
+                if not (x <= led.x < x + w and y <= led.y < y + h):
+                    continue
+            count = 0
+            r = led.radius
+            for dy in range(-r, r + 1):
+                for dx in range(-r, r + 1):
+                    v = self.get_pixel(led.x + dx, led.y + dy) * scale
+                    if (lo <= v <= hi) != invert:
+                        count += 1
+            if count >= pixels_threshold and (2 * r + 1) ** 2 >= area_threshold:
+                blobs.append(Blob(led.x, led.y, count, r))
+        return blobs
+
+    def draw_rectangle(self, *args, **kwargs):
+        pass
+
+    def draw_cross(self, *args, **kwargs):
+        pass
+
+    def draw_circle(self, *args, **kwargs):
+        pass
+
+
+class SynthCamera:
+    """Plays Frames back as a camera; snapshot() waits for the next frame on the virtual clock.
+
+    With realtime (a speed factor, 1.0 = the sensor's own rate) snapshot()
+    also blocks on the wall clock until the frame is due, so code that does
+    real work between frames, e.g. on another thread, meets the same
+    deadlines it would on the camera.
+
+    set_framerate(fps) makes snapshot() return the rendered frame nearest
+    to each slot of a 1/fps schedule, so frames rendered at a high rate can
+    stand in for a sensor whose frame rate the code under test changes.
+    """
+
+    def __init__(self, scene, frames, realtime=None):
+        self.scene = scene
+        self.frames = frames
+        self.clock = Clock(int(frames.times[0]) - 1 if len(frames) else 0)
+        self.count = 0
+        self.realtime = realtime
+        self._wall0 = None
+        self.period_us = None
+        self._due = None
+        compat.set_clock(self.clock)
+
+    def snapshot(self):
+        if self.realtime and self._wall0 is not None:
+            # A late call misses the frames that went by meanwhile, as on the sensor
+            late = int((time.monotonic() - self._wall0) * self.realtime * 1e6)
+            if late > self.clock.t:
+                self.clock.t = late
+        i = int(np.searchsorted(self.frames.times, self.clock.t, side="right"))
+        if self.period_us and self._due is not None:
+            # Next slot of the 1/fps schedule that is still ahead, then the rendered frame nearest to it
+            while self._due <= self.clock.t:
+                self._due += self.period_us
+            j = int(np.searchsorted(self.frames.times, self._due, side="left"))
+            if j > i and (j >= len(self.frames) or
+                          self._due - self.frames.times[j - 1] < self.frames.times[j] - self._due):
+                j -= 1
+            i = max(i, j)
+        if i >= len(self.frames):
+            raise EndOfFrames()
+        self.clock.t = int(self.frames.times[i])
+        if self.period_us:
+            self._due = (self._due if self._due is not None else self.clock.t) + self.period_us
+        self.count += 1
+        if self.realtime:
+            if self._wall0 is None:
+                self._wall0 = time.monotonic() - self.clock.t / 1e6 / self.realtime
+            wait = self._wall0 + self.clock.t / 1e6 / self.realtime - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        return SynthImage(self.scene, self.frames.levels[i].tolist())
+
+    def now_ms(self):
+        return self.clock.t / 1000.0
+
+    # The sensor setup calls scripts make, so a SynthCamera can stand in for the sensor module
+    def reset(self):
+        pass
+
+    def set_pixformat(self, *args):
+        pass
+
+    def set_framesize(self, *args):
+        pass
+
+    def set_framerate(self, fps):
+        self.period_us = 1e6 / fps if fps else None
+        self._due = None
+
+    def set_color_palette(self, *args):
+        pass
+
+    def skip_frames(self, time=0, n=0):
+        self.clock.t += int(time) * 1000
+
+
+def replay_trace(path):
+    """(scene, frames) from a TraceWriter log: one radius-1 LED per logged center"""
+    from .analyze import load_trace
+
+    trace = load_trace(path)
+    leds = [LED(c[0], c[1], freq=None, radius=1) if c is not None else LED(160, 160, freq=None, radius=1)
+            for c in trace.centers]
+    return Scene(leds), Frames(trace.times.astype(np.int64), np.asarray(trace.values))
@@ -1,111 +1,108 @@
-import sensor
 import time
-try:
-    import pyb
-except ImportError:
-    pyb = None  # or handle accordingly if running off hardware
-
-import image
-# from agent import Agent
-# Sensor setup
-sensor.reset()
-sensor.set_pixformat(sensor.GRAYSCALE)
-sensor.set_framesize(sensor.B320X320)
-# sensor.set_color_palette(image.PALETTE_EVT_DARK)
-sensor.set_framerate(60)
-sensor.skip_frames(time=2000)
-
-# UART setup
-if pyb is not None:
-    uart = pyb.UART(3, 19200)
-else:
-    uart = None
-class agent:
-    def __init__(self,id,freq,timeperiod,stepsize,flag,neighbors):
-        self.freq=freq
-        self.timeperiod=timeperiod
-        self.stepsize=stepsize
-        self.flag=flag
-        self.neighbors=neighbors
-        self.id=id
-
-    def update(self):
-        frequencies=[]
-        for a in self.neighbors:
-            frequencies.append(self.measure_led_frequency(a))
-        rate=sum(frequencies)-(len(frequencies)*self.freq)
-        self.freq+=self.stepsize*rate
-        return self.freq
-
-    def measure_led_frequency(self,led_center, duration_ms=1000):
-        px, py = led_center
-        transition_times = []
-        prev_val = 0
-        prev_polarity = 0
-        last_transition_time = 0
-
-        # Estimate threshold from initial samples
-        threshold_samples = []
-        for _ in range(10):
-            img = sensor.snapshot()
-            val = img.get_pixel(px, py)
-            if isinstance(val, tuple):
-                val = val[0]
-            threshold_samples.append(val)
-        if threshold_samples:
-            min_val = min(threshold_samples)
-            max_val = max(threshold_samples)
-            if isinstance(min_val, tuple):
-                min_val = min_val[0]
-            if isinstance(max_val, tuple):
-                max_val = max_val[0]
-            threshold = (max_val + min_val) / 2.0
-        else:
-            threshold = 127
-
-        img = sensor.snapshot()
-        prev_val = img.get_pixel(px, py)
-        if isinstance(prev_val, tuple):
-            prev_val = prev_val[0]
-        prev_polarity = 1 if prev_val > threshold else -1
-        start = time.ticks_ms()
-
-        while time.ticks_diff(time.ticks_ms(), start) < duration_ms:
-            img = sensor.snapshot()
-            now = time.ticks_ms()
-            val = img.get_pixel(px, py)
-            if isinstance(val, tuple):
-                val = val[0]
-            polarity = 1 if val > threshold else -1
-            if polarity != prev_polarity:
-                if last_transition_time == 0 or (now - last_transition_time) > 5:
-                    transition_times.append(now)
-                    last_transition_time = now
-            prev_polarity = polarity
-
-        cycles = len(transition_times) // 2
-        freq_hz = cycles / (duration_ms / 1000.0)
-        # print(f"Transitions: {len(transition_times)} detected at {led_center}")
-        # print(f"Frequency detected: {freq_hz:.2f}")
-        return freq_hz
-
 
+from ledfreq import camera, checkpoint, profiler, spectral
+from ledfreq.alias import MultiRateMeasure
+from ledfreq.bounded import BoundedMeasure
+from ledfreq.framerate import FrameRateController
+from ledfreq.agent import Agent
+from ledfreq.neighbors import Neighborhood
+from ledfreq.report import open_uart, send_frequency, send_phase, telemetry_line
+
+# Set to True to record per-stage timings and print a summary after each update
+PROFILE = False
+prof = profiler.prof
+prof.enabled = PROFILE
+
+# Save the agents' frequencies and flags (and the discovered neighbours) to
+# flash every CHECKPOINT_EVERY_S and pick them up again after a reset, so a
+# restart continues the consensus instead of starting it over. A checkpoint
+# older than a few save periods is from an earlier run and is ignored
+CHECKPOINT = False
+CHECKPOINT_PATH = "state.json"
+CHECKPOINT_EVERY_S = 30
+saved = checkpoint.load(CHECKPOINT_PATH, max_age_s=4 * CHECKPOINT_EVERY_S) if CHECKPOINT else None
+
+# Sensor setup (a short settle when resuming: the LEDs are already known)
+FRAMERATE = 60
+sensor = camera.setup(framerate=FRAMERATE, skip_ms=200 if saved else 2000)
+# sensor = camera.setup(framerate=FRAMERATE, palette=image.PALETTE_EVT_DARK)
+
+# Neighbours a few pixels apart bleed into each other's pixels; measure them
+# together from one ROI and separate them by frequency
+SEPARATE_CLOSE_LEDS = False
+measure = spectral.measure_led_frequencies if SEPARATE_CLOSE_LEDS else None
+
+# Measure into buffers allocated once (ledfreq/bounded.py), so the heap
+# stays flat for any run length and the GC never runs mid-window. Fixed
+# NEIGHBORS only (not with DISCOVER_NEIGHBORS), in place of
+# SEPARATE_CLOSE_LEDS, WIDE_BAND and ADAPTIVE_FRAMERATE
+BOUNDED = False
+NEIGHBORS = [(87,154),(88,164)]
+if BOUNDED:
+    measure = BoundedMeasure(len(NEIGHBORS))
+
+# Split each window between two frame rates and resolve aliasing, so
+# neighbours up to 52 Hz (instead of 30 Hz) are measured correctly; LEDs
+# that still fit several frequencies are reported with confidence 0
+WIDE_BAND = False
+if WIDE_BAND and not BOUNDED:
+    measure = MultiRateMeasure(rates=(FRAMERATE, 45), measure=measure)
+
+# Run the sensor at the lowest frame rate that still measures the
+# neighbours and the agent's own frequency to 0.25 Hz in one window,
+# instead of FRAMERATE all the time (not with WIDE_BAND, which sets its own)
+ADAPTIVE_FRAMERATE = False
+if ADAPTIVE_FRAMERATE and not WIDE_BAND and not BOUNDED:
+    measure = FrameRateController(measure, tolerance_hz=0.25, window_ms=1000)
+
+# Neighbour fusion: "sum" is the plain consensus sum; "huber", "median" or
+# "trimmed" weight each reading by its confidence and limit outliers such as
+# a missed LED (0 Hz) or a harmonic double
+FUSION = "sum"
+ADAPTIVE_STEP = False
+# Kuramoto phase coupling (0 = frequency consensus only). The agent sends the
+# delay to its next rising edge after every update so the driver's LED
+# follows the agent's phase model
+PHASE_COUPLING = 0.0
+# Print per-round convergence metrics
+REPORT_CONVERGENCE = False
+# Print one telemetry line per round over USB for the host fusion service
+# (python -m ledhost.fusion --serial <port>)
+TELEMETRY = False
+CAMERA_ID = 3
+# Find the neighbours in every round instead of using the fixed pixels
+# below: the NEIGHBOR_COUNT LEDs nearest the middle of the image, tracked
+# as they move
+DISCOVER_NEIGHBORS = False
+NEIGHBOR_COUNT = 2
 
+# UART setup
+uart = open_uart(3, 19200)
 
 # Initialize agents
-# agentA = Agent(1,4,12,0.2,0,[(194,139),(226,152)])
-# agentB = Agent(2,10,12,0.2,8,[(226,152),(193,147)])
-agentC =  agent(3,22,12,1,4,[(87,154),(88,164)]) # agent(3, frequency, timeperiod, stepsize, flag, neighbors)
+# agentA = Agent(1,4,12,0.2,0,[(194,139),(226,152)], cam=sensor, measure=measure)
+# agentB = Agent(2,10,12,0.2,8,[(226,152),(193,147)], cam=sensor, measure=measure)
+discovery = None
+if DISCOVER_NEIGHBORS and not BOUNDED:
+    discovery = Neighborhood(origin=(160, 160), k=NEIGHBOR_COUNT)
+agentC = Agent(3,22,12,1,4,NEIGHBORS, cam=sensor, duration_ms=1000, measure=measure,
+               fusion=FUSION, adaptive=ADAPTIVE_STEP, phase_coupling=PHASE_COUPLING,
+               discovery=discovery) # Agent(3, frequency, timeperiod, stepsize, flag, neighbors)
 
 agent_list = [agentC]
 
-# Define agent locations (dummy coordinates for now)
-# You should replace this with actual dynamic tracking
-# agent_locations = {
-#     0: [(20, 30), (40, 50)],  # Locations visible to agentA (e.g., B and C)
-#     1: [(60, 70), (20, 30)],  # Locations visible to agentB (e.g., C and A)
-#     2: [(40, 50), (60, 70)]   # Locations visible to agentC (e.g., A and B)
-# }
+ckpt = checkpoint.Checkpoint(CHECKPOINT_PATH, CHECKPOINT_EVERY_S)
+if saved:
+    for agent in agent_list:
+        for state in saved.get("agents", []):
+            if agent.restore(state):
+                print("Resumed agent", agent.id, "at", agent.freq, "Hz")
+                # The driver may have been reset too
+                send_frequency(uart, agent.freq, verbose=False)
+    if discovery is not None and saved.get("neighbors"):
+        agentC.neighbors = discovery.restore(saved["neighbors"])
+
+# Agent locations come from DISCOVER_NEIGHBORS (ledfreq/neighbors.py)
 
 
 
@@ -128,12 +125,20 @@ while True:
         for idx, agent in enumerate(agent_list):
             if agent.flag >= agent.timeperiod:
                 agent.flag = 0
+                if isinstance(agent.measure, FrameRateController):
+                    agent.measure.expected = [agent.freq]
                 freq=agent.update()
                 # Send frequency via UART
-                msg = f"{freq:.2f}\n"
-                if uart is not None:
-                    uart.write(msg)
-                    # print("Sent frequency:", msg.strip())
-                else:
-                    pass
-                # print("UART not available, frequency:", msg.strip())
\ No newline at end of file
+                send_frequency(uart, freq, verbose=False)
+                if PHASE_COUPLING > 0:
+                    send_phase(uart, agent.sync_delay_ms(), verbose=False)
+                if REPORT_CONVERGENCE:
+                    print(agent.metrics_line())
+                if TELEMETRY:
+                    print(telemetry_line(CAMERA_ID, agent.last))
+                if PROFILE:
+                    prof.dump()
+                    prof.reset()
+                if CHECKPOINT:
+                    ckpt.save(agents=[a.state() for a in agent_list],
+                              neighbors=discovery.state() if discovery is not None else None)
@@ -0,0 +1,63 @@
+import random
+
+from ledhost.synth import LED, Scene, SynthCamera, render
+from ledfreq import compat, fec
+from ledfreq.fsk import PartialFrame, measure_led_bit_soft, wait_for_frequency_sync
+
+CENTER = (160, 160)
+IDLE_BITS = 3
+SAMPLE_MS = 200
+
+
+def _receive(cam, frame, stop_after=None):
+    # The FEC loop of ASCII_NewC, with the virtual clock as the wall clock
+    while not frame.complete() and len(frame.bits) != stop_after:
+        wait = frame.next_ms() - cam.clock.t // 1000
+        if wait > 0:
+            compat.sleep_ms(wait)
+        frame.add(*measure_led_bit_soft(cam, CENTER, duration_ms=100))
+
+
+def _resume_after_restart(seed, restart_after=5, down_slots=3):
+    rng = random.Random(seed)
+    sent = fec.encode_frame(rng.randrange(256))
+    # The transmitter idles on the other tone, so the sync fires at the start of slot 0
+    scene = Scene([LED(CENTER[0], CENTER[1], bits=[1 - sent[0]] * IDLE_BITS + sent + [1] * 4, bit_ms=1000)])
+    cam = SynthCamera(scene, render(scene, (IDLE_BITS + len(sent) + 4) * 1000, 60, 500, 0.0, 1.0, seed))
+    cam.clock.t = rng.randrange(0, 800000)
+
+    wait_for_frequency_sync(cam, CENTER)
+    frame = PartialFrame(fec.frame_length(), start_ms=cam.clock.t // 1000, sample_ms=SAMPLE_MS)
+    _receive(cam, frame, stop_after=restart_after)
+    state = frame.state()
+
+    # Down for a few slots, then the script starts over: sync, restore, catch up
+    cam.clock.t += down_slots * 1000000
+    wait_for_frequency_sync(cam, CENTER)
+    frame = PartialFrame(fec.frame_length(), start_ms=cam.clock.t // 1000, sample_ms=SAMPLE_MS)
+    assert frame.restore(state)
+    missed = frame.catch_up(cam.clock.t // 1000)
+    _receive(cam, frame)
+    return sent, frame, missed
+
+
+def test_resumed_frame_keeps_bits_in_their_slots():
+    for seed in range(20):
+        sent, frame, missed = _resume_after_restart(seed)
+        assert missed >= 3, seed
+        # A bit in the wrong slot reads the neighbour's tone with full confidence;
+        # misreads of the right slot stay near the decision boundary
+        for k in range(len(sent)):
+            if frame.reliabilities[k] > 0.5:
+                assert frame.bits[k] == sent[k], (seed, k)
+
+
+def test_catch_up_counts_passed_sampling_times():
+    frame = PartialFrame(12, start_ms=10000, sample_ms=300)
+    frame.add(1)
+    assert frame.catch_up(10000 + 1200) == 0
+    assert frame.catch_up(10000 + 1300) == 1
+    assert frame.catch_up(10000 + 4100) == 2
+    assert len(frame.bits) == 4
+    assert frame.next_ms() == 10000 + 4300
+    assert frame.catch_up(10000 + 60000) == 8
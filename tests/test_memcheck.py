@@ -0,0 +1,16 @@
+from ledfreq import compat, memcheck
+
+
+def test_bounded_loops_allocate_nothing_per_frame():
+    assert memcheck.run(verbose=False)
+
+
+def test_static_camera_puts_the_clock_back():
+    before = compat.get_clock()
+    with memcheck.StaticCamera() as cam:
+        assert compat.get_clock() is cam
+        cam.snapshot()
+        assert compat.ticks_us() == cam.period_us
+    assert compat.get_clock() is before
+    memcheck.run(verbose=False)
+    assert compat.get_clock() is before
@@ -0,0 +1,13 @@
+from ledhost.synth import LED, Scene, SynthCamera, render
+from ledfreq import roi
+
+
+def test_footprint_of_a_center_outside_the_frame():
+    scene = Scene([LED(318, 160, freq=7.0)])
+    cam = SynthCamera(scene, render(scene, 2000, 60))
+    # Nothing blinks in reach: the nearest pixel in the frame
+    fp = roi.footprint(cam, (400, -20), radius=2)
+    assert fp.pixels == [(319, 0)]
+    # The LED is in reach once the window is clipped around the clamped center
+    fp = roi.footprint(cam, (330, 160), radius=2)
+    assert abs(fp.centroid[0] - 318) < 1 and abs(fp.centroid[1] - 160) < 1
@@ -0,0 +1,21 @@
+from ledhost.synth import LED, Scene, SynthCamera, render
+from ledfreq import spectral
+
+
+def _camera(leds, seed=1):
+    scene = Scene(leds)
+    return SynthCamera(scene, render(scene, 1500, 60, 2000, 0.0, 4.0, seed))
+
+
+def test_close_leds_are_told_apart():
+    cam = _camera([LED(158, 160, freq=7.0), LED(162, 160, freq=11.0)])
+    a, b = spectral.measure_led_frequencies(cam, [(158, 160), (162, 160)], 1000)
+    assert abs(a.freq - 7.0) < 0.25 and abs(b.freq - 11.0) < 0.25
+    assert a.confidence > 0.5 and b.confidence > 0.5
+
+
+def test_a_source_goes_to_one_center_only():
+    cam = _camera([LED(160, 160, freq=7.0)])
+    near, far = spectral.measure_led_frequencies(cam, [(159, 160), (163, 160)], 1000)
+    assert abs(near.freq - 7.0) < 0.25 and near.confidence > 0.5
+    assert far.freq == 0.0 and far.confidence == 0.0